@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+from machine.analysis import Analysis, summary
+from machine.image import read_image
+from simulation import load_symbols
+
+
+def main(code_file: str, symbols_file: str = None, target: str = None, limit=None):
+    image = read_image(code_file)
+    analysis = Analysis(image, load_symbols(code_file, symbols_file))
+    report = analysis.report()
+    for line in summary(report):
+        print(line)
+    if target is not None:
+        with open(target, "w") as f:
+            json.dump(report, f, indent=2)
+    if limit is None:
+        return True
+    # лимит заведомо мал - запуск не нужен
+    if analysis.exceeds(limit):
+        low = report["ticks"][0]
+        print(
+            "rejected: " + ("never halts" if low is None else f"at least {low} ticks")
+        )
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Статическая оценка тактов программы по образу"
+    )
+    parser.add_argument("code_file", help="Образ программы")
+    parser.add_argument(
+        "--symbols",
+        help="Таблица символов транслятора (по умолчанию из образа или <code_file>.sym)",
+    )
+    parser.add_argument("-o", "--output", help="Файл JSON с отчётом")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Лимит тиков: код возврата 1, если программа заведомо не уложится",
+    )
+    args = parser.parse_args()
+
+    if not main(args.code_file, args.symbols, args.output, args.limit):
+        sys.exit(1)
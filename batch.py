@@ -0,0 +1,221 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import translator
+from lisp.image_cache import CACHE_SIZE, IMAGE_SUFFIX, ImageCache
+from machine.analysis import Analysis
+from machine.control_unit import predecode
+from machine.devices import InputDevice
+from machine.image import read_image, write_image
+from simulation import simulation
+
+STACK_SIZE = 10
+LIMIT = 100000
+
+# образы, загруженные процессом-исполнителем:
+# файл -> (start, code, bss_size, decoded)
+_images = {}
+
+
+def init_worker():
+    # журнал отдельных запусков не нужен, результат возвращается в JSON
+    logging.getLogger().setLevel(logging.ERROR)
+
+
+# образ загружается и предекодируется один раз на процесс,
+# каждому запуску достаются свои копии памяти и предекодирования
+def load_image(code_file: str) -> tuple:
+    if code_file not in _images:
+        image = read_image(code_file)
+        code = image.memory()
+        _images[code_file] = (image.start, code, image.bss_size, predecode(code))
+    return _images[code_file]
+
+
+# нижняя оценка тактов образа (статический анализ), одна на процесс
+_bounds = {}
+
+
+def lower_bound(code_file: str):
+    if code_file not in _bounds:
+        _bounds[code_file] = Analysis(read_image(code_file)).bounds()[0]
+    return _bounds[code_file]
+
+
+# Запуски с исходником ("source") транслируются до раздачи процессам,
+# образы берутся из кеша трансляции: неизменённые программы не
+# транслируются повторно. Образы копируются в каталог directory: кеш может
+# вытеснить их до запуска. Ошибка трансляции - ошибка запуска
+def build_sources(jobs: list, cache: ImageCache, directory: str):
+    for job in jobs:
+        if "code" in job or "source" not in job:
+            continue
+        try:
+            with open(job["source"], "r") as f:
+                text = f.read()
+            key = translator.translation_key(text, job.get("optimize", False))
+            target = os.path.join(directory, key + IMAGE_SUFFIX)
+            if not os.path.exists(target):
+                image, _ = translator.translate_cached(
+                    text, cache, job.get("optimize", False)
+                )
+                write_image(target, image)
+        except Exception as e:
+            job["error"] = f"{type(e).__name__}: {e}"
+            job["code"] = None
+            continue
+        job["code"] = target
+
+
+def run_job(job: dict) -> dict:
+    result = {"id": job.get("id"), "code": job.get("code"), "input": job.get("input")}
+    if "error" in job:
+        result.update(exit="error", error=job["error"])
+        return result
+    try:
+        # заведомо не укладывающиеся в лимит запуски не исполняются
+        low = lower_bound(job["code"]) if job.get("reject") else 0
+        if low > job.get("limit", LIMIT):
+            result.update(exit="rejected", min_ticks=None if math.isinf(low) else low)
+            return result
+        start, code, bss_size, decoded = load_image(job["code"])
+        if job.get("input") is None:
+            input_device = InputDevice([])
+        else:
+            input_device = InputDevice.from_file(job["input"])
+        output, instructions, ticks, reason = simulation(
+            code[:],
+            start,
+            job.get("stack_size", STACK_SIZE),
+            input_device,
+            0,
+            job.get("limit", LIMIT),
+            job.get("blocks", False),
+            decoded=list(decoded),
+            bss_size=bss_size,
+        )
+    except Exception as e:
+        result.update(exit="error", error=f"{type(e).__name__}: {e}")
+        return result
+    result.update(output=output, instructions=instructions, ticks=ticks, exit=reason)
+    return result
+
+
+def parse_job(line: str, defaults: dict) -> dict:
+    fields = json.loads(line)
+    if not isinstance(fields, dict):
+        raise ValueError("Manifest line is not a JSON object")
+    if "code" not in fields and "source" not in fields:
+        raise ValueError("Job has neither code nor source")
+    return dict(defaults, **fields)
+
+
+# манифест - строки JSON: {"code": образ, "input": файл ввода, ...}
+# или {"source": программа, ...}, необязательные поля: id, limit,
+# stack_size, blocks, reject, optimize (для source)
+def read_manifest(manifest_file: str, defaults: dict) -> list:
+    jobs = []
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # ошибочная строка - ошибка своего запуска, остальные исполняются
+            try:
+                job = parse_job(line, defaults)
+            except ValueError as e:
+                job = {"code": None, "error": f"{type(e).__name__}: {e}"}
+            job.setdefault("id", len(jobs))
+            jobs.append(job)
+    return jobs
+
+
+def main(
+    manifest_file: str,
+    target,
+    workers: int = None,
+    chunk_size: int = 16,
+    defaults: dict = None,
+    cache_dir: str = None,
+    cache_size: int = CACHE_SIZE,
+):
+    jobs = read_manifest(manifest_file, defaults or {})
+    # без заданного каталога кеш живёт только на время запуска
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache = ImageCache(cache_dir or os.path.join(tmpdirname, "cache"), cache_size)
+        build_sources(jobs, cache, tmpdirname)
+        run_jobs(jobs, target, workers, chunk_size)
+
+
+def run_jobs(jobs: list, target, workers: int, chunk_size: int):
+    with ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+        # результаты пишутся в порядке манифеста по мере готовности
+        for result in executor.map(run_job, jobs, chunksize=chunk_size):
+            target.write(json.dumps(result, ensure_ascii=False) + "\n")
+            target.flush()
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Пакетная симуляция процессора")
+    parser.add_argument("manifest_file", help="Манифест запусков (строки JSON)")
+    parser.add_argument(
+        "-o", "--output", help="Файл результатов (по умолчанию стандартный вывод)"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Количество процессов (по умолчанию число ядер)",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=16,
+        help="Запусков на одну передачу процессу (по умолчанию 16)",
+    )
+    parser.add_argument(
+        "--stack_size", type=int, default=STACK_SIZE, help="Размер стека по умолчанию"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=LIMIT, help="Лимит тиков по умолчанию"
+    )
+    parser.add_argument(
+        "--blocks",
+        action="store_true",
+        help="Исполнять скомпилированными базовыми блоками",
+    )
+    parser.add_argument(
+        "--reject",
+        action="store_true",
+        help="Не запускать программы, по статической оценке не укладывающиеся в лимит",
+    )
+    parser.add_argument("--cache", help="Каталог кеша трансляции для запусков с source")
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"Размер кеша трансляции в байтах (по умолчанию {CACHE_SIZE})",
+    )
+    args = parser.parse_args()
+
+    defaults = {
+        "stack_size": args.stack_size,
+        "limit": args.limit,
+        "blocks": args.blocks,
+        "reject": args.reject,
+    }
+    options = (args.jobs, args.chunk_size, defaults, args.cache, args.cache_size)
+    if args.output is None:
+        main(args.manifest_file, sys.stdout, *options)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            main(args.manifest_file, f, *options)
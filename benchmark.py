@@ -0,0 +1,331 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import translator
+from machine.devices import InputDevice, OutputDevice
+from machine.image import Image, read_image, write_image
+from simulation import simulation
+
+STACK_SIZE = 64
+LIMIT = 10**10
+# отклонение от базовой линии, после которого замер считается регрессией
+THRESHOLD = 0.2
+BASELINE_FILE = "benchmark_baseline.json"
+
+# метрики, где больше - лучше, и где меньше - лучше
+HIGHER = ("lines_per_sec", "instructions_per_sec", "ticks_per_sec", "speedup")
+LOWER = ("load_seconds", "peak_rss_kib")
+# отношения замеров одного прогона: от машины почти не зависят
+RELATIVE = ("speedup",)
+
+ENGINES = {"interp": False, "blocks": True}
+
+# короткие замеры повторяются, пока не наберётся столько секунд
+MIN_SECONDS = 0.05
+
+CODE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_files")
+
+
+def read_program(name: str) -> str:
+    with open(os.path.join(CODE_FILES, name + ".lisp"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# prob1 с другой верхней границей суммирования
+def prob1_source(bound: int) -> str:
+    return read_program("prob1").replace("(alloc_num i 1000)", f"(alloc_num i {bound})")
+
+
+# copies независимых гнёзд из depth вложенных while по count итераций,
+# в самом внутреннем - if
+def nested_source(depth: int, count: int, copies: int) -> str:
+    lines = []
+    for copy in range(copies):
+        names = [f"c{copy}_{level}" for level in range(depth)]
+        acc = f"acc{copy}"
+        lines.append(f"(alloc_num {acc} 0)")
+        lines.extend(f"(alloc_num {name} 0)" for name in names)
+        for level, name in enumerate(names):
+            indent = "    " * level
+            lines.append(f"{indent}(set {name} {count})")
+            lines.append(f"{indent}(while (get_val {name}) do")
+        indent = "    " * depth
+        lines.append(f"{indent}(if (= (% (get_val {names[-1]}) 2) 0) then")
+        lines.append(f"{indent}    (set {acc} (+ (get_val {acc}) 2))")
+        lines.append(f"{indent}else")
+        lines.append(f"{indent}    (set {acc} (+ (get_val {acc}) 1))")
+        lines.append(f"{indent})")
+        for level, name in reversed(list(enumerate(names))):
+            indent = "    " * (level + 1)
+            lines.append(f"{indent}(set {name} (- (get_val {name}) 1))")
+            lines.append(f"{indent[4:]})")
+        lines.append(f"(output (+ 48 (% (get_val {acc}) 10)))")
+    return "\n".join(lines) + "\n"
+
+
+# нагрузки: имя -> (исходник, ввод), размеры умножаются на scale
+def workloads(scale: float) -> dict:
+    cat_size = max(1, int(2**20 * scale))
+    text = "The quick brown fox jumps over the lazy dog.\n"
+    cat_input = (text * (cat_size // len(text) + 1))[:cat_size]
+    return {
+        "hello": (read_program("hello"), ""),
+        "hello_user": (read_program("hello_user"), "bla-bla\n"),
+        "cat": (read_program("cat"), "bla-bla\n"),
+        "prob1": (read_program("prob1"), ""),
+        "prob1_large": (prob1_source(max(1, int(100000 * scale))), ""),
+        "cat_large": (read_program("cat"), cat_input),
+        "cat_dma_large": (read_program("cat_dma"), cat_input),
+        "nested": (nested_source(6, 3, max(1, int(100 * scale))), ""),
+    }
+
+
+# лучшее из repeat время одного вызова и его результат
+def best_time(func, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        calls = 0
+        begin = time.perf_counter()
+        while True:
+            result = func()
+            calls += 1
+            elapsed = time.perf_counter() - begin
+            if elapsed >= MIN_SECONDS:
+                break
+        best = min(best, elapsed / calls)
+    return best, result
+
+
+# вывод не накапливается: у cat_large он размером с ввод
+def simulate(image: Image, chars: list, block_engine: bool) -> tuple:
+    with open(os.devnull, "w") as sink:
+        return simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            InputDevice(chars),
+            0,
+            LIMIT,
+            block_engine,
+            output_device=OutputDevice(sink, keep=False),
+            bss_size=image.bss_size,
+        )
+
+
+# замер одной нагрузки, выполняется в отдельном процессе ради пика памяти
+def measure(source: str, input_text: str, repeat: int, optimize: bool) -> dict:
+    logging.getLogger().setLevel(logging.ERROR)
+    lines = len(source.split("\n"))
+
+    best, (image, _) = best_time(lambda: translator.translate(source, optimize), repeat)
+    result = {
+        "lines": lines,
+        "translate_seconds": best,
+        "lines_per_sec": lines / best,
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        target = os.path.join(tmpdirname, "image.o")
+        write_image(target, image)
+        result["image_bytes"] = os.path.getsize(target)
+        result["load_seconds"], image = best_time(lambda: read_image(target), repeat)
+
+    chars = [ord(char) for char in input_text] + [0]
+    result["engines"] = {}
+    for engine, block_engine in ENGINES.items():
+        best, (_, instructions, ticks, reason) = best_time(
+            functools.partial(simulate, image, chars, block_engine), repeat
+        )
+        assert reason == "halt", f"Simulation stopped by {reason}"
+        result["engines"][engine] = {
+            "instructions": instructions,
+            "ticks": ticks,
+            "seconds": best,
+            "instructions_per_sec": instructions / best,
+            "ticks_per_sec": ticks / best,
+        }
+
+    # во сколько раз блочный режим быстрее интерпретатора
+    engines = result["engines"]
+    result["speedup"] = engines["interp"]["seconds"] / engines["blocks"]["seconds"]
+
+    # ru_maxrss в Linux - в КиБ
+    result["peak_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run(
+    names: list = None,
+    scale: float = 1.0,
+    repeat: int = 5,
+    optimize: bool = False,
+) -> dict:
+    loads = workloads(scale)
+    results = {}
+    for name in names or loads:
+        source, input_text = loads[name]
+        # свежий процесс на нагрузку: пик памяти не накапливается между ними
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[name] = executor.submit(
+                measure, source, input_text, repeat, optimize
+            ).result()
+        logging.info(f"{name}: {summary(results[name])}")
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "optimize": optimize,
+        "workloads": results,
+    }
+
+
+def summary(result: dict) -> str:
+    engines = " ".join(
+        f"{engine} {stats['instructions_per_sec'] / 1e6:.2f} MIPS"
+        for engine, stats in result["engines"].items()
+    )
+    return (
+        f"{result['lines_per_sec']:.0f} lines/s, {engines}, "
+        f"blocks x{result['speedup']:.2f}, "
+        f"load {result['load_seconds'] * 1e3:.3f} ms, "
+        f"peak {result['peak_rss_kib']} KiB"
+    )
+
+
+# метрики нагрузки плоским словарём: "blocks.ticks_per_sec" -> значение
+def flatten(result: dict) -> dict:
+    metrics = {key: value for key, value in result.items() if key != "engines"}
+    for engine, stats in result.get("engines", {}).items():
+        for key, value in stats.items():
+            metrics[f"{engine}.{key}"] = value
+    return metrics
+
+
+# регрессии относительно базовой линии: строки "нагрузка метрика: было -> стало";
+# relative - только отношения, базовая линия может быть с другой машины
+def compare(
+    results: dict, baseline: dict, threshold: float = THRESHOLD, relative: bool = False
+) -> list:
+    assert results["scale"] == baseline["scale"], "Baseline has another scale"
+    assert results["optimize"] == baseline["optimize"], "Baseline has another -O"
+    regressions = []
+    for name, result in results["workloads"].items():
+        if name not in baseline["workloads"]:
+            continue
+        old = flatten(baseline["workloads"][name])
+        for key, value in flatten(result).items():
+            if key not in old:
+                continue
+            metric = key.rsplit(".", 1)[-1]
+            if relative and metric not in RELATIVE:
+                continue
+            if metric in HIGHER:
+                worse = value < old[key] * (1 - threshold)
+            elif metric in LOWER:
+                worse = value > old[key] * (1 + threshold)
+            else:
+                continue
+            if worse:
+                regressions.append(f"{name} {key}: {old[key]:.6g} -> {value:.6g}")
+    return regressions
+
+
+def main(
+    target: str = None,
+    baseline_file: str = BASELINE_FILE,
+    update_baseline: bool = False,
+    threshold: float = THRESHOLD,
+    names: list = None,
+    scale: float = 1.0,
+    repeat: int = 5,
+    optimize: bool = False,
+    relative: bool = False,
+) -> int:
+    results = run(names, scale, repeat, optimize)
+
+    if target is not None:
+        with open(target, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if update_baseline:
+        with open(baseline_file, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"baseline saved: {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        logging.info(f"no baseline: {baseline_file}")
+        return 0
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, threshold, relative)
+    for line in regressions:
+        logging.error(f"regression: {line}")
+    if not regressions:
+        logging.info("no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description="Замеры скорости транслятора и модели")
+    parser.add_argument("--output", help="Файл JSON с результатами замеров")
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_FILE,
+        help=f"Базовая линия для сравнения (по умолчанию {BASELINE_FILE})",
+    )
+    parser.add_argument(
+        "--update_baseline",
+        action="store_true",
+        help="Записать результаты как новую базовую линию",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help=f"Допустимое ухудшение относительно базовой линии (по умолчанию {THRESHOLD})",
+    )
+    parser.add_argument(
+        "--only", help="Нагрузки через запятую (по умолчанию все)", default=None
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Множитель размеров синтетических нагрузок",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Повторов замера, берётся лучший"
+    )
+    parser.add_argument(
+        "-O", action="store_true", help="Замерять оптимизированные образы"
+    )
+    parser.add_argument(
+        "--relative",
+        action="store_true",
+        help="Сравнивать только ускорение blocks относительно interp",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        main(
+            args.output,
+            args.baseline,
+            args.update_baseline,
+            args.threshold,
+            args.only.split(",") if args.only else None,
+            args.scale,
+            args.repeat,
+            args.O,
+            args.relative,
+        )
+    )
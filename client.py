@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import base64
+import json
+import sys
+
+from lisp.inliner import INLINE_BUDGET
+from machine.image import unpack_image, write_image
+from machine.isa import BITS
+from server import HOST, MESSAGE_LIMIT, PORT
+
+
+async def connect(socket_path: str = None, host: str = HOST, port: int = PORT):
+    if socket_path is not None:
+        return await asyncio.open_unix_connection(socket_path, limit=MESSAGE_LIMIT)
+    return await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT)
+
+
+# ответы сервера на запрос: у simulate - порции вывода, затем результат;
+# ошибка сервера - исключение
+async def request(reader, writer, message: dict):
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    await writer.drain()
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        response = json.loads(line)
+        if response["type"] == "error":
+            raise RuntimeError(response["error"])
+        yield response
+        if response["type"] != "output":
+            return
+
+
+async def call(address: tuple, message: dict, on_output=None) -> dict:
+    reader, writer = await connect(*address)
+    try:
+        async for response in request(reader, writer, message):
+            if response["type"] == "output":
+                if on_output is not None:
+                    on_output(response["text"])
+            else:
+                return response
+    finally:
+        writer.close()
+
+
+def translate(
+    address: tuple,
+    source: str,
+    target: str,
+    optimize: bool = False,
+    inline_size: int = 0,
+    inline_budget: int = INLINE_BUDGET,
+    strip: bool = False,
+):
+    with open(source, "r") as f:
+        text = f.read()
+    message = {
+        "op": "translate",
+        "source": text,
+        "optimize": optimize,
+        "inline": inline_size,
+        "inline_budget": inline_budget,
+    }
+    response = asyncio.run(call(address, message))
+    image = unpack_image(base64.b64decode(response["image"]))
+
+    with open(target + ".mnem", "w") as f:
+        for line in response["mnemonics"]:
+            f.write(line + "\n")
+    if strip:
+        with open(target + ".sym", "w") as f:
+            json.dump(image.symbols, f, indent=2)
+        image.symbols = None
+    write_image(target, image)
+    words = len(image.words())
+    print(
+        "LoC:",
+        len(text.split("\n")),
+        "Instr:",
+        words,
+        "Code bytes:",
+        words * BITS // 8,
+    )
+
+
+# вывод пишется в stdout по мере получения; исходник (.lisp или --source)
+# транслирует сервер, образ передаётся ему целиком
+def simulate(
+    address: tuple,
+    code_file: str,
+    input_file: str = None,
+    stack_size: int = None,
+    limit: int = None,
+    block_engine: bool = False,
+    source: bool = False,
+    optimize: bool = False,
+    reject: bool = None,
+):
+    message = {"op": "simulate", "blocks": block_engine, "optimize": optimize}
+    if reject is not None:
+        message["reject"] = reject
+    if source or code_file.endswith(".lisp"):
+        with open(code_file, "r") as f:
+            message["source"] = f.read()
+    else:
+        with open(code_file, "rb") as f:
+            message["image"] = base64.b64encode(f.read()).decode("ascii")
+    if input_file == "-":
+        message["input"] = sys.stdin.read()
+    elif input_file is not None:
+        with open(input_file, "r") as f:
+            message["input"] = f.read()
+    if stack_size is not None:
+        message["stack_size"] = stack_size
+    if limit is not None:
+        message["limit"] = limit
+
+    def write(text: str):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    result = asyncio.run(call(address, message, write))
+    if result["exit"] == "rejected":
+        low = result["min_ticks"]
+        print("Rejected: " + ("never halts" if low is None else f"{low} ticks or more"))
+        return result
+    print()
+    print(f"Instructions: {result['instructions']} Ticks: {result['ticks']}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Клиент сервера трансляции и симуляции"
+    )
+    parser.add_argument("--socket", help="Unix-сокет сервера (по умолчанию TCP)")
+    parser.add_argument("--host", default=HOST, help=f"Адрес TCP (по умолчанию {HOST})")
+    parser.add_argument(
+        "--port", type=int, default=PORT, help=f"Порт TCP (по умолчанию {PORT})"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    translate_parser = commands.add_parser("translate", help="Трансляция кода")
+    translate_parser.add_argument("source_file", help="Имя файла с кодом")
+    translate_parser.add_argument("target_file", help="Имя выходного файла")
+    translate_parser.add_argument(
+        "-O",
+        dest="optimize",
+        action="store_true",
+        help="Свёртка констант, удаление пустых переходов и совмещённые инструкции",
+    )
+    translate_parser.add_argument(
+        "--inline",
+        type=int,
+        default=0,
+        help="Подставлять тела функций не больше N узлов AST (0 - не подставлять)",
+    )
+    translate_parser.add_argument(
+        "--inline_budget",
+        type=int,
+        default=INLINE_BUDGET,
+        help="Допустимый рост программы от подстановок в узлах AST",
+    )
+    translate_parser.add_argument(
+        "--strip",
+        action="store_true",
+        help="Не включать таблицу символов в образ, записать её в <target_file>.sym",
+    )
+
+    simulate_parser = commands.add_parser("simulate", help="Симуляция процессора")
+    simulate_parser.add_argument("code_file", help="Образ или исходник (.lisp)")
+    simulate_parser.add_argument(
+        "input_file",
+        nargs="?",
+        help="Имя входного файла (опционально, '-' - стандартный ввод)",
+    )
+    simulate_parser.add_argument(
+        "--stack_size", type=int, help="Размер стека (по умолчанию - сервера)"
+    )
+    simulate_parser.add_argument(
+        "--limit", type=int, help="Лимит тиков (по умолчанию - сервера)"
+    )
+    simulate_parser.add_argument(
+        "--blocks",
+        action="store_true",
+        help="Исполнять скомпилированными базовыми блоками",
+    )
+    simulate_parser.add_argument(
+        "--source", action="store_true", help="code_file - исходник"
+    )
+    simulate_parser.add_argument(
+        "-O",
+        dest="optimize",
+        action="store_true",
+        help="Транслировать исходник с оптимизациями",
+    )
+    simulate_parser.add_argument(
+        "--reject",
+        action="store_true",
+        default=None,
+        help="Не запускать, если программа заведомо не уложится в лимит",
+    )
+    args = parser.parse_args()
+
+    address = (args.socket, args.host, args.port)
+    if args.command == "translate":
+        translate(
+            address,
+            args.source_file,
+            args.target_file,
+            args.optimize,
+            args.inline,
+            args.inline_budget,
+            args.strip,
+        )
+    else:
+        simulate(
+            address,
+            args.code_file,
+            args.input_file,
+            args.stack_size,
+            args.limit,
+            args.blocks,
+            args.source,
+            args.optimize,
+            args.reject,
+        )
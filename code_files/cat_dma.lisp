@@ -0,0 +1,9 @@
+; init memory
+(alloc_buf buf 64)
+
+; transfer input to output by blocks
+(read_buf buf 63)
+(while (get_val buf) do
+    (write_str buf)
+    (read_buf buf 63)
+)
@@ -0,0 +1,17 @@
+; init memory
+(alloc_num val 0)
+(alloc_num running 1)
+
+; each input symbol raises an interrupt
+(def_isr on_input
+    (input val)
+    (if (get_val val) then
+        (output (get_val val))
+    else
+        (set running 0)
+    )
+)
+
+; wait for the terminating zero
+(enable_interrupts)
+(while (get_val running) do)
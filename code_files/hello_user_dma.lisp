@@ -0,0 +1,10 @@
+; init memory
+(alloc_str hello "Hello, ")
+(alloc_buf name 30)
+
+; read name
+(read_buf name 29)
+
+; print "Hello, " and name
+(write_str hello)
+(write_str name)
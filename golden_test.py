@@ -1,24 +1,45 @@
+import asyncio
+import base64
 import contextlib
 import io
+import json
 import logging
 import os
 import tempfile
 
 import pytest
 
+import batch
+import benchmark
+import client
+import server
 import simulation
 import translator
-from machine.isa import read_code
+from lisp.parser import MAX_DEPTH
+from machine.analysis import Analysis
+from machine.cache import Cache
+from machine.checkpoint import Checkpointer, load_checkpoint
+from machine.datapath import wrap
+from machine.devices import InputDevice, OutputDevice
+from machine.fetch import FetchUnit, instruction_cache
+from machine.harts import SCHEDULERS
+from machine.image import Image, read_image, unpack_image, write_image
+from machine.interrupts import InterruptController, ScheduledInput
+from machine.isa import MAX_SIGN, MIN_SIGN, Opcode
+from machine.pipeline import PREDICTORS, Pipeline
+from machine.stack_cache import StackCache
+from machine.trace import Tracer
+
+
+STACK_SIZE = 10
+DEBUG_LIMIT = 200
+LIMIT = 100000
 
 
 @pytest.mark.golden_test("tests/*.yml")
 def test_translator_asm_and_machine(golden, caplog):
     caplog.set_level(logging.DEBUG)
 
-    STACK_SIZE = 10
-    DEBUG_LIMIT = 200
-    LIMIT = 100000
-
     with tempfile.TemporaryDirectory() as tmpdirname:
         source = os.path.join(tmpdirname, "source.lisp")
         input_stream = os.path.join(tmpdirname, "input.txt")
@@ -35,7 +56,87 @@ def test_translator_asm_and_machine(golden, caplog):
             print("============================================================")
             simulation.main(target, input_stream, STACK_SIZE, DEBUG_LIMIT, LIMIT)
 
-        code = read_code(target)
+        code = read_image(target).words()
+        with open(target_mnem, "r") as f:
+            mnemonics = f.read()
+
+        assert mnemonics == golden.out["out_mnemonics"]
+        assert code == golden.out["out_code"]
+        assert stdout.getvalue() == golden.out["out_stdout"]
+        assert caplog.text == golden.out["out_log"]
+
+
+# исполнение базовыми блоками должно давать тот же вывод, журнал и такты
+@pytest.mark.golden_test("tests/*.yml")
+def test_block_engine(golden, caplog):
+    caplog.set_level(logging.DEBUG)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        input_stream = os.path.join(tmpdirname, "input.txt")
+        target = os.path.join(tmpdirname, "target.o")
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+        with open(input_stream, "w", encoding="utf-8") as file:
+            file.write(golden["in_stdin"])
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            translator.main(source, target)
+            print("============================================================")
+            simulation.main(
+                target, input_stream, STACK_SIZE, DEBUG_LIMIT, LIMIT, block_engine=True
+            )
+
+        assert stdout.getvalue() == golden.out["out_stdout"]
+        assert caplog.text == golden.out["out_log"]
+
+
+# пакетный запуск даёт тот же вывод и счётчики, что и simulation.main
+@pytest.mark.golden_test("tests/*.yml")
+def test_batch_job(golden):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        input_stream = os.path.join(tmpdirname, "input.txt")
+        target = os.path.join(tmpdirname, "target.o")
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+        with open(input_stream, "w", encoding="utf-8") as file:
+            file.write(golden["in_stdin"])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.main(source, target)
+        job = {"id": 0, "code": target, "input": input_stream, "limit": LIMIT}
+        result = batch.run_job(job)
+
+    stdout = f"{result['output']}\nInstructions: {result['instructions']} Ticks: {result['ticks']}\n"
+    assert golden.out["out_stdout"].endswith(stdout)
+    assert result["exit"] in ("halt", "eof")
+
+
+# трансляция с -O: совмещённые инструкции и пересчитанные адреса
+@pytest.mark.golden_test("tests/opt/*.yml")
+def test_optimized(golden, caplog):
+    caplog.set_level(logging.DEBUG)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        input_stream = os.path.join(tmpdirname, "input.txt")
+        target = os.path.join(tmpdirname, "target.o")
+        target_mnem = os.path.join(tmpdirname, "target.o.mnem")
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+        with open(input_stream, "w", encoding="utf-8") as file:
+            file.write(golden["in_stdin"])
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            translator.main(source, target, target_mnem, optimize=True)
+            print("============================================================")
+            simulation.main(target, input_stream, STACK_SIZE, DEBUG_LIMIT, LIMIT)
+
+        code = read_image(target).words()
         with open(target_mnem, "r") as f:
             mnemonics = f.read()
 
@@ -43,3 +144,1000 @@ def test_translator_asm_and_machine(golden, caplog):
         assert code == golden.out["out_code"]
         assert stdout.getvalue() == golden.out["out_stdout"]
         assert caplog.text == golden.out["out_log"]
+
+
+# подстановка функций меняет код, но не вывод программы
+@pytest.mark.golden_test("tests/*.yml")
+def test_inlined(golden):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        input_stream = os.path.join(tmpdirname, "input.txt")
+        target = os.path.join(tmpdirname, "target.o")
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+        with open(input_stream, "w", encoding="utf-8") as file:
+            file.write(golden["in_stdin"])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.main(source, target, inline_size=64)
+        job = {"id": 0, "code": target, "input": input_stream, "limit": LIMIT}
+        result = batch.run_job(job)
+
+    expected = golden.out["out_stdout"].split("=" * 60 + "\n")[1]
+    assert expected.startswith(f"{result['output']}\nInstructions: ")
+    assert result["ticks"] <= int(expected.rsplit("Ticks: ", 1)[1])
+
+
+# тело с объявлением не подставляется: копии в двух местах вызова
+# объявили бы имя дважды; без объявления - подставляется
+INLINE_SOURCE = """
+(alloc_num a 65)
+(alloc_num tmp 1)
+(def_func show
+    {}
+    (set tmp (+ (get_val $1) (get_val tmp)))
+    (output (get_val tmp)))
+(show @a)
+(show @a)
+"""
+
+
+@pytest.mark.parametrize(
+    ("declaration", "inlined"),
+    [
+        ("", True),
+        ("(alloc_num b 1)", False),
+        ('(alloc_str s "x")', False),
+        ("(alloc_buf buf 2)", False),
+        ("(def_func f (output 1))", False),
+    ],
+)
+def test_inline_declarations(declaration, inlined):
+    source = INLINE_SOURCE.format(declaration)
+    plain, _ = translator.translate(source)
+    image, _ = translator.translate(source, inline_size=64)
+    assert (image.words() != plain.words()) == inlined
+
+    def run(image):
+        return simulation.simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            [],
+            0,
+            LIMIT,
+            bss_size=image.bss_size,
+        )
+
+    assert run(image)[0] == run(plain)[0]
+    assert run(image)[3] == "halt"
+
+
+# повторная трансляция неизменённой программы берётся из кеша
+@pytest.mark.golden_test("tests/*.yml")
+def test_translation_cache(golden):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        target = os.path.join(tmpdirname, "target.o")
+        target_mnem = os.path.join(tmpdirname, "target.o.mnem")
+        cache = translator.ImageCache(os.path.join(tmpdirname, "cache"))
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.main(source, target, cache=cache)
+            translator.main(source, target, target_mnem, cache=cache)
+
+        code = read_image(target).words()
+        with open(target_mnem, "r") as f:
+            mnemonics = f.read()
+
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert mnemonics == golden.out["out_mnemonics"]
+    assert code == golden.out["out_code"]
+
+
+# образы запусков с source не пропадают, даже если кеш меньше их суммы
+def test_batch_small_cache():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        manifest = os.path.join(tmpdirname, "manifest.jsonl")
+        with open(manifest, "w", encoding="utf-8") as f:
+            for name in ("prob1", "hello", "cat"):
+                source = os.path.join("code_files", name + ".lisp")
+                f.write(json.dumps({"source": source}) + "\n")
+        target = io.StringIO()
+        cache_dir = os.path.join(tmpdirname, "cache")
+        batch.main(manifest, target, 1, cache_dir=cache_dir, cache_size=1500)
+        cached = len(os.listdir(cache_dir))
+
+    results = [json.loads(line) for line in target.getvalue().splitlines()]
+    assert [result["exit"] for result in results] == ["halt", "halt", "eof"]
+    # кеш вытеснил часть записей
+    assert cached < 6
+
+
+# ошибочные строки манифеста - ошибки своих запусков, остальные исполняются
+def test_batch_malformed_manifest():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        code = os.path.join(tmpdirname, "hello.o")
+        with open("code_files/hello.lisp", "r", encoding="utf-8") as f:
+            write_image(code, translator.translate(f.read())[0])
+        manifest = os.path.join(tmpdirname, "manifest.jsonl")
+        with open(manifest, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"code": code}) + "\n")
+            f.write(json.dumps({"input": "x"}) + "\n")
+            f.write("{broken\n")
+            f.write("[1, 2]\n")
+            f.write(json.dumps({"code": code, "id": "last"}) + "\n")
+        target = io.StringIO()
+        batch.main(manifest, target, 1)
+
+    results = [json.loads(line) for line in target.getvalue().splitlines()]
+    assert [result["id"] for result in results] == [0, 1, 2, 3, "last"]
+    assert [result["exit"] for result in results] == [
+        "halt",
+        "error",
+        "error",
+        "error",
+        "halt",
+    ]
+    assert results[1]["error"] == "ValueError: Job has neither code nor source"
+    assert results[2]["error"].startswith("JSONDecodeError: ")
+
+
+# остановка с контрольной точкой и продолжение с неё дают тот же результат,
+# что и запуск без остановки
+@pytest.mark.parametrize("block_engine", [False, True])
+@pytest.mark.parametrize(("name", "text"), [("prob1", ""), ("cat", "bla-bla\n" * 50)])
+def test_checkpoint_resume(name, text, block_engine):
+    with open(os.path.join("code_files", name + ".lisp"), encoding="utf-8") as f:
+        image, _ = translator.translate(f.read())
+    chars = [ord(char) for char in text] + [0]
+    expected = simulation.simulation(
+        image.memory(), image.start, STACK_SIZE, chars, 0, LIMIT, block_engine
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        checkpointer = Checkpointer(os.path.join(tmpdirname, "{tick}.ckpt"))
+        simulation.simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            chars,
+            0,
+            expected[2] // 2,
+            block_engine,
+            checkpointer=checkpointer,
+        )
+        resume = load_checkpoint(checkpointer.saved[-1])
+    assert resume["control_unit"]["tick"] >= expected[2] // 2
+    result = simulation.simulation(
+        resume["data"],
+        resume["control_unit"]["program_counter"],
+        len(resume["datapath"]["stack"]),
+        chars,
+        0,
+        LIMIT,
+        block_engine,
+        resume=resume,
+        bss_size=resume["bss_size"],
+    )
+    assert result == expected
+
+    # состояние кеша данных в точку не сохраняется
+    with pytest.raises(AssertionError, match="Checkpoints do not support cache"):
+        simulation.simulation(
+            resume["data"],
+            resume["control_unit"]["program_counter"],
+            STACK_SIZE,
+            chars,
+            0,
+            LIMIT,
+            cache=Cache(),
+            resume=resume,
+        )
+
+
+# выход за границы стеков - ошибка в обоих режимах исполнения
+@pytest.mark.parametrize("block_engine", [False, True])
+@pytest.mark.parametrize(
+    ("code", "message"),
+    [
+        ([Opcode.DROP, Opcode.HLT], "Data stack underflow"),
+        ([Opcode.PUSH, 1, Opcode.ADD, Opcode.HLT], "Data stack underflow"),
+        ([Opcode.PUSH, 1, Opcode.JMP, 0], "Data stack overflow"),
+        ([Opcode.RET], "Return stack underflow"),
+        ([Opcode.PEEK, 1, Opcode.HLT], "Return stack underflow"),
+        ([Opcode.CALL, 0], "Return stack overflow"),
+    ],
+)
+def test_stack_bounds(code, message, block_engine):
+    code = [word.value if isinstance(word, Opcode) else word for word in code]
+    with pytest.raises(IndexError, match=message):
+        simulation.simulation(
+            code, 0, STACK_SIZE, InputDevice([]), 0, LIMIT, block_engine
+        )
+
+
+# буфер в BSS: образ не растёт с размером буфера, запись и чтение по краям
+@pytest.mark.parametrize("block_engine", [False, True])
+def test_bss(block_engine):
+    source = """
+    (alloc_num i 3)
+    (alloc_buf big 1000000)
+    (alloc_num last 0)
+    (set last (+ big 999999))
+    (set (get_val last) 65)
+    (set big 66)
+    (output (get_val (get_val last)))
+    (output (get_val big))
+    (output (+ 48 (get_val i)))
+    """
+    image, _ = translator.translate(source)
+    assert len(image.memory()) < 100
+    assert image.bss_size == 1000000
+
+    output, *_ = simulation.simulation(
+        image.memory(),
+        image.start,
+        STACK_SIZE,
+        InputDevice([]),
+        0,
+        LIMIT,
+        block_engine,
+        bss_size=image.bss_size,
+    )
+    assert output == "AB3"
+
+
+def test_wrap():
+    assert wrap(MAX_SIGN + 1) == MIN_SIGN
+    assert wrap(MIN_SIGN - 1) == MAX_SIGN
+    assert wrap(3 * MAX_SIGN) == MAX_SIGN - 2
+    assert wrap(-5) == -5
+
+
+# поток, запоминающий размеры запрошенных блоков
+class ChunkedStream(io.StringIO):
+    sizes: list = None
+
+    def read(self, size=-1):
+        self.sizes = (self.sizes or []) + [size]
+        return super().read(size)
+
+
+# ввод читается блоками по chunk_size, символы на границах блоков не теряются,
+# после данных - один завершающий 0
+@pytest.mark.parametrize("text", ["", "abc", "abcdefgh"])
+def test_input_chunks(text):
+    expected = [ord(char) for char in text] + [0]
+
+    stream = ChunkedStream(text)
+    device = InputDevice.from_stream(stream, chunk_size=3)
+    assert [device.read() for _ in expected] == expected
+    with pytest.raises(EOFError):
+        device.read()
+    assert device.position == len(expected)
+    assert set(stream.sizes) == {3}
+    assert len(stream.sizes) == (len(text) + 2) // 3 + 1
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = os.path.join(tmpdirname, "input.txt")
+        with open(path, "w") as f:
+            f.write(text)
+        device = InputDevice.from_file(path, chunk_size=3)
+        device.skip(len(text))
+        assert device.read() == 0
+        with pytest.raises(EOFError):
+            device.skip(1)
+        assert device.position == len(expected)
+
+
+# без keep вывод только пишется в sink и не накапливается
+def test_output_device():
+    sink = io.StringIO()
+    device = OutputDevice(sink, keep=False)
+    for ord_char in [ord("h"), ord("i"), 300]:
+        device.write(ord_char)
+    assert device.buffer is None
+    assert device.text() == ""
+    assert device.count == 3
+    assert sink.getvalue() == "hi300"
+
+
+# вложенность до MAX_DEPTH транслируется, глубже - ошибка разбора с позицией
+# вместо RecursionError в генерации кода
+@pytest.mark.parametrize(
+    "nest",
+    [
+        lambda n: "(set x " + "(+ 1 " * (n - 1) + "0" + ")" * n,
+        lambda n: (
+            "(if 1 then " * (n - 1) + "(output 65)" + " else (output 66))" * (n - 1)
+        ),
+        lambda n: "(while 0 do " * (n - 1) + "(output 65)" + ")" * (n - 1),
+    ],
+)
+def test_nesting_depth(nest):
+    image, _ = translator.translate("(alloc_num x 0) " + nest(MAX_DEPTH))
+    assert image.code
+    with pytest.raises(SyntaxError, match=f"nesting deeper than {MAX_DEPTH}"):
+        translator.translate("(alloc_num x 0) " + nest(MAX_DEPTH + 1))
+    with pytest.raises(SyntaxError, match="nesting deeper"):
+        translator.translate("(alloc_num x 0) " + nest(3000))
+
+
+# образ: секции и таблица символов переживают запись и чтение, файл без
+# заголовка читается как образ старого формата
+def test_image_container():
+    image, _ = translator.translate("(alloc_buf buf 10)\n(output (+ 1 2))\n")
+    assert image.bss_size == 10
+    assert image.symbols["lines"][0] == [0, 2]
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        target = os.path.join(tmpdirname, "out.o")
+        write_image(target, image)
+        loaded = read_image(target)
+        assert loaded.words() == image.words()
+        assert (loaded.bss_size, loaded.symbols) == (10, image.symbols)
+
+        write_image(target, Image(image.start, image.code, image.data))
+        assert read_image(target).symbols is None
+
+        with open(target, "wb") as f:
+            f.write(b"".join(w.to_bytes(4, "little") for w in image.words()))
+        legacy = read_image(target)
+        assert (legacy.start, legacy.memory()) == (image.start, image.memory())
+
+
+# профиль по строкам исходника из встроенной таблицы символов
+def test_profile_lines():
+    source = "(alloc_num i 3)\n(while (get_val i) do (set i (- (get_val i) 1)))\n(output 65)\n"
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source_file = os.path.join(tmpdirname, "source.lisp")
+        target = os.path.join(tmpdirname, "out.o")
+        profile = os.path.join(tmpdirname, "profile.json")
+        with open(source_file, "w") as f:
+            f.write(source)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.main(source_file, target)
+            simulation.main(target, None, STACK_SIZE, 0, LIMIT, profile_file=profile)
+        with open(profile) as f:
+            lines = json.load(f)["lines"]
+
+    assert set(lines) == {"2", "3"}
+    assert lines["2"] > lines["3"]
+
+
+# прогон той же программы с трассой, возвращает её записи
+def traced(image: Image, tracer: Tracer) -> list:
+    simulation.simulation(
+        image.memory(),
+        image.start,
+        STACK_SIZE,
+        InputDevice([]),
+        0,
+        LIMIT,
+        tracer=tracer,
+        bss_size=image.bss_size,
+    )
+    return tracer.entries()
+
+
+# кольцевой буфер хранит последние записи, окна отбирают записи по PC и
+# тактам, render даёт по строке на запись
+def test_tracer():
+    image, _ = translator.translate(
+        "(alloc_num i 10)\n(while (get_val i) do (set i (- (get_val i) 1)))\n(output 65)\n"
+    )
+    full = traced(image, Tracer(10**4))
+    assert len(full) < 10**4
+    assert full[0][1] == image.start
+
+    tracer = Tracer(7)
+    assert traced(image, tracer) == full[-7:]
+    assert tracer.count == len(full)
+
+    pcs = sorted({entry[1] for entry in full})
+    low, high = pcs[2], pcs[-3]
+    in_pc = [entry for entry in full if low <= entry[1] <= high]
+    assert 5 < len(in_pc) < len(full)
+    assert traced(image, Tracer(10**4, pc_window=(low, high))) == in_pc
+    assert traced(image, Tracer(5, pc_window=(low, high))) == in_pc[-5:]
+
+    low, high = full[10][0], full[20][0]
+    assert traced(image, Tracer(10**4, tick_window=(low, high))) == full[10:21]
+
+    lines = tracer.render()
+    assert len(lines) == 7
+    assert lines[-1].startswith(f"TICK: {full[-1][0]:4} [{full[-1][1]:2}: HLT")
+    lines = tracer.render(image.symbols)
+    assert all(" LINE: " in line for line in lines)
+    assert lines[-1].endswith("LINE: 3")
+
+
+# результат замера нагрузки без обращения к часам
+def benchmark_result(scale: float) -> dict:
+    engines = {
+        engine: {
+            "instructions": 100,
+            "ticks": 300,
+            "seconds": seconds * scale,
+            "instructions_per_sec": 100 / (seconds * scale),
+            "ticks_per_sec": 300 / (seconds * scale),
+        }
+        for engine, seconds in (("interp", 2.0), ("blocks", 1.0))
+    }
+    return {
+        "lines": 10,
+        "lines_per_sec": 10 / scale,
+        "load_seconds": scale,
+        "engines": engines,
+        "speedup": 2.0,
+        "peak_rss_kib": 1000,
+    }
+
+
+# ухудшение больше порога - регрессия; relative сравнивает только отношения,
+# поэтому вдвое более медленная машина регрессией не считается
+def test_benchmark_compare():
+    results = {
+        "scale": 1.0,
+        "optimize": False,
+        "workloads": {"hello": benchmark_result(1)},
+    }
+    assert benchmark.compare(results, results) == []
+
+    baseline = json.loads(json.dumps(results))
+    baseline["workloads"]["hello"]["engines"]["blocks"]["ticks_per_sec"] *= 2
+    baseline["workloads"]["hello"]["peak_rss_kib"] //= 2
+    regressions = benchmark.compare(results, baseline)
+    assert [line.split(":")[0] for line in regressions] == [
+        "hello peak_rss_kib",
+        "hello blocks.ticks_per_sec",
+    ]
+
+    slower = {
+        "scale": 1.0,
+        "optimize": False,
+        "workloads": {"hello": benchmark_result(2)},
+    }
+    assert len(benchmark.compare(slower, results)) == 6
+    assert benchmark.compare(slower, results, relative=True) == []
+    slower["workloads"]["hello"]["speedup"] = 1.0
+    assert benchmark.compare(slower, results, relative=True) == [
+        "hello speedup: 2 -> 1"
+    ]
+
+
+# настоящий замер: запускается только через pytest -m benchmark
+@pytest.mark.benchmark
+def test_benchmark():
+    results = benchmark.run(["hello", "nested"], scale=0.01, repeat=1)
+    nested = results["workloads"]["nested"]
+    assert nested["engines"]["interp"]["ticks"] == nested["engines"]["blocks"]["ticks"]
+    assert nested["speedup"] > 0
+    assert benchmark.compare(results, results) == []
+
+
+# конвейер меняет только такты: вывод и число инструкций как у
+# последовательной модели, такты - по простоям
+@pytest.mark.parametrize("predictor", PREDICTORS)
+def test_pipeline(predictor):
+    with open("code_files/prob1.lisp", "r", encoding="utf-8") as f:
+        image, _ = translator.translate(f.read())
+    expected = simulation.simulation(
+        image.memory(), image.start, STACK_SIZE, InputDevice([]), 0, LIMIT
+    )
+
+    pipeline = Pipeline(predictor=predictor)
+    output, instructions, ticks, reason = simulation.simulation(
+        image.memory(),
+        image.start,
+        STACK_SIZE,
+        InputDevice([]),
+        0,
+        LIMIT,
+        pipeline=pipeline,
+    )
+    assert (output, instructions, reason) == (expected[0], expected[1], "halt")
+    assert ticks < expected[2]
+    assert (pipeline.instructions, pipeline.cycles) == (instructions, ticks)
+    assert pipeline.branches == 2001
+    if predictor == "none":
+        assert pipeline.stalls["control"] > 2 * pipeline.branches
+    else:
+        assert 0 < pipeline.accuracy() < 1
+
+
+# без обходных путей ADD ждёт результат второго PUSH
+@pytest.mark.parametrize(
+    ("forwarding", "ticks", "stalls"), [(True, 6, 0), (False, 7, 1)]
+)
+def test_pipeline_hazard(forwarding, ticks, stalls):
+    code = [
+        Opcode.PUSH.value,
+        1,
+        Opcode.PUSH.value,
+        2,
+        Opcode.ADD.value,
+        Opcode.HLT.value,
+    ]
+    pipeline = Pipeline(fetch_width=2, forwarding=forwarding)
+    result = simulation.simulation(
+        code, 0, STACK_SIZE, InputDevice([]), 0, LIMIT, pipeline=pipeline
+    )
+    assert result[1:] == (4, ticks, "halt")
+    assert pipeline.stalls["stack"] == stalls
+
+
+# кеш инструкций добавляет к тактам только задержки промахов,
+# предвыборка скрывает часть из них
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_fetch_unit(pipeline):
+    with open("code_files/hello.lisp", "r", encoding="utf-8") as f:
+        image, _ = translator.translate(f.read())
+
+    def run(fetch_unit):
+        return simulation.simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            InputDevice([]),
+            0,
+            LIMIT,
+            pipeline=Pipeline() if pipeline else None,
+            fetch_unit=fetch_unit,
+        )
+
+    expected = run(None)
+    plain = FetchUnit(instruction_cache(16, 4, 2, 1, 10))
+    prefetching = FetchUnit(instruction_cache(16, 4, 2, 1, 10), prefetch=2)
+    for fetch_unit in (plain, prefetching):
+        output, instructions, ticks, _ = run(fetch_unit)
+        assert (output, instructions) == expected[:2]
+        assert ticks == expected[2] + fetch_unit.stall_ticks
+        assert fetch_unit.fetches == fetch_unit.cache.hits + fetch_unit.cache.misses
+
+    assert plain.cache.misses == prefetching.cache.misses
+    assert prefetching.prefetch_hits > 0
+    assert prefetching.stall_ticks < plain.stall_ticks
+    assert prefetching.memory_reads() > plain.memory_reads()
+
+
+# трасса строк 0 1 0 2 1 w2 3 0 w4 4 по одному двухстрочному множеству:
+# LRU после попадания в 0 вытесняет 1, FIFO - 0; запись назад копит
+# грязную строку до вытеснения, сквозная пишет в память сразу и без выделения
+CACHE_TRACE = [
+    (0, False),
+    (3, False),
+    (1, False),
+    (4, False),
+    (2, False),
+    (5, True),
+    (6, False),
+    (1, False),
+    (9, True),
+    (8, False),
+]
+
+
+@pytest.mark.parametrize(
+    ("replacement", "write_policy", "latencies", "stats"),
+    [
+        ("lru", "back", [10, 10, 1, 10, 10, 1, 10, 20, 10, 1], (3, 7, 5, 1, 0)),
+        ("fifo", "back", [10, 10, 1, 10, 1, 1, 10, 20, 10, 1], (4, 6, 4, 1, 0)),
+        ("lru", "through", [10, 10, 1, 10, 10, 10, 10, 10, 10, 10], (2, 8, 5, 0, 2)),
+        ("fifo", "through", [10, 10, 1, 10, 1, 10, 10, 10, 10, 10], (3, 7, 4, 0, 2)),
+    ],
+)
+def test_cache_trace(replacement, write_policy, latencies, stats):
+    cache = Cache(2, 1, 2, replacement, write_policy, 1, 10)
+    assert [cache.access(addr, write) for addr, write in CACHE_TRACE] == latencies
+    keys = ("hits", "misses", "evictions", "write_backs", "memory_writes")
+    assert tuple(cache.stats()[key] for key in keys) == stats
+
+
+# окно в регистрах меньше глубины выражения: слова уходят в память и
+# возвращаются, такты растут на перемещения
+@pytest.mark.parametrize("depth", [2, 4, 16])
+def test_stack_cache(depth):
+    image, _ = translator.translate("(output " + "(+ 4 " * 12 + "0" + ")" * 13)
+    expected = simulation.simulation(
+        image.memory(), image.start, 16, InputDevice([]), 0, LIMIT
+    )
+
+    stack_cache = StackCache(depth, depth)
+    output, instructions, ticks, _ = simulation.simulation(
+        image.memory(),
+        image.start,
+        16,
+        InputDevice([]),
+        0,
+        LIMIT,
+        stack_cache=stack_cache,
+    )
+    assert (output, instructions) == ("0", expected[1])
+    assert ticks == expected[2] + stack_cache.stall_ticks
+    data = stack_cache.data
+    assert data.max_depth == 14
+    assert data.spills == data.fills == max(data.max_depth - depth, 0)
+
+
+HARTS_SOURCE = "\n".join(
+    [
+        "(alloc_num counter 0)",
+        "(alloc_num old 0)",
+        *(
+            f"(def_hart w{n} (alloc_num n{n} 10)"
+            f" (while (get_val n{n}) do (set old (xadd counter 1))"
+            f" (set n{n} (- (get_val n{n}) 1))))"
+            for n in range(3)
+        ),
+        "(while (- 30 (get_val counter)) do)",
+        "(output (+ 18 (get_val counter)))",
+    ]
+)
+
+
+@pytest.mark.parametrize("scheduler", SCHEDULERS)
+def test_harts(scheduler):
+    image, _ = translator.translate(HARTS_SOURCE)
+    starts = simulation.resolve_entries(
+        ["start", "w0", "w1", "w2"], image.start, image.symbols
+    )
+    runs = [
+        simulation.multi_simulation(
+            image.memory(), starts, STACK_SIZE, [], LIMIT, scheduler, 3, image.bss_size
+        )
+        for _ in range(2)
+    ]
+    output, instructions, ticks, harts = runs[0]
+    assert output == "0"
+    stats = harts.stats()
+    assert [hart["reason"] for hart in stats["harts"]] == ["halt"] * 4
+    workers = {hart["instructions"] for hart in stats["harts"][1:]}
+    assert len(workers) == 1
+    assert instructions == sum(hart["instructions"] for hart in stats["harts"])
+    assert ticks == max(hart["ticks"] for hart in stats["harts"])
+    if scheduler == "tick":
+        assert stats["conflicts"] > 0 and stats["stall_ticks"] > 0
+    else:
+        assert stats["conflicts"] == stats["stall_ticks"] == 0
+    # порядок исполнения определяется только планировщиком
+    assert runs[1][3].stats() == stats
+
+
+# режимы, которые ядра не поддерживают, отклоняются, а не игнорируются
+@pytest.mark.parametrize(
+    "option, message",
+    [
+        ({"cache": Cache()}, "Harts do not support cache"),
+        ({"pipeline": Pipeline()}, "Harts do not support cache"),
+        (
+            {"fetch_unit": FetchUnit(instruction_cache(16, 4, 2, 1, 10))},
+            "Harts do not support cache",
+        ),
+        ({"stack_cache": StackCache()}, "Harts do not support cache"),
+        ({"block_engine": True}, "Harts do not support the block engine"),
+        ({"tracer": Tracer(16)}, "Harts can not be traced"),
+        ({"profile_file": "profile.json"}, "Harts can not be traced"),
+        ({"checkpointer": Checkpointer("checkpoint", 1)}, "Harts do not support"),
+    ],
+)
+def test_harts_options(option, message):
+    image, _ = translator.translate(HARTS_SOURCE)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        target = os.path.join(tmpdirname, "harts.o")
+        write_image(target, image)
+        with pytest.raises(AssertionError, match=message):
+            simulation.main(
+                target, None, STACK_SIZE, 0, LIMIT, harts=["start", "w0"], **option
+            )
+
+
+@pytest.mark.parametrize("block_engine", [False, True])
+def test_xadd(block_engine):
+    image, _ = translator.translate(
+        "(alloc_num x 40) (alloc_buf b 1) (set b (xadd x 7))"
+        " (output (+ (get_val b) (xadd b 8))) (output (- (get_val x) (get_val b)))"
+    )
+    output, _, _, reason = simulation.simulation(
+        image.memory(),
+        image.start,
+        STACK_SIZE,
+        InputDevice([]),
+        0,
+        LIMIT,
+        block_engine,
+        bss_size=image.bss_size,
+    )
+    assert (output, reason) == ("P-1", "halt")
+
+
+def run_scheduled(name: str, interval: int, block_engine: bool = False):
+    with open(os.path.join("code_files", name), encoding="utf-8") as f:
+        image, _ = translator.translate(f.read())
+    chars = [ord(char) for char in "bla-bla\n"] + [0]
+    device = ScheduledInput.uniform(chars, interval, interval)
+    handlers = list(image.symbols["handlers"].values())
+    interrupts = InterruptController(device, handlers[0] if handlers else None)
+    result = simulation.simulation(
+        image.memory(),
+        image.start,
+        STACK_SIZE,
+        device,
+        0,
+        LIMIT,
+        block_engine,
+        interrupts=interrupts,
+    )
+    return result, interrupts.stats()
+
+
+@pytest.mark.parametrize("interval", [1, 10, 100])
+def test_interrupts(interval):
+    (output, _, ticks, reason), stats = run_scheduled("cat_isr.lisp", interval)
+    assert (output, reason) == ("bla-bla\n", "halt")
+    assert stats["interrupts"] == 9
+    assert stats["input"]["read"] == 9 and stats["input"]["wait_ticks"] == 0
+    # последний символ пришёл на такте 9 * interval
+    assert ticks > 9 * interval
+    if interval == 100:
+        # обработчик успевает до прихода следующего символа
+        assert stats["latency_max"] <= 2
+
+    # блоки не компилируются: прерывания возникают между любыми инструкциями
+    assert run_scheduled("cat_isr.lisp", interval, True)[1] == stats
+
+    # опрос порта без прерываний: редкие символы ждёт, частые - копятся
+    (output, _, ticks, _), stats = run_scheduled("cat.lisp", interval)
+    assert output == "bla-bla\n" and stats["interrupts"] == 0
+    assert ticks > 9 * interval
+    if interval == 100:
+        assert stats["input"]["latency_max"] == 0
+        assert stats["input"]["wait_ticks"] > 0
+
+    with pytest.raises(ValueError, match="can not resume from a checkpoint"):
+        ScheduledInput.uniform([1, 2], interval).skip(1)
+
+
+@pytest.mark.parametrize("block_engine", [False, True])
+def test_input_read_tick(block_engine):
+    with open(os.path.join("code_files", "cat.lisp"), encoding="utf-8") as f:
+        image, _ = translator.translate(f.read())
+
+    # такты начала инструкций до первого чтения
+    class Device(ScheduledInput):
+        starts: list = None
+
+        def poll(self, tick):
+            if self.position == 0:
+                self.starts.append(tick)
+            return super().poll(tick)
+
+    def run(arrival):
+        device = Device([(arrival, 0)])
+        device.starts = []
+        interrupts = InterruptController(device, None)
+        result = simulation.simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            device,
+            0,
+            LIMIT,
+            block_engine,
+            interrupts=interrupts,
+        )
+        return result, device, interrupts.stats()["input"]
+
+    (_, _, ticks, _), device, _ = run(0)
+    read_tick = device.last_read
+    # порт читается не на первом такте инструкции
+    assert read_tick > device.starts[-1]
+    # символ, пришедший на любом такте до чтения, в том числе посреди
+    # читающей инструкции, читается без ожидания
+    for arrival in range(read_tick + 1):
+        (_, _, arrival_ticks, reason), _, stats = run(arrival)
+        assert (arrival_ticks, reason) == (ticks, "halt")
+        assert stats["wait_ticks"] == 0 and stats["latency_max"] == read_tick - arrival
+    # после чтения - ожидание
+    (_, _, arrival_ticks, _), _, stats = run(read_tick + 1)
+    assert stats["wait_ticks"] == 1 and arrival_ticks == ticks + 1
+
+
+@pytest.mark.parametrize("block_engine", [False, True])
+def test_dma(block_engine):
+    text = "The quick brown fox jumps over the lazy dog.\n" * 20
+    chars = [ord(char) for char in text] + [0]
+    results = {}
+    for name in ("cat", "cat_dma"):
+        with open(os.path.join("code_files", name + ".lisp"), encoding="utf-8") as f:
+            image, _ = translator.translate(f.read())
+        results[name] = simulation.simulation(
+            image.memory(),
+            image.start,
+            STACK_SIZE,
+            InputDevice(chars),
+            0,
+            LIMIT,
+            block_engine,
+            bss_size=image.bss_size,
+        )
+    output, instructions, ticks, reason = results["cat_dma"]
+    assert (output, reason) == (text, "halt")
+    # 9 инструкций цикла на каждые 63 символа вместо 8 на символ
+    blocks = (len(text) + 62) // 63
+    assert instructions == 3 + 9 * blocks + 4
+    assert instructions * 50 < results["cat"][1]
+    assert ticks * 3 < results["cat"][2]
+
+
+def test_server():
+    with open(os.path.join("code_files", "cat.lisp"), encoding="utf-8") as f:
+        source = f.read()
+    with open(os.path.join("code_files", "prob1.lisp"), encoding="utf-8") as f:
+        counted = f.read()
+    image, mnemonics = translator.translate(source)
+    text = "bla-bla\n" * 300
+    expected = simulation.simulation(
+        image.memory(), image.start, STACK_SIZE, [ord(c) for c in text] + [0], 0, LIMIT
+    )
+
+    async def scenario():
+        jobs = server.Server(workers=2)
+        listener = await jobs.start(port=0)
+        address = (None, server.HOST, listener.sockets[0].getsockname()[1])
+        try:
+            chunks = []
+            message = {"op": "simulate", "source": source, "input": text}
+            results = await asyncio.gather(
+                client.call(address, message, chunks.append),
+                client.call(address, dict(message, blocks=True)),
+            )
+            translated = await client.call(
+                address, {"op": "translate", "source": source}
+            )
+            with pytest.raises(RuntimeError, match="Unknown op"):
+                await client.call(address, {"op": "bogus"})
+            rejected = await client.call(
+                address,
+                {"op": "simulate", "source": counted, "limit": 1000, "reject": True},
+            )
+            stats = await client.call(address, {"op": "stats"})
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            jobs.close()
+        return chunks, results, translated, rejected, stats
+
+    chunks, results, translated, rejected, stats = asyncio.run(scenario())
+    # вывод приходит порциями по мере готовности
+    assert len(chunks) > 1 and "".join(chunks) == expected[0]
+    for result in results:
+        assert (result["instructions"], result["ticks"], result["exit"]) == expected[1:]
+    assert translated["mnemonics"] == mnemonics
+    assert unpack_image(base64.b64decode(translated["image"])).words() == image.words()
+    # цикл на 1000 итераций заведомо не укладывается в 1000 тактов
+    assert rejected["exit"] == "rejected" and rejected["min_ticks"] > 1000
+    # исходник транслируется и предекодируется один раз на исполнитель
+    assert stats["jobs"] == 5
+    assert stats["hits"] + stats["misses"] == 4
+    assert stats["images"] == stats["misses"] in (2, 3)
+
+
+# отключение клиента отменяет запуск на очередной порции вывода, и
+# единственный исполнитель берёт следующий запуск
+def test_server_cancel():
+    with open(os.path.join("code_files", "cat.lisp"), encoding="utf-8") as f:
+        source = f.read()
+    with open(os.path.join("code_files", "hello.lisp"), encoding="utf-8") as f:
+        hello = f.read()
+    text = "bla-bla\n" * 2**17
+
+    async def scenario():
+        jobs = server.Server(workers=1)
+        listener = await jobs.start(port=0)
+        address = (None, server.HOST, listener.sockets[0].getsockname()[1])
+        try:
+            reader, writer = await client.connect(*address)
+            message = {"op": "simulate", "source": source, "input": text}
+            async for response in client.request(
+                reader, writer, dict(message, limit=10**9)
+            ):
+                assert response["type"] == "output"
+                break
+            writer.close()
+            result = await client.call(address, {"op": "simulate", "source": hello})
+            stats = await client.call(address, {"op": "stats"})
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            jobs.close()
+        return result, stats
+
+    result, stats = asyncio.run(scenario())
+    assert result["exit"] == "halt"
+    assert stats["cancelled"] == 1
+
+
+# статическая оценка охватывает такты модели, запуск не отклоняется
+@pytest.mark.golden_test("tests/*.yml")
+def test_analysis_bounds(golden):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = os.path.join(tmpdirname, "source.lisp")
+        input_stream = os.path.join(tmpdirname, "input.txt")
+        target = os.path.join(tmpdirname, "target.o")
+
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(golden["in_source"])
+        with open(input_stream, "w", encoding="utf-8") as file:
+            file.write(golden["in_stdin"])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            translator.main(source, target)
+        job = {"id": 0, "code": target, "input": input_stream, "limit": LIMIT}
+        result = batch.run_job(dict(job, reject=True))
+        low, high = Analysis(read_image(target)).bounds()
+
+    assert result["exit"] in ("halt", "eof")
+    assert low <= result["ticks"] <= high
+
+
+ANALYSIS_SOURCE = "\n".join(
+    [
+        "(alloc_num i 10)",
+        "(alloc_num j 0)",
+        "(alloc_num n 0)",
+        "(while (get_val i) do",
+        "    (set j 5)",
+        "    (while (get_val j) do",
+        "        (set n (+ (get_val n) 1))",
+        "        (set j (- (get_val j) 1)))",
+        "    (set i (- (get_val i) 1)))",
+        "(output (get_val n))",
+    ]
+)
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_analysis_loops(optimize):
+    image, _ = translator.translate(ANALYSIS_SOURCE, optimize)
+    analysis = Analysis(image)
+    outer, inner = analysis.report()["functions"]["main"]["loops"]
+    assert (outer["counter"], outer["iterations"], outer["depth"]) == ("i", [10, 10], 1)
+    assert (inner["counter"], inner["iterations"], inner["depth"]) == ("j", [5, 5], 2)
+
+    output, _, ticks, reason = simulation.simulation(
+        image.memory(), image.start, STACK_SIZE, [], 0, LIMIT, bss_size=image.bss_size
+    )
+    assert (output, reason) == (chr(50), "halt")
+    # счётчики известны на всех путях - оценка точная
+    assert analysis.bounds() == (ticks, ticks)
+    assert analysis.exceeds(ticks - 1) and not analysis.exceeds(ticks)
+
+    # рекурсия не ограничена
+    image, _ = translator.translate(
+        "(alloc_num k 5)"
+        " (def_func down (if (get_val k) then (set k (- (get_val k) 1)) (down) else))"
+        " (down)",
+        optimize,
+    )
+    down = Analysis(image).report()["functions"]["down"]
+    assert down["recursive"] and down["ticks"][1] is None
+
+
+# запись в код меняет граф потока управления - оценки нет, запуск не отклоняется
+@pytest.mark.parametrize("optimize", [False, True])
+def test_analysis_self_modifying(optimize):
+    image, _ = translator.translate("(set 5 4) " + ANALYSIS_SOURCE, optimize)
+    analysis = Analysis(image)
+    _, _, ticks, reason = simulation.simulation(
+        image.memory(), image.start, STACK_SIZE, [], 0, LIMIT, bss_size=image.bss_size
+    )
+    assert analysis.self_modifying
+    assert analysis.bounds() == (0, float("inf"))
+    assert not analysis.exceeds(ticks)
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+from machine.image import Image, read_image, write_image
+
+# 64 МиБ на образы и мнемоники
+CACHE_SIZE = 64 * 2**20
+
+# файлы записи: образ с таблицей символов (он же признак готовности
+# записи) и мнемоники
+IMAGE_SUFFIX = ".o"
+MNEMONIC_SUFFIX = ".mnem"
+SUFFIXES = (MNEMONIC_SUFFIX, IMAGE_SUFFIX)
+
+
+# ключ записи: хеш текста программы, версии транслятора и опций трансляции
+def cache_key(text: str, version: str, options: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(version.encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Кеш результатов трансляции в каталоге: по ключу лежат образ (с таблицей
+# символов) и мнемоники. Время изменения образа - время последнего обращения,
+# при превышении размера удаляются давно не использованные записи (LRU).
+# Файлы пишутся во временные и переименовываются, поэтому несколько
+# процессов могут пользоваться одним каталогом.
+class ImageCache:
+    directory: str = None
+    max_size: int = None
+
+    hits: int = None
+    misses: int = None
+    evictions: int = None
+
+    def __init__(self, directory: str, max_size: int = CACHE_SIZE):
+        assert max_size > 0, "Cache size must be positive"
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str, suffix: str = IMAGE_SUFFIX) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    # (образ, мнемоники) или None
+    def get(self, key: str):
+        try:
+            image = read_image(self.path(key))
+            with open(self.path(key, MNEMONIC_SUFFIX), "r") as f:
+                mnemonics = f.read().splitlines()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            # запись ещё не создана или её удалил другой процесс
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image, mnemonics
+
+    def put(self, key: str, image: Image, mnemonics: list):
+        temporary = f".{os.getpid()}.tmp"
+        with open(self.path(key, MNEMONIC_SUFFIX + temporary), "w") as f:
+            for line in mnemonics:
+                f.write(line + "\n")
+        write_image(self.path(key, IMAGE_SUFFIX + temporary), image)
+        # образ последним: пока его нет, запись не считается готовой
+        for suffix in SUFFIXES:
+            os.replace(self.path(key, suffix + temporary), self.path(key, suffix))
+        self.evict(keep=key)
+
+    # удалить давно не использованные записи, пока кеш больше max_size
+    def evict(self, keep: str = None):
+        entries = {}
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                key, suffix = os.path.splitext(entry.name)
+                if suffix not in SUFFIXES:
+                    continue
+                stat = entry.stat()
+                size, used = entries.get(key, (0, 0))
+                if suffix == IMAGE_SUFFIX:
+                    used = stat.st_mtime
+                entries[key] = (size + stat.st_size, used)
+                total += stat.st_size
+
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            for suffix in SUFFIXES:
+                try:
+                    os.remove(self.path(key, suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.evictions += 1
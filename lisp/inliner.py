@@ -0,0 +1,148 @@
+from lisp.parser import Expr, Node, Number, Symbol
+
+# суммарный рост программы от подстановок, в узлах AST
+INLINE_BUDGET = 256
+
+# формы, объявляющие имя: копия тела в каждом месте вызова объявила бы
+# его повторно
+DECLARATIONS = (
+    "alloc_num",
+    "alloc_str",
+    "alloc_buf",
+    "def_func",
+    "def_hart",
+    "def_isr",
+)
+
+
+# размер в узлах AST: атом - 1, выражение - 1 + элементы
+def node_size(node: Node) -> int:
+    if isinstance(node, Expr):
+        return 1 + sum(map(node_size, node.items))
+    return 1
+
+
+# все имена, упомянутые в узле: вызовы, переменные, @name
+def referenced_names(node: Node, names: set):
+    if isinstance(node, Expr):
+        for item in node.items:
+            referenced_names(item, names)
+    elif isinstance(node, Symbol):
+        names.add(node.name.lstrip("@"))
+
+
+# есть ли в узле объявление
+def declares(node: Node) -> bool:
+    if not isinstance(node, Expr):
+        return False
+    return node.head in DECLARATIONS or any(map(declares, node.items))
+
+
+# копия тела функции, где $1 заменён аргументом вызова
+def substitute(node: Node, argument: Node) -> Node:
+    if isinstance(node, Expr):
+        items = [substitute(item, argument) for item in node.items]
+        return Expr(items, node.line, node.column)
+    if isinstance(node, Symbol) and node.name == "$1":
+        return argument
+    return node
+
+
+# аргумент (f @name) как значение: PEEK 1 вернул бы то, что положил PUSHR
+def argument_value(node: Node) -> Node:
+    name = node.name[1:]
+    if name.lstrip("-").isdecimal():
+        return Number(int(name), node.line, node.column)
+    return Symbol(name, node.line, node.column)
+
+
+# Подстановка тел небольших def_func в места вызовов (f @name) вместо
+# PUSHR, CALL, RET, DROPR. Функции объявляются до вызова, поэтому
+# программа обходится один раз по порядку. Рекурсивные функции и тела с
+# объявлениями не подставляются, функции без оставшихся ссылок удаляются
+# из программы.
+class Inliner:
+    max_size: int = None
+    budget: int = None
+    # имя -> тело функции, которую можно подставить
+    functions: dict = None
+    # функции, вызовы которых были подставлены
+    inlined: set = None
+
+    def __init__(self, max_size: int, budget: int = INLINE_BUDGET):
+        self.max_size = max_size
+        self.budget = budget
+        self.functions = {}
+        self.inlined = set()
+
+    def run(self, program: list) -> list:
+        result = []
+        for node in program:
+            result.extend(self.expand(node))
+            if isinstance(node, Expr) and node.head == "def_func":
+                self.declare(result[-1])
+
+        names = set()
+        for node in result:
+            if isinstance(node, Expr) and node.head == "def_func":
+                for item in node.items[2:]:
+                    referenced_names(item, names)
+            else:
+                referenced_names(node, names)
+        return [
+            node
+            for node in result
+            if not (
+                isinstance(node, Expr)
+                and node.head == "def_func"
+                and node.items[1].name in self.inlined
+                and node.items[1].name not in names
+            )
+        ]
+
+    def declare(self, node: Expr):
+        if len(node.items) < 2 or not isinstance(node.items[1], Symbol):
+            return
+        name = node.items[1].name
+        body = node.items[2:]
+        names = set()
+        for item in body:
+            referenced_names(item, names)
+        if name in names or any(map(declares, body)):
+            return
+        if sum(map(node_size, body)) <= self.max_size:
+            self.functions[name] = body
+
+    # узел после подстановок - список, тк тело функции может быть из
+    # нескольких выражений
+    def expand(self, node: Node) -> list:
+        if not isinstance(node, Expr):
+            return [node]
+        items = []
+        for item in node.items:
+            items.extend(self.expand(item))
+        node = Expr(items, node.line, node.column)
+
+        body = self.functions.get(node.head)
+        if body is None or not self.is_inlinable_call(node):
+            return [node]
+        growth = sum(map(node_size, body)) - node_size(node)
+        if growth > self.budget:
+            return [node]
+        self.budget -= max(growth, 0)
+        self.inlined.add(node.head)
+        argument = argument_value(node.items[1])
+        return [substitute(item, argument) for item in body]
+
+    # вызов с одним аргументом @name - как его генерирует транслятор
+    @staticmethod
+    def is_inlinable_call(node: Expr) -> bool:
+        return (
+            len(node.items) == 2
+            and isinstance(node.items[1], Symbol)
+            and node.items[1].name.startswith("@")
+        )
+
+
+def inline(program: list, max_size: int, budget: int = INLINE_BUDGET) -> list:
+    return Inliner(max_size, budget).run(program)
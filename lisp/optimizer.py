@@ -0,0 +1,239 @@
+from bisect import bisect_left
+
+from machine.datapath import ALU_OPERATIONS, wrap
+from machine.isa import ALU, OPERANDS, STACK_EFFECTS, Opcode
+
+# операнд - адрес кода (у JNE - второй)
+JUMPS = {Opcode.JMP: 0, Opcode.JZ: 0, Opcode.CALL: 0, Opcode.JNE: 1}
+
+# после них поток управления не идёт к следующей инструкции по порядку
+TERMINATORS = {
+    Opcode.JMP,
+    Opcode.JZ,
+    Opcode.JNE,
+    Opcode.CALL,
+    Opcode.RET,
+    Opcode.HLT,
+    Opcode.IRET,
+}
+
+ALU_OPCODES = {
+    Opcode.ADD: ALU.ADD,
+    Opcode.SUB: ALU.SUB,
+    Opcode.MOD: ALU.MOD,
+    Opcode.EQ: ALU.EQ,
+    Opcode.OR: ALU.OR,
+}
+
+IMMEDIATE = {
+    Opcode.ADD: Opcode.ADDI,
+    Opcode.SUB: Opcode.SUBI,
+    Opcode.MOD: Opcode.MODI,
+    Opcode.EQ: Opcode.EQI,
+    Opcode.OR: Opcode.ORI,
+}
+
+
+# Инструкция промежуточного представления. origin - адрес в исходной
+# последовательности токенов: по нему пересчитываются метки и переходы
+class Instruction:
+    opcode: Opcode = None
+    operands: list = None
+    origin: int = None
+
+    def __init__(self, opcode: Opcode, operands: list, origin: int):
+        self.opcode = opcode
+        self.operands = operands
+        self.origin = origin
+
+    def __repr__(self):
+        return f"{self.origin}: {self.opcode.name} {self.operands}"
+
+
+def to_instructions(code: list) -> list:
+    instructions = []
+    addr = 0
+    while addr < len(code):
+        opcode = code[addr]
+        assert isinstance(opcode, Opcode), f"Expected opcode at {addr}: {opcode}"
+        size = OPERANDS.get(opcode, 0)
+        instructions.append(Instruction(opcode, code[addr + 1 : addr + 1 + size], addr))
+        addr += 1 + size
+    return instructions
+
+
+# Оптимизатор последовательности токенов между translate_stage_1 и
+# translate_stage_2. Адреса кода (метки, функции, start, числовые операнды
+# переходов) пересчитываются, переменные данных сдвигаются вслед за кодом.
+# Код, вычисляющий адреса инструкций сам, после оптимизации может сломаться.
+class PeepholeOptimizer:
+    variables: dict = None
+    instructions: list = None
+    # длина исходной последовательности токенов
+    size: int = None
+    # адреса исходной последовательности, на которые есть переходы
+    targets: set = None
+
+    def __init__(self, variables: dict, code: list):
+        self.variables = variables
+        self.instructions = to_instructions(code)
+        self.size = len(code)
+        self.targets = {addr for addr in variables.values() if addr < self.size}
+        for instruction in self.instructions:
+            if instruction.opcode in JUMPS:
+                target = instruction.operands[JUMPS[instruction.opcode]]
+                if isinstance(target, int):
+                    self.targets.add(target)
+
+    # на инструкцию можно перейти, минуя предыдущую
+    def is_target(self, instruction: Instruction) -> bool:
+        return instruction.origin in self.targets
+
+    def run(self):
+        self.fold_constants()
+        self.remove_dead_jumps()
+        self.fuse_store()
+        self.fuse_pairs()
+
+    # PUSH a; PUSH b; ALU -> PUSH (a op b) для числовых a и b
+    def fold_constants(self):
+        result = []
+        for instruction in self.instructions:
+            result.append(instruction)
+            while len(result) >= 3:
+                left, right, operation = result[-3:]
+                if not (
+                    operation.opcode in ALU_OPCODES
+                    and left.opcode is Opcode.PUSH
+                    and right.opcode is Opcode.PUSH
+                    and isinstance(left.operands[0], int)
+                    and isinstance(right.operands[0], int)
+                    and not self.is_target(right)
+                    and not self.is_target(operation)
+                ):
+                    break
+                a, b = left.operands[0], right.operands[0]
+                if operation.opcode is Opcode.MOD and b == 0:
+                    break
+                value = wrap(ALU_OPERATIONS[ALU_OPCODES[operation.opcode]](a, b))
+                result[-3:] = [Instruction(Opcode.PUSH, [value], left.origin)]
+        self.instructions = result
+
+    # JMP на следующую инструкцию (пустая ветка else)
+    def remove_dead_jumps(self):
+        origins = [instruction.origin for instruction in self.instructions]
+        result = []
+        for index, instruction in enumerate(self.instructions):
+            if instruction.opcode is Opcode.JMP:
+                target = self.resolve(instruction.operands[0])
+                if bisect_left(origins, target) == index + 1:
+                    continue
+            result.append(instruction)
+        self.instructions = result
+
+    # PUSH addr; <вычисление значения>; STORE_VAL -> <вычисление>; STORE addr.
+    # Между ними стек не опускается ниже адреса и нет входов и переходов
+    def fuse_store(self):
+        instructions = self.instructions
+        removed = set()
+        for index, instruction in enumerate(instructions):
+            if instruction.opcode is not Opcode.PUSH:
+                continue
+            depth = 1
+            for store in range(index + 1, len(instructions)):
+                current = instructions[store]
+                if self.is_target(current) or current.opcode in TERMINATORS:
+                    break
+                if current.opcode is Opcode.STORE_VAL and depth == 2:
+                    removed.add(index)
+                    instructions[store] = Instruction(
+                        Opcode.STORE, instruction.operands, current.origin
+                    )
+                    break
+                pops, pushes = STACK_EFFECTS[current.opcode]
+                depth -= pops
+                if depth < 1:
+                    break
+                depth += pushes
+        self.instructions = [
+            instruction
+            for index, instruction in enumerate(instructions)
+            if index not in removed
+        ]
+
+    # пары инструкций в одну: LOAD, АЛУ с операндом, JNE
+    def fuse_pairs(self):
+        result = []
+        for instruction in self.instructions:
+            previous = result[-1] if result else None
+            fused = None
+            if previous is not None and not self.is_target(instruction):
+                fused = fuse(previous, instruction)
+            if fused is None:
+                result.append(instruction)
+            else:
+                result[-1] = fused
+        self.instructions = result
+
+    # адрес исходной последовательности для операнда перехода
+    def resolve(self, target) -> int:
+        if isinstance(target, int):
+            return target
+        return self.variables.get(target, -1)
+
+    # последовательность токенов и пересчитанные адреса
+    def emit(self, start: int, lines: list = ()) -> tuple:
+        origins = [instruction.origin for instruction in self.instructions]
+        addresses = []
+        size = 0
+        for instruction in self.instructions:
+            addresses.append(size)
+            size += 1 + len(instruction.operands)
+        addresses.append(size)
+
+        def relocate(addr: int) -> int:
+            return addresses[bisect_left(origins, addr)]
+
+        code = []
+        for instruction in self.instructions:
+            operands = list(instruction.operands)
+            if instruction.opcode in JUMPS:
+                position = JUMPS[instruction.opcode]
+                if isinstance(operands[position], int):
+                    operands[position] = relocate(operands[position])
+            code.append(instruction.opcode)
+            code.extend(operands)
+
+        variables = {}
+        for name, addr in self.variables.items():
+            if addr < self.size:
+                variables[name] = relocate(addr)
+            else:
+                variables[name] = addr - self.size + size
+
+        # удалённая инструкция уходит в следующую: у адреса остаётся последняя строка
+        relocated = []
+        for addr, line in lines:
+            addr = relocate(addr)
+            if relocated and relocated[-1][0] == addr:
+                relocated.pop()
+            if not relocated or relocated[-1][1] != line:
+                relocated.append([addr, line])
+        return variables, code, relocate(start), relocated
+
+
+def fuse(first: Instruction, second: Instruction) -> Instruction:
+    if first.opcode is Opcode.PUSH:
+        if second.opcode is Opcode.GET_VAL:
+            return Instruction(Opcode.LOAD, first.operands, first.origin)
+        if second.opcode in IMMEDIATE:
+            return Instruction(IMMEDIATE[second.opcode], first.operands, first.origin)
+    if first.opcode is Opcode.EQI and second.opcode is Opcode.JZ:
+        return Instruction(Opcode.JNE, first.operands + second.operands, first.origin)
+    return None
+
+
+def optimize(variables: dict, code: list, start: int, lines: list = ()) -> tuple:
+    optimizer = PeepholeOptimizer(variables, code)
+    optimizer.run()
+    return optimizer.emit(start, lines)
@@ -0,0 +1,131 @@
+import re
+
+# Токены: скобка, строка, комментарий (от ";" до конца строки) или атом.
+# Пробелы и табуляции только разделяют токены, строки не переносятся
+TOKEN = re.compile(r'[()]|"[^"]*"?|;.*|[^\s();"]+')
+
+# вложенность выражений: с запасом под рекурсию генерации кода (три кадра
+# стека на уровень) при стандартном пределе в 1000 кадров
+MAX_DEPTH = 200
+
+
+def is_number(text: str) -> bool:
+    return text.lstrip("-").isdecimal() and text.count("-") <= 1
+
+
+# разбить текст на токены (текст, строка, столбец) за один проход
+def tokenize(text: str):
+    for line, source in enumerate(text.splitlines(), 1):
+        for match in TOKEN.finditer(source):
+            token = match.group()
+            if token[0] == ";":
+                break
+            if token[0] == '"' and (len(token) == 1 or token[-1] != '"'):
+                raise SyntaxError(f"{line}:{match.start() + 1}: unclosed string")
+            yield token, line, match.start() + 1
+
+
+# Узлы AST. У каждого - позиция в исходном тексте
+class Node:
+    line: int = None
+    column: int = None
+
+    def position(self) -> str:
+        return f"{self.line}:{self.column}"
+
+
+# имя или ключевое слово: get_val, do, $1, @name ...
+class Symbol(Node):
+    name: str = None
+
+    def __init__(self, name: str, line: int = None, column: int = None):
+        self.name = name
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return self.name
+
+
+class Number(Node):
+    value: int = None
+
+    def __init__(self, value: int, line: int = None, column: int = None):
+        self.value = value
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return str(self.value)
+
+
+class String(Node):
+    value: str = None
+
+    def __init__(self, value: str, line: int = None, column: int = None):
+        self.value = value
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return f'"{self.value}"'
+
+
+# s-выражение (head args...)
+class Expr(Node):
+    items: list = None
+
+    def __init__(self, items: list, line: int = None, column: int = None):
+        self.items = items
+        self.line = line
+        self.column = column
+
+    # имя формы, если выражение начинается с символа
+    @property
+    def head(self) -> str:
+        if self.items and isinstance(self.items[0], Symbol):
+            return self.items[0].name
+        return None
+
+    @property
+    def args(self) -> list:
+        return self.items[1:]
+
+    def __repr__(self):
+        return "(" + " ".join(map(repr, self.items)) + ")"
+
+
+def is_symbol(node: Node, name: str) -> bool:
+    return isinstance(node, Symbol) and node.name == name
+
+
+# Рекурсивный спуск. Генерация кода и подстановка тоже обходят дерево
+# рекурсивно, поэтому вложенность ограничена MAX_DEPTH: слишком глубокий
+# текст - ошибка разбора с позицией, а не RecursionError в трансляции.
+#   program ::= {node}
+#   node    ::= "(" {node} ")" | string | number | symbol
+def parse(text: str) -> list:
+    tokens = tokenize(text)
+    return [parse_node(token, tokens, 1) for token in tokens]
+
+
+# узел, начинающийся с token; вложенные выражения дочитываются из tokens
+def parse_node(token: tuple, tokens, depth: int) -> Node:
+    text, line, column = token
+    first = text[0]
+    if first == "(":
+        if depth > MAX_DEPTH:
+            raise SyntaxError(f"{line}:{column}: nesting deeper than {MAX_DEPTH}")
+        items = []
+        for item in tokens:
+            if item[0] == ")":
+                return Expr(items, line, column)
+            items.append(parse_node(item, tokens, depth + 1))
+        raise SyntaxError(f"{line}:{column}: unclosed '('")
+    if first == ")":
+        raise SyntaxError(f"{line}:{column}: unexpected ')'")
+    if first == '"':
+        return String(text[1:-1], line, column)
+    if is_number(text):
+        return Number(int(text), line, column)
+    return Symbol(text, line, column)
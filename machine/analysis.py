@@ -0,0 +1,863 @@
+import heapq
+import math
+
+from machine.control_unit import TICKS
+from machine.datapath import wrap
+from machine.image import Image, source_line
+from machine.isa import (
+    MAP_INPUT_ADDRESS,
+    MAP_OUTPUT_ADDRESS,
+    OPERANDS,
+    STACK_EFFECTS,
+    Opcode,
+)
+from machine.profiler import ROOT
+
+# условные переходы по вершине стека
+BRANCHES = {Opcode.JZ, Opcode.JNE}
+# завершают функцию, обработчик или программу
+EXITS = {Opcode.RET, Opcode.HLT, Opcode.IRET}
+# после них исполнение не продолжается со следующего адреса
+ENDS = {Opcode.JMP} | EXITS
+
+PORTS = {MAP_INPUT_ADDRESS, MAP_OUTPUT_ADDRESS}
+
+# Оценки тактов - пары (минимум, максимум) для модели без кеша, конвейера и
+# прерываний (такты TICKS). Максимум math.inf - не ограничен (цикл без
+# распознанного счётчика, рекурсия), минимум math.inf - не завершается.
+
+
+# Базовый блок: инструкции от entry до end, переходы и сведения для оценок
+class BasicBlock:
+    entry: int = None
+    end: int = None
+    # [(адрес, опкод, операнды)]
+    instructions: list = None
+    successors: list = None
+    # такты инструкций блока без вызовов и передач DMA
+    ticks: int = None
+    # такты передач DMA
+    transfers: tuple = None
+    calls: list = None
+    # последняя инструкция завершает функцию или программу
+    exit: bool = None
+    halts: bool = None
+    # читает порт ввода: в конце ввода программа останавливается здесь
+    reads_input: bool = None
+    # значение, проверяемое условным переходом в конце блока
+    condition: tuple = None
+    # до n слов READ_BUF (None - неизвестно) и адреса строк WRITE_STR
+    buffers: list = None
+    strings: list = None
+    # с вызовами функций
+    cost: tuple = None
+
+    def __init__(self, entry: int):
+        self.entry = entry
+        self.instructions = []
+        self.successors = []
+        self.ticks = 0
+        self.transfers = (0, 0)
+        self.calls = []
+        self.exit = False
+        self.halts = False
+        self.reads_input = False
+        self.buffers = []
+        self.strings = []
+
+
+# Естественный цикл: заголовок, тело и переходы на заголовок (latches)
+class Loop:
+    header: int = None
+    blocks: set = None
+    latches: set = None
+    parent: "Loop" = None
+    depth: int = None
+    # переменная-счётчик и (наименьшее, наибольшее) число итераций
+    counter: int = None
+    iterations: tuple = None
+    # такты одной итерации и цикла целиком
+    iteration: tuple = None
+    cost: tuple = None
+
+    def __init__(self, header: int):
+        self.header = header
+        self.blocks = {header}
+        self.latches = set()
+        self.depth = 1
+
+
+class Function:
+    name: str = None
+    entry: int = None
+    # адрес -> BasicBlock, достижимые из entry без входа в вызовы
+    blocks: dict = None
+    predecessors: dict = None
+    # блок -> интервал обхода дерева доминаторов
+    dominators: dict = None
+    # по вложенности: внутренние раньше внешних
+    loops: list = None
+    # блок -> самый внутренний цикл
+    innermost: dict = None
+    callees: set = None
+    cost: tuple = None
+    recursive: bool = None
+    reads_input: bool = None
+    halts: bool = None
+
+    def __init__(self, name: str, entry: int):
+        self.name = name
+        self.entry = entry
+        self.blocks = {}
+        self.loops = []
+        self.innermost = {}
+        self.callees = set()
+        self.recursive = False
+
+    # a доминирует над b: b в поддереве a дерева доминаторов
+    def dominates(self, a: int, b: int) -> bool:
+        enter, leave = self.dominators[a]
+        return enter <= self.dominators[b][0] and self.dominators[b][1] <= leave
+
+
+# Запись в память: блок, адрес (None - неизвестен), число слов и значение
+class Write:
+    block: int = None
+    addr: int = None
+    size: int = None
+    value: tuple = None
+    # наибольшая длина, записанная READ_BUF в первое слово
+    limit: int = None
+
+    def __init__(
+        self, block: int, addr: int, size: int, value: tuple, limit: int = None
+    ):
+        self.block = block
+        self.addr = addr
+        self.size = size
+        self.value = value
+        self.limit = limit
+
+    def covers(self, addr: int) -> bool:
+        return self.addr is None or self.addr <= addr < self.addr + self.size
+
+
+# Узел области при поиске путей: блок или вложенный цикл целиком
+class _Node:
+    cost: tuple = None
+    targets: set = None
+    # переход на заголовок области, выход из неё, конец функции
+    latch: bool = None
+    leave: bool = None
+    exit: bool = None
+
+    def __init__(self, cost: tuple):
+        self.cost = cost
+        self.targets = set()
+        self.latch = False
+        self.leave = False
+        self.exit = False
+
+
+# Статический анализ образа: граф потока управления по кодированию
+# переходов, такты базовых блоков, функций и циклов. Число итераций цикла
+# известно, если он проверяет в заголовке переменную (v + c != 0 для JZ,
+# v != n для JNE), переменная меняется на константу ровно раз за итерацию
+# и больше нигде не пишется, кроме констант вне цикла. Значения
+# абстрактного стека: (None, n) - константа, (адрес, n) - M[адрес] + n.
+class Analysis:
+    image: Image = None
+    memory: list = None
+    symbols: dict = None
+    # точка входа -> имя
+    entries: dict = None
+    blocks: dict = None
+    functions: dict = None
+    writes: list = None
+    # записи в одно слово по адресу; по неизвестному адресу и блоками
+    words: dict = None
+    ranges: list = None
+    # есть запись по неизвестному адресу
+    unknown_writes: bool = None
+    # запись может попасть в код: граф потока управления недостоверен
+    self_modifying: bool = None
+
+    _active: set = None
+
+    def __init__(self, image: Image, symbols: dict = None):
+        self.image = image
+        self.memory = image.memory().tolist()
+        self.symbols = (image.symbols if symbols is None else symbols) or {}
+        self.entries = {image.start: ROOT}
+        for kind in ("harts", "handlers", "functions"):
+            for name, addr in self.symbols.get(kind, {}).items():
+                self.entries.setdefault(addr, name)
+        self.blocks = {}
+        self.functions = {}
+        self.writes = []
+        self._active = set()
+
+        self._build_blocks()
+        for block in self.blocks.values():
+            self._interpret(block)
+        self.words = {}
+        self.ranges = []
+        for write in self.writes:
+            if write.addr is not None and write.size == 1:
+                self.words.setdefault(write.addr, []).append(write)
+            else:
+                self.ranges.append(write)
+        self.unknown_writes = any(write.addr is None for write in self.writes)
+        self.self_modifying = any(self._modifies_code(write) for write in self.writes)
+        for block in self.blocks.values():
+            self._transfers(block)
+        for entry, name in self.entries.items():
+            self.functions[entry] = self._function(name, entry)
+        self._propagate()
+        for function in self.functions.values():
+            self._function_cost(function)
+
+    def _decode(self, pc: int):
+        if not 0 <= pc < len(self.memory):
+            return None
+        try:
+            opcode = Opcode(self.memory[pc])
+        except ValueError:
+            return None
+        operands = OPERANDS.get(opcode, 0)
+        if pc + operands >= len(self.memory):
+            return None
+        return opcode, self.memory[pc + 1 : pc + 1 + operands]
+
+    # инструкции, достижимые из точек входа, и начала базовых блоков;
+    # недопустимая инструкция (None) останавливает модель
+    def _build_blocks(self):
+        instructions = {}
+        leaders = set(self.entries)
+        work = list(self.entries)
+        while work:
+            pc = work.pop()
+            while pc not in instructions:
+                decoded = self._decode(pc)
+                instructions[pc] = decoded
+                if decoded is None:
+                    break
+                opcode, operands = decoded
+                next_pc = pc + 1 + len(operands)
+                if opcode in (Opcode.JMP, Opcode.JZ, Opcode.JNE, Opcode.CALL):
+                    target = operands[-1]
+                    leaders.add(target)
+                    work.append(target)
+                    if opcode is Opcode.CALL:
+                        self.entries.setdefault(target, f"func_{target}")
+                if opcode in BRANCHES:
+                    leaders.add(next_pc)
+                if opcode in ENDS:
+                    break
+                pc = next_pc
+
+        for entry in sorted(leaders):
+            block = BasicBlock(entry)
+            pc = entry
+            while True:
+                decoded = instructions[pc]
+                if decoded is None:
+                    block.exit = True
+                    break
+                opcode, operands = decoded
+                block.instructions.append((pc, opcode, operands))
+                pc += 1 + len(operands)
+                if opcode is Opcode.CALL:
+                    block.calls.append(operands[0])
+                if opcode in BRANCHES:
+                    block.successors = list(dict.fromkeys([operands[-1], pc]))
+                    break
+                if opcode is Opcode.JMP:
+                    block.successors = [operands[0]]
+                    break
+                if opcode in EXITS:
+                    block.exit = True
+                    block.halts = opcode is Opcode.HLT
+                    break
+                if pc in leaders:
+                    block.successors = [pc]
+                    break
+            block.end = pc
+            self.blocks[entry] = block
+
+    # такты блока и его абстрактное исполнение на стеке констант и
+    # переменных со сдвигом
+    def _interpret(self, block: BasicBlock):
+        stack = []
+
+        def pop():
+            return stack.pop() if stack else None
+
+        def variable(addr: int):
+            return None if addr in PORTS else (addr, 0)
+
+        def shift(value, n: int):
+            if value is None:
+                return None
+            if value[0] is None:
+                return None, wrap(value[1] + n)
+            return value[0], value[1] + n
+
+        for _, opcode, operands in block.instructions:
+            block.ticks += TICKS[opcode]
+            if opcode is Opcode.PUSH:
+                stack.append((None, operands[0]))
+            elif opcode is Opcode.LOAD:
+                block.reads_input |= operands[0] == MAP_INPUT_ADDRESS
+                stack.append(variable(operands[0]))
+            elif opcode is Opcode.GET_VAL:
+                addr = pop()
+                # ввод читается по постоянному адресу: указатели на порт
+                # не отслеживаются
+                if addr is not None and addr[0] is None:
+                    block.reads_input |= addr[1] == MAP_INPUT_ADDRESS
+                    stack.append(variable(addr[1]))
+                else:
+                    stack.append(None)
+            elif opcode in (Opcode.ADDI, Opcode.SUBI):
+                n = operands[0] if opcode is Opcode.ADDI else -operands[0]
+                stack.append(shift(pop(), n))
+            elif opcode in (Opcode.ADD, Opcode.SUB):
+                right = pop()
+                left = pop()
+                if right is not None and right[0] is None:
+                    n = right[1] if opcode is Opcode.ADD else -right[1]
+                    stack.append(shift(left, n))
+                elif opcode is Opcode.ADD and left is not None and left[0] is None:
+                    stack.append(shift(right, left[1]))
+                else:
+                    stack.append(None)
+            elif opcode is Opcode.STORE:
+                self._write(block, (None, operands[0]), 1, pop())
+            elif opcode is Opcode.STORE_VAL:
+                value = pop()
+                self._write(block, pop(), 1, value)
+            elif opcode is Opcode.XADD:
+                pop()
+                self._write(block, pop(), 1, None)
+                stack.append(None)
+            elif opcode is Opcode.READ_BUF:
+                n = pop()
+                n = n[1] if n is not None and n[0] is None else None
+                block.reads_input = True
+                block.buffers.append(n)
+                size = None if n is None else max(n, 0) + 1
+                self._write(block, pop(), size, None, n)
+            elif opcode is Opcode.WRITE_STR:
+                addr = pop()
+                block.strings.append(addr[1] if addr and addr[0] is None else None)
+            elif opcode in BRANCHES:
+                block.condition = pop()
+            else:
+                pops, pushes = STACK_EFFECTS[opcode]
+                for _ in range(pops):
+                    pop()
+                stack.extend([None] * pushes)
+
+    def _write(
+        self, block: BasicBlock, addr: tuple, size: int, value: tuple, limit=None
+    ):
+        if addr is None or addr[0] is not None or size is None:
+            self.writes.append(Write(block.entry, None, 0, value))
+        else:
+            self.writes.append(Write(block.entry, addr[1], size, value, limit))
+
+    # запись по неизвестному адресу или в слова кода (кроме порта вывода);
+    # отрицательные адреса - с конца образа
+    def _modifies_code(self, write: Write) -> bool:
+        if write.addr is None:
+            return True
+        code = len(self.image.code)
+        shift = len(self.memory)
+        for begin, end in ((0, code), (-shift, code - shift)):
+            first = max(write.addr, begin)
+            last = min(write.addr + write.size, end)
+            if first < last and (first, last) != (
+                MAP_OUTPUT_ADDRESS,
+                MAP_OUTPUT_ADDRESS + 1,
+            ):
+                return True
+        return False
+
+    def _writes_to(self, addr: int) -> list:
+        ranges = [write for write in self.ranges if write.covers(addr)]
+        return self.words.get(addr, []) + ranges
+
+    # READ_BUF передаёт до n слов ввода; WRITE_STR - длину строки по
+    # постоянному адресу: из образа, если в него не пишут, или не больше
+    # длин, записанных READ_BUF
+    def _transfers(self, block: BasicBlock):
+        low, high = 0, 0
+        for n in block.buffers:
+            high += math.inf if n is None else max(n, 0)
+        for addr in block.strings:
+            writes = [] if addr is None else self._writes_to(addr)
+            if addr is None or any(
+                write.addr != addr or write.limit is None for write in writes
+            ):
+                high = math.inf
+                continue
+            length = max(self._initial(addr), 0)
+            low += 0 if writes else length
+            high += max([length] + [write.limit for write in writes])
+        block.transfers = (low, high)
+
+    # слово образа до исполнения; BSS обнулена
+    def _initial(self, addr: int) -> int:
+        return self.memory[addr] if 0 <= addr < len(self.memory) else 0
+
+    def _function(self, name: str, entry: int) -> Function:
+        function = Function(name, entry)
+        work = [entry]
+        while work:
+            addr = work.pop()
+            if addr in function.blocks:
+                continue
+            block = self.blocks[addr]
+            function.blocks[addr] = block
+            function.callees.update(block.calls)
+            work.extend(block.successors)
+        self._dominators(function)
+        self._loops(function)
+        return function
+
+    # дерево доминаторов (Cooper, Harvey, Kennedy) по обратному постпорядку и
+    # интервалы обхода дерева для проверки доминирования
+    def _dominators(self, function: Function):
+        postorder = []
+        visited = {function.entry}
+        stack = [(function.entry, iter(function.blocks[function.entry].successors))]
+        while stack:
+            addr, successors = stack[-1]
+            successor = next(successors, None)
+            if successor is None:
+                stack.pop()
+                postorder.append(addr)
+            elif successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(function.blocks[successor].successors)))
+        order = postorder[::-1]
+        index = {addr: i for i, addr in enumerate(order)}
+        predecessors = {addr: [] for addr in order}
+        for addr in order:
+            for successor in function.blocks[addr].successors:
+                predecessors[successor].append(addr)
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while index[a] > index[b]:
+                    a = idom[a]
+                while index[b] > index[a]:
+                    b = idom[b]
+            return a
+
+        idom = {function.entry: function.entry}
+        changed = True
+        while changed:
+            changed = False
+            for addr in order[1:]:
+                new = None
+                for predecessor in predecessors[addr]:
+                    if predecessor in idom:
+                        new = (
+                            predecessor if new is None else intersect(predecessor, new)
+                        )
+                if idom.get(addr) != new:
+                    idom[addr] = new
+                    changed = True
+
+        children = {addr: [] for addr in order}
+        for addr in order[1:]:
+            children[idom[addr]].append(addr)
+        function.predecessors = predecessors
+        function.dominators = {}
+        counter = 0
+        stack = [(function.entry, iter(children[function.entry]))]
+        enter = {function.entry: 0}
+        while stack:
+            addr, nodes = stack[-1]
+            child = next(nodes, None)
+            counter += 1
+            if child is None:
+                stack.pop()
+                function.dominators[addr] = (enter[addr], counter)
+            else:
+                enter[child] = counter
+                stack.append((child, iter(children[child])))
+
+    # циклы по обратным переходам (на доминирующий блок), один на заголовок
+    def _loops(self, function: Function):
+        loops = {}
+        for addr, block in function.blocks.items():
+            for successor in block.successors:
+                if function.dominates(successor, addr):
+                    loop = loops.setdefault(successor, Loop(successor))
+                    loop.latches.add(addr)
+        for loop in loops.values():
+            work = list(loop.latches)
+            while work:
+                addr = work.pop()
+                if addr not in loop.blocks:
+                    loop.blocks.add(addr)
+                    work.extend(function.predecessors[addr])
+
+        # внешние раньше внутренних: самый внутренний из уже пройденных
+        # циклов, содержащих заголовок, - объемлющий
+        function.loops = sorted(loops.values(), key=lambda loop: -len(loop.blocks))
+        for loop in function.loops:
+            loop.parent = function.innermost.get(loop.header)
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+            for addr in loop.blocks:
+                function.innermost[addr] = loop
+        function.loops.reverse()
+
+    # чтение ввода и остановка - с учётом вызываемых функций
+    def _propagate(self):
+        for function in self.functions.values():
+            blocks = function.blocks.values()
+            function.reads_input = any(block.reads_input for block in blocks)
+            function.halts = any(block.halts for block in blocks)
+        changed = True
+        while changed:
+            changed = False
+            for function in self.functions.values():
+                callees = [self.functions[callee] for callee in function.callees]
+                reads_input = any(callee.reads_input for callee in callees)
+                halts = any(callee.halts for callee in callees)
+                if (reads_input and not function.reads_input) or (
+                    halts and not function.halts
+                ):
+                    function.reads_input |= reads_input
+                    function.halts |= halts
+                    changed = True
+
+    def _function_cost(self, function: Function) -> tuple:
+        if function.cost is not None:
+            return function.cost
+        if function.entry in self._active:
+            function.recursive = True
+            return 0, math.inf
+        self._active.add(function.entry)
+        for block in function.blocks.values():
+            low = block.ticks + block.transfers[0]
+            high = block.ticks + block.transfers[1]
+            for callee in block.calls:
+                callee_low, callee_high = self._function_cost(self.functions[callee])
+                low += callee_low
+                high += callee_high
+            block.cost = (low, high)
+        for loop in function.loops:
+            self._counter(function, loop)
+            self._loop_cost(function, loop)
+        self._active.discard(function.entry)
+
+        low, high = self._paths(function, None, "exit")
+        # без пути к выходу функция не завершается
+        if high == -math.inf:
+            high = math.inf
+        function.cost = (low, high)
+        return function.cost
+
+    def _loop_cost(self, function: Function, loop: Loop):
+        loop.iteration = self._paths(function, loop, "latch")
+        exit_low, exit_high = self._paths(function, loop, "leave")
+        if loop.iterations is None:
+            loop.cost = (exit_low, math.inf)
+            return
+        low, high = loop.iterations
+        loop.cost = (
+            exit_low + (low * loop.iteration[0] if low else 0),
+            exit_high + (high * loop.iteration[1] if high else 0),
+        )
+
+    # узел области: блок или вложенный в неё цикл (по его заголовку)
+    def _node(self, function: Function, loop: Loop, addr: int):
+        inner = function.innermost.get(addr)
+        if inner is None or inner is loop:
+            return addr, None
+        while inner.parent is not loop:
+            inner = inner.parent
+        return inner.header, inner
+
+    # (минимум, максимум) тактов путей от заголовка области (тела цикла или
+    # функции) до цели: latch - переход на заголовок цикла, leave - выход из
+    # цикла или конец функции, exit - конец функции. Вложенные циклы уже
+    # свёрнуты в узлы со своей стоимостью
+    def _paths(self, function: Function, loop: Loop, goal: str) -> tuple:
+        members = function.blocks if loop is None else loop.blocks
+        head = function.entry if loop is None else loop.header
+        nodes = {}
+        for addr in members:
+            key, inner = self._node(function, loop, addr)
+            node = nodes.get(key)
+            if node is None:
+                cost = function.blocks[addr].cost if inner is None else inner.cost
+                node = nodes[key] = _Node(cost)
+            block = function.blocks[addr]
+            node.exit |= block.exit
+            for successor in block.successors:
+                if loop is not None and successor == head:
+                    node.latch = True
+                elif successor not in members:
+                    node.leave = True
+                else:
+                    target, _ = self._node(function, loop, successor)
+                    if target != key:
+                        node.targets.add(target)
+
+        # обратный топологический порядок; цикл внутри области (неприводимый
+        # граф) - оценка не строится
+        order = []
+        state = {head: 0}
+        stack = [(head, iter(sorted(nodes[head].targets)))]
+        while stack:
+            key, targets = stack[-1]
+            target = next(targets, None)
+            if target is None:
+                stack.pop()
+                state[key] = 1
+                order.append(key)
+            elif target not in state:
+                state[target] = 0
+                stack.append((target, iter(sorted(nodes[target].targets))))
+            elif state[target] == 0:
+                return 0, math.inf
+
+        paths = {}
+        for key in order:
+            node = nodes[key]
+            if goal == "latch":
+                reached = node.latch
+            elif goal == "leave":
+                reached = node.leave or node.exit
+            else:
+                reached = node.exit
+            low = 0 if reached else math.inf
+            high = 0 if reached else -math.inf
+            for target in node.targets:
+                low = min(low, paths[target][0])
+                high = max(high, paths[target][1])
+            paths[key] = (node.cost[0] + low, node.cost[1] + high)
+        return paths[head]
+
+    # Счётчик цикла и число итераций для каждого из возможных начальных
+    # значений: из образа, записанных вне цикла констант и конечного значения
+    # (при повторном входе в цикл)
+    def _counter(self, function: Function, loop: Loop):
+        header = function.blocks[loop.header]
+        if not header.instructions or self.unknown_writes:
+            return
+        _, opcode, operands = header.instructions[-1]
+        condition = header.condition
+        if opcode not in BRANCHES or condition is None or condition[0] is None:
+            return
+        counter, offset = condition
+        target_inside = operands[-1] in loop.blocks
+        if opcode is Opcode.JZ and target_inside is False and header.end in loop.blocks:
+            until = -offset
+        elif opcode is Opcode.JNE and target_inside and header.end not in loop.blocks:
+            until = operands[0] - offset
+        else:
+            return
+        for addr in loop.blocks:
+            if addr != loop.header and any(
+                successor not in loop.blocks
+                for successor in function.blocks[addr].successors
+            ):
+                return
+
+        writes = self._writes_to(counter)
+        inside = [write for write in writes if write.block in loop.blocks]
+        if len(inside) != 1:
+            return
+        update = inside[0]
+        if (
+            update.size != 1
+            or update.value is None
+            or update.value[0] != counter
+            or update.value[1] == 0
+            or update.block == loop.header
+            or function.innermost[update.block] is not loop
+            or any(
+                not function.dominates(update.block, latch) for latch in loop.latches
+            )
+        ):
+            return
+        step = update.value[1]
+
+        starts = set()
+        # запись константы перед циклом на том же уровне вложенности
+        # выполняется перед каждым входом в цикл
+        initial = True
+        reset = False
+        for write in writes:
+            if write is update:
+                continue
+            if (
+                write.block not in function.blocks
+                or write.size != 1
+                or write.value is None
+                or write.value[0] is not None
+            ):
+                return
+            starts.add(write.value[1])
+            if function.dominates(write.block, loop.header):
+                initial = False
+                reset |= function.innermost.get(write.block) is loop.parent
+        if initial:
+            starts.add(self._initial(counter))
+        if not reset and (loop.parent is not None or self._reentrant(function)):
+            starts.add(until)
+
+        counts = []
+        for start in starts:
+            distance = until - start
+            if distance % step != 0 or distance // step < 0:
+                return
+            counts.append(distance // step)
+        loop.counter = counter
+        low = min(counts)
+        # остановка внутри цикла обрывает его раньше
+        stops = any(
+            function.blocks[addr].exit
+            or function.blocks[addr].reads_input
+            or any(
+                self.functions[callee].reads_input or self.functions[callee].halts
+                for callee in function.blocks[addr].calls
+            )
+            for addr in loop.blocks
+        )
+        loop.iterations = (0 if stops else low, max(counts))
+
+    # функция исполняется больше одного раза: вызывается или обработчик
+    def _reentrant(self, function: Function) -> bool:
+        return function.entry in self.symbols.get("handlers", {}).values() or any(
+            function.entry in other.callees for other in self.functions.values()
+        )
+
+    # такты до первой возможной остановки не в конце функции: чтение из
+    # порта ввода (конец ввода) или вызов останавливающей программу функции
+    def _first_stop(self, function: Function):
+        distances = {function.entry: 0}
+        queue = [(0, function.entry)]
+        while queue:
+            distance, addr = heapq.heappop(queue)
+            if distance > distances[addr]:
+                continue
+            block = function.blocks[addr]
+            callees = [self.functions[callee] for callee in block.calls]
+            if block.reads_input or any(
+                callee.reads_input or callee.halts for callee in callees
+            ):
+                return distance
+            for successor in block.successors:
+                new = distance + block.cost[0]
+                if new < distances.get(successor, math.inf):
+                    distances[successor] = new
+                    heapq.heappush(queue, (new, successor))
+        return math.inf
+
+    # (минимум, максимум) тактов программы от начала до остановки; при
+    # самомодификации оценки нет
+    def bounds(self) -> tuple:
+        if self.self_modifying:
+            return 0, math.inf
+        function = self.functions[self.image.start]
+        low, high = function.cost
+        return min(low, self._first_stop(function)), high
+
+    # запуск гарантированно не уложится в лимит тактов
+    def exceeds(self, limit: int) -> bool:
+        return self.bounds()[0] > limit
+
+    def report(self) -> dict:
+        names = {addr: name for name, addr in self.symbols.get("variables", {}).items()}
+
+        def ticks(bounds: tuple) -> list:
+            return [None if math.isinf(value) else value for value in bounds]
+
+        def loop_report(loop: Loop) -> dict:
+            return {
+                "header": loop.header,
+                "line": source_line(self.symbols, loop.header),
+                "depth": loop.depth,
+                "blocks": len(loop.blocks),
+                "counter": names.get(loop.counter, loop.counter),
+                "iterations": None
+                if loop.iterations is None
+                else list(loop.iterations),
+                "iteration_ticks": ticks(loop.iteration),
+                "ticks": ticks(loop.cost),
+            }
+
+        return {
+            "ticks": ticks(self.bounds()),
+            "unknown_writes": self.unknown_writes,
+            "self_modifying": self.self_modifying,
+            "functions": {
+                function.name: {
+                    "entry": function.entry,
+                    "blocks": len(function.blocks),
+                    "recursive": function.recursive,
+                    "ticks": ticks(function.cost),
+                    "loops": [loop_report(loop) for loop in reversed(function.loops)],
+                }
+                for function in self.functions.values()
+            },
+            "blocks": {
+                str(block.entry): {
+                    "end": block.end,
+                    "line": source_line(self.symbols, block.entry),
+                    "ticks": ticks(
+                        (
+                            block.ticks + block.transfers[0],
+                            block.ticks + block.transfers[1],
+                        )
+                    ),
+                    "successors": block.successors,
+                    "calls": block.calls,
+                }
+                for block in sorted(self.blocks.values(), key=lambda block: block.entry)
+            },
+        }
+
+
+def format_ticks(bounds: list) -> str:
+    low, high = bounds
+    low = "inf" if low is None else low
+    high = "inf" if high is None else high
+    return str(low) if low == high else f"{low}..{high}"
+
+
+# отчёт текстом: программа, функции и гнёзда циклов
+def summary(report: dict) -> list:
+    lines = [f"program: ticks {format_ticks(report['ticks'])}"]
+    if report["unknown_writes"]:
+        lines.append("  writes to unknown addresses: loop counters not tracked")
+    if report["self_modifying"]:
+        lines.append("  code may be overwritten: program ticks not bounded")
+    for name, function in report["functions"].items():
+        recursive = " recursive" if function["recursive"] else ""
+        lines.append(
+            f"{name} @{function['entry']}: ticks {format_ticks(function['ticks'])}"
+            f"{recursive}, blocks {function['blocks']}"
+        )
+        for loop in function["loops"]:
+            iterations = loop["iterations"]
+            iterations = "?" if iterations is None else format_ticks(iterations)
+            line = "" if loop["line"] is None else f" line {loop['line']}"
+            counter = "" if loop["counter"] is None else f" counter {loop['counter']}"
+            lines.append(
+                "  " * loop["depth"]
+                + f"loop @{loop['header']}{line}:{counter}"
+                + f" iterations {iterations},"
+                + f" per iteration {format_ticks(loop['iteration_ticks'])},"
+                + f" total {format_ticks(loop['ticks'])}"
+            )
+    return lines
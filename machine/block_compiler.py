@@ -0,0 +1,435 @@
+from machine.control_unit import DISPATCH, TICKS, ControlUnit
+from machine.datapath import Datapath, wrap
+from machine.fetch import FetchUnit
+from machine.interrupts import InterruptController
+from machine.isa import (
+    MAP_INPUT_ADDRESS,
+    MAP_OUTPUT_ADDRESS,
+    MAX_SIGN,
+    MIN_SIGN,
+    OPERANDS,
+    RETURN_STACK_EFFECTS,
+    STACK_EFFECTS,
+    Opcode,
+)
+from machine.stack_cache import StackCache
+
+# инструкции, которыми заканчивается базовый блок
+TERMINATORS = {
+    Opcode.JMP,
+    Opcode.JZ,
+    Opcode.JNE,
+    Opcode.CALL,
+    Opcode.RET,
+    Opcode.HLT,
+    Opcode.IRET,
+}
+
+# длительность зависит от длины передачи - исполняются по шагам, блок
+# заканчивается перед ними
+STEPPED = {Opcode.READ_BUF, Opcode.WRITE_STR}
+
+MAX_BLOCK_LENGTH = 64
+
+ALU_EXPRESSIONS = {
+    Opcode.ADD: "left + right",
+    Opcode.SUB: "left - right",
+    Opcode.MOD: "left % right",
+    Opcode.EQ: "1 if left == right else 0",
+    Opcode.OR: "1 if left or right else 0",
+}
+
+# с непосредственным операндом: left - вершина стека, right - операнд
+IMMEDIATE_EXPRESSIONS = {
+    Opcode.ADDI: ALU_EXPRESSIONS[Opcode.ADD],
+    Opcode.SUBI: ALU_EXPRESSIONS[Opcode.SUB],
+    Opcode.MODI: ALU_EXPRESSIONS[Opcode.MOD],
+    Opcode.EQI: ALU_EXPRESSIONS[Opcode.EQ],
+    Opcode.ORI: ALU_EXPRESSIONS[Opcode.OR],
+}
+
+
+# найти базовый блок, начинающийся с адреса entry: [(адрес, опкод, операнды)]
+def find_basic_block(program: list, entry: int) -> list:
+    block = []
+    pc = entry
+    while len(block) < MAX_BLOCK_LENGTH and 0 <= pc < len(program):
+        try:
+            opcode = Opcode(program[pc])
+        except ValueError:
+            break
+        if opcode in STEPPED:
+            break
+        operands = OPERANDS.get(opcode, 0)
+        if pc + operands >= len(program):
+            break
+        block.append((pc, opcode, list(program[pc + 1 : pc + 1 + operands])))
+        pc += 1 + operands
+        if opcode in TERMINATORS:
+            break
+    return block
+
+
+class Block:
+    entry: int = None
+    end: int = None
+    # тактов до начала последней инструкции блока
+    last_start: int = None
+    function = None
+
+    def __init__(self, entry: int, end: int, last_start: int, function):
+        self.entry = entry
+        self.end = end
+        self.last_start = last_start
+        self.function = function
+
+
+# Исполнение программы базовыми блоками, скомпилированными в функции Python.
+# Счётчики инструкций и тактов, вывод и состояние машины совпадают с пошаговым
+# ControlUnit. Блок выполняется целиком, только если его последняя инструкция
+# начнётся до лимита тактов, иначе - по одной инструкции. Запись в память,
+# занятую скомпилированным блоком, сбрасывает этот блок. Если стеки могут
+# выйти за границы внутри блока, исполняется одна инструкция пошагово - она
+# и сообщит о переполнении.
+class BlockControlUnit(ControlUnit):
+    __slots__ = ("blocks", "owners", "instructions")
+
+    # скомпилированные блоки по адресу входа
+    blocks: dict
+    # адрес слова -> адреса входа блоков, которые его содержат
+    owners: dict
+    instructions: int
+
+    def __init__(
+        self,
+        code: list,
+        start: int,
+        stack_size: int,
+        datapath: Datapath,
+        decoded: list = None,
+        fetch_unit: FetchUnit = None,
+        stack_cache: StackCache = None,
+        interrupts: InterruptController = None,
+    ):
+        super().__init__(
+            code,
+            start,
+            stack_size,
+            datapath,
+            decoded,
+            fetch_unit,
+            stack_cache,
+            interrupts,
+        )
+        self.blocks = {}
+        self.owners = {}
+        self.instructions = 0
+
+    def invalidate(self, addr: int):
+        super().invalidate(addr)
+        if addr < 0:
+            addr += len(self.program)
+        if addr in self.owners:
+            self.drop_blocks(addr)
+
+    def drop_blocks(self, addr: int):
+        for entry in self.owners.pop(addr, ()):
+            block = self.blocks.pop(entry, None)
+            if block is None:
+                continue
+            for word in range(block.entry, block.end):
+                entries = self.owners.get(word)
+                if entries is not None:
+                    entries.discard(entry)
+                    if not entries:
+                        del self.owners[word]
+
+    def run(self, limit: int):
+        blocks = self.blocks
+        while self._tick < limit:
+            block = blocks.get(self.program_counter)
+            if block is None:
+                block = self.compile_block(self.program_counter)
+            if block is None or self._tick + block.last_start >= limit:
+                self.instructions += 1
+                self.decode_and_execute_instruction()
+            else:
+                block.function(self)
+
+    def compile_block(self, entry: int):
+        # задержки кешей зависят от адреса и глубины стеков, прерывания
+        # возникают между любыми инструкциями - такие программы только по шагам
+        if (
+            self.datapath.cache is not None
+            or self.fetch_unit is not None
+            or self.stack_cache is not None
+            or self.interrupts is not None
+        ):
+            return None
+        instructions = find_basic_block(self.program, entry)
+        if not instructions:
+            return None
+
+        addr, opcode, operands = instructions[-1]
+        end = addr + 1 + len(operands)
+        source, last_start = _generate(entry, end, len(self.program), instructions)
+        namespace = {
+            "wrap": wrap,
+            "dispatch_get": DISPATCH.get,
+            "invalid": ControlUnit._invalid,
+            "owners": self.owners,
+            "size": len(self.program),
+        }
+        exec(compile(source, f"<block {entry}>", "exec"), namespace)
+
+        block = Block(entry, end, last_start, namespace["block"])
+        self.blocks[entry] = block
+        for word in range(entry, end):
+            self.owners.setdefault(word, set()).add(entry)
+        return block
+
+
+def _generate(entry: int, end: int, size: int, instructions: list):
+    prefix = [0]
+    raise_ticks = []
+    for _, opcode, _ in instructions:
+        ticks = TICKS[opcode]
+        raise_ticks.append(prefix[-1] + (ticks if opcode is Opcode.HLT else ticks - 1))
+        prefix.append(prefix[-1] + ticks)
+
+    addrs = [addr for addr, _, _ in instructions]
+    words = [opcode.value for _, opcode, _ in instructions]
+
+    lines = [
+        "def block(cu):",
+        "    dp = cu.datapath",
+        "    sp = dp.stack_pointer",
+        "    rsp = cu.return_stack_pointer",
+    ]
+    guard = _stack_guard(instructions)
+    if guard:
+        lines += [
+            f"    if {guard}:",
+            "        cu.instructions += 1",
+            "        cu.decode_and_execute_instruction()",
+            "        return",
+        ]
+    lines += [
+        "    stack = dp.stack",
+        "    rstack = cu.return_stack",
+        "    data = cu.program",
+        "    decoded = cu.decoded",
+        f"    pc = {end}",
+        "    k = 0",
+        "    try:",
+    ]
+    for index, (addr, opcode, operands) in enumerate(instructions):
+        lines.append(f"        # {addr}: {opcode.name} {' '.join(map(str, operands))}")
+        lines.append(f"        k = {index}")
+        exit_lines = [
+            "dp.stack_pointer = sp",
+            "cu.return_stack_pointer = rsp",
+            f"cu.program_counter = {addr + 1 + len(operands)}",
+            f"cu.instruction_register = {opcode.value}",
+            f"cu._tick += {prefix[index + 1]}",
+            f"cu.instructions += {index + 1}",
+            "return",
+        ]
+        body = _instruction(addr, opcode, operands, entry, end, size, exit_lines)
+        lines.extend("        " + line for line in body)
+    lines += [
+        "    except BaseException:",
+        "        dp.stack_pointer = sp",
+        "        cu.return_stack_pointer = rsp",
+        f"        cu.program_counter = {tuple(addrs)}[k] + 1",
+        f"        cu.instruction_register = {tuple(words)}[k]",
+        f"        cu._tick += {tuple(raise_ticks)}[k]",
+        "        cu.instructions += k + 1",
+        "        raise",
+        "    dp.stack_pointer = sp",
+        "    cu.return_stack_pointer = rsp",
+        "    cu.program_counter = pc",
+        f"    cu.instruction_register = {words[-1]}",
+        f"    cu._tick += {prefix[-1]}",
+        f"    cu.instructions += {len(instructions)}",
+    ]
+    return "\n".join(lines) + "\n", prefix[-2]
+
+
+# Условие выхода стеков за границы где-либо в блоке: по наименьшей и
+# наибольшей глубине стеков относительно входа в блок
+def _stack_guard(instructions: list) -> str:
+    conditions = []
+    for pointer, size, effects in (
+        ("sp", "dp.stack_size", STACK_EFFECTS),
+        ("rsp", "cu.return_stack_size", RETURN_STACK_EFFECTS),
+    ):
+        depth = low = high = 0
+        for _, opcode, operands in instructions:
+            pops, pushes = effects.get(opcode, (0, 0))
+            if opcode is Opcode.PEEK and pointer == "rsp":
+                # читается слово на глубине операнда, выше вершины - ошибка
+                if operands[0] < 0:
+                    return "True"
+                pops = pushes = operands[0] + 1
+            low = min(low, depth - pops)
+            depth += pushes - pops
+            high = max(high, depth)
+        if low < 0:
+            conditions.append(f"{pointer} < {-1 - low}")
+        if high > 0:
+            conditions.append(f"{pointer} >= {size} - {high}")
+    return " or ".join(conditions)
+
+
+def _instruction(addr, opcode, operands, entry, end, size, exit_lines) -> list:
+    operand = operands[0] if operands else None
+    if opcode is Opcode.HLT:
+        return ['raise StopIteration("ABOBA")']
+    if opcode is Opcode.JMP:
+        return [f"pc = {operand}"]
+    if opcode is Opcode.JZ:
+        return [
+            "if stack[sp] == 0:",
+            f"    pc = {operand}",
+            "else:",
+            f"    pc = {addr + 2}",
+            "sp -= 1",
+        ]
+    if opcode is Opcode.JNE:
+        return [
+            f"if stack[sp] != {operand}:",
+            f"    pc = {operands[1]}",
+            "else:",
+            f"    pc = {addr + 3}",
+            "sp -= 1",
+        ]
+    if opcode is Opcode.CALL:
+        return ["rsp += 1", f"rstack[rsp] = {addr + 2}", f"pc = {operand}"]
+    if opcode is Opcode.RET or opcode is Opcode.IRET:
+        return ["pc = rstack[rsp]", "rsp -= 1"]
+    if opcode is Opcode.EI or opcode is Opcode.DI:
+        # без контроллера прерываний - только такты
+        return []
+    if opcode is Opcode.GET_VAL:
+        return [
+            "a = stack[sp]",
+            "dp.data_address = a",
+            f"if a == {MAP_INPUT_ADDRESS}:",
+            "    stack[sp] = dp._signal_input()",
+            "else:",
+            "    try:",
+            "        stack[sp] = data[a]",
+            "    except IndexError:",
+            "        stack[sp] = dp.bss.read(a)",
+        ]
+    if opcode is Opcode.STORE_VAL:
+        # запись в код текущего блока - выйти, чтобы исполнить новый код
+        return [
+            "a = stack[sp - 1]",
+            "dp.data_address = a",
+            f"if a == {MAP_OUTPUT_ADDRESS}:",
+            "    dp._signal_output(stack[sp])",
+            "    sp -= 2",
+            "else:",
+            "    v = stack[sp]",
+            "    sp -= 2",
+            "    if not -size <= a < size:",
+            "        dp.bss.write(a, v)",
+            "    else:",
+            "        data[a] = v",
+            "        if a < 0:",
+            "            a += size",
+            "        decoded[a] = dispatch_get(v, invalid)",
+            "        if a in owners:",
+            "            cu.drop_blocks(a)",
+            f"            if {entry} <= a < {end}:",
+        ] + ["                " + line for line in exit_lines]
+    if opcode is Opcode.XADD:
+        return [
+            "a = stack[sp - 1]",
+            "dp.data_address = a",
+            "sp -= 1",
+            "if not -size <= a < size:",
+            "    v = dp.bss.read(a)",
+            "    stack[sp] = v",
+            "    v += stack[sp + 1]",
+            f"    if v < {MIN_SIGN} or v > {MAX_SIGN}:",
+            "        v = wrap(v)",
+            "    dp.bss.write(a, v)",
+            "else:",
+            "    v = data[a]",
+            "    stack[sp] = v",
+            "    v += stack[sp + 1]",
+            f"    if v < {MIN_SIGN} or v > {MAX_SIGN}:",
+            "        v = wrap(v)",
+            "    data[a] = v",
+            "    if a < 0:",
+            "        a += size",
+            "    decoded[a] = dispatch_get(v, invalid)",
+            "    if a in owners:",
+            "        cu.drop_blocks(a)",
+            f"        if {entry} <= a < {end}:",
+        ] + ["            " + line for line in exit_lines]
+    if opcode is Opcode.LOAD:
+        if operand == MAP_INPUT_ADDRESS:
+            value = "dp._signal_input()"
+        elif not -size <= operand < size:
+            value = f"dp.bss.read({operand})"
+        else:
+            value = f"data[{operand}]"
+        return ["sp += 1", f"dp.data_address = {operand}", f"stack[sp] = {value}"]
+    if opcode is Opcode.STORE:
+        if operand == MAP_OUTPUT_ADDRESS:
+            return [
+                f"dp.data_address = {operand}",
+                "dp._signal_output(stack[sp])",
+                "sp -= 1",
+            ]
+        if not -size <= operand < size:
+            return [
+                f"dp.data_address = {operand}",
+                f"dp.bss.write({operand}, stack[sp])",
+                "sp -= 1",
+            ]
+        return [
+            f"dp.data_address = {operand}",
+            "v = stack[sp]",
+            f"data[{operand}] = v",
+            "sp -= 1",
+            f"a = {operand} + size if {operand} < 0 else {operand}",
+            "decoded[a] = dispatch_get(v, invalid)",
+            "if a in owners:",
+            "    cu.drop_blocks(a)",
+            f"    if {entry} <= a < {end}:",
+        ] + ["        " + line for line in exit_lines]
+    if opcode is Opcode.PEEK:
+        return ["sp += 1", f"stack[sp] = rstack[rsp - {operand}]"]
+    if opcode is Opcode.PUSH:
+        return ["sp += 1", f"stack[sp] = {operand}"]
+    if opcode is Opcode.DROP:
+        return ["sp -= 1"]
+    if opcode is Opcode.PUSHR:
+        return ["rsp += 1", f"rstack[rsp] = {operand}"]
+    if opcode is Opcode.DROPR:
+        return ["rsp -= 1"]
+    if opcode in ALU_EXPRESSIONS:
+        return [
+            "left = stack[sp - 1]",
+            "right = stack[sp]",
+            f"res = {ALU_EXPRESSIONS[opcode]}",
+            f"if res < {MIN_SIGN} or res > {MAX_SIGN}:",
+            "    res = wrap(res)",
+            "sp -= 1",
+            "stack[sp] = res",
+        ]
+    if opcode in IMMEDIATE_EXPRESSIONS:
+        return [
+            "left = stack[sp]",
+            f"right = {operand}",
+            f"res = {IMMEDIATE_EXPRESSIONS[opcode]}",
+            f"if res < {MIN_SIGN} or res > {MAX_SIGN}:",
+            "    res = wrap(res)",
+            "stack[sp] = res",
+        ]
+    raise ValueError(f"Opcode {opcode} not supported")
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+REPLACEMENT_POLICIES = ("lru", "fifo")
+WRITE_POLICIES = ("back", "through")
+
+
+# Модель множественно-ассоциативного кеша данных. Хранит только теги и
+# признаки изменения строк: сами значения остаются в памяти Datapath, кеш
+# определяет, сколько тактов занимает обращение.
+class Cache:
+    line_size: int = None
+    sets: int = None
+    ways: int = None
+    replacement: str = None
+    write_policy: str = None
+    hit_latency: int = None
+    miss_latency: int = None
+
+    # для каждого множества: тег -> строка изменена (dirty)
+    lines: list = None
+
+    hits: int = None
+    misses: int = None
+    evictions: int = None
+    write_backs: int = None
+    memory_writes: int = None
+
+    def __init__(
+        self,
+        line_size: int = 4,
+        sets: int = 16,
+        ways: int = 2,
+        replacement: str = "lru",
+        write_policy: str = "back",
+        hit_latency: int = 1,
+        miss_latency: int = 10,
+    ):
+        assert line_size > 0 and sets > 0 and ways > 0, (
+            "Cache geometry must be positive"
+        )
+        assert replacement in REPLACEMENT_POLICIES, (
+            f"Unknown replacement: {replacement}"
+        )
+        assert write_policy in WRITE_POLICIES, f"Unknown write policy: {write_policy}"
+        self.line_size = line_size
+        self.sets = sets
+        self.ways = ways
+        self.replacement = replacement
+        self.write_policy = write_policy
+        self.hit_latency = hit_latency
+        self.miss_latency = miss_latency
+        self.lines = [OrderedDict() for _ in range(sets)]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_backs = 0
+        self.memory_writes = 0
+
+    # обращение к памяти по адресу, возвращает задержку в тактах
+    def access(self, addr: int, write: bool) -> int:
+        line = addr // self.line_size
+        lines = self.lines[line % self.sets]
+        tag = line // self.sets
+
+        if tag in lines:
+            self.hits += 1
+            if self.replacement == "lru":
+                lines.move_to_end(tag)
+            latency = self.hit_latency
+            if write:
+                if self.write_policy == "back":
+                    lines[tag] = True
+                else:
+                    self.memory_writes += 1
+                    latency = self.miss_latency
+            return latency
+
+        self.misses += 1
+        # сквозная запись без выделения строки
+        if write and self.write_policy == "through":
+            self.memory_writes += 1
+            return self.miss_latency
+
+        latency = self.miss_latency
+        if len(lines) >= self.ways:
+            _, dirty = lines.popitem(last=False)
+            self.evictions += 1
+            if dirty:
+                self.write_backs += 1
+                latency += self.miss_latency
+        lines[tag] = write
+        return latency
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_backs": self.write_backs,
+            "memory_writes": self.memory_writes,
+        }
+
+    def __repr__(self):
+        accesses = self.hits + self.misses
+        hit_rate = 100 * self.hits / accesses if accesses else 0
+        return (
+            f"cache {self.sets}x{self.ways}x{self.line_size} "
+            f"{self.replacement}/write-{self.write_policy}: "
+            f"hits: {self.hits} misses: {self.misses} "
+            f"evictions: {self.evictions} write-backs: {self.write_backs} "
+            f"memory writes: {self.memory_writes} hit rate: {hit_rate:.2f}%"
+        )
@@ -0,0 +1,145 @@
+import struct
+import sys
+from array import array
+
+from machine.isa import WORD_TYPECODE
+from machine.memory import PAGE_SIZE
+
+MAGIC = b"CSAK"
+VERSION = 2
+
+# заголовок: сигнатура, версия, такт, инструкции, PC, IR, RSP, SP, DA,
+# размер стеков, позиция ввода, размер памяти, длина и счётчик вывода,
+# длина BSS и число созданных страниц BSS. Дальше секции машинных слов:
+# память, стек, стек возврата, вывод, страницы BSS (номер и слова)
+HEADER = struct.Struct("<4sHqqiiiiiiqiiqii")
+
+
+def _words(values) -> bytes:
+    words = array(WORD_TYPECODE, values)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words.tobytes()
+
+
+def _read_words(f, count: int) -> array:
+    words = array(WORD_TYPECODE)
+    words.fromfile(f, count)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words
+
+
+# сохранить состояние машины перед исполнением инструкции по адресу PC
+def save_checkpoint(target: str, control_unit, instructions: int):
+    cu = control_unit.snapshot()
+    dp = control_unit.datapath.snapshot()
+    data = control_unit.program
+    bss = control_unit.datapath.bss
+    with open(target, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                cu["tick"],
+                instructions,
+                cu["program_counter"],
+                cu["instruction_register"],
+                cu["return_stack_pointer"],
+                dp["stack_pointer"],
+                dp["data_address"],
+                len(dp["stack"]),
+                dp["input_position"],
+                len(data),
+                len(dp["output"]),
+                dp["output_count"],
+                bss.size,
+                len(dp["bss_pages"]),
+            )
+        )
+        f.write(_words(data))
+        f.write(_words(dp["stack"]))
+        f.write(_words(cu["return_stack"]))
+        f.write(_words(dp["output"]))
+        for index, page in dp["bss_pages"].items():
+            f.write(_words([index]))
+            f.write(_words(page))
+
+
+def load_checkpoint(source: str) -> dict:
+    with open(source, "rb") as f:
+        (
+            magic,
+            version,
+            tick,
+            instructions,
+            pc,
+            ir,
+            rsp,
+            sp,
+            da,
+            stack_size,
+            input_position,
+            data_size,
+            output_size,
+            output_count,
+            bss_size,
+            page_count,
+        ) = HEADER.unpack(f.read(HEADER.size))
+        assert magic == MAGIC, f"{source} is not a checkpoint"
+        assert version == VERSION, f"Unsupported checkpoint version: {version}"
+        data = _read_words(f, data_size)
+        stack = _read_words(f, stack_size)
+        return_stack = _read_words(f, stack_size)
+        output = _read_words(f, output_size).tolist()
+        bss_pages = {}
+        for _ in range(page_count):
+            (index,) = _read_words(f, 1)
+            bss_pages[index] = _read_words(f, PAGE_SIZE)
+    return {
+        "data": data,
+        "bss_size": bss_size,
+        "instructions": instructions,
+        "control_unit": {
+            "program_counter": pc,
+            "instruction_register": ir,
+            "return_stack_pointer": rsp,
+            "return_stack": return_stack,
+            "tick": tick,
+        },
+        "datapath": {
+            "data_address": da,
+            "stack_pointer": sp,
+            "stack": stack,
+            "input_position": input_position,
+            "output": output,
+            "output_count": output_count,
+            "bss_pages": bss_pages,
+        },
+    }
+
+
+# Контрольные точки во время моделирования: каждые every тактов (0 - только
+# при остановке по лимиту) в файл path, "{tick}" в имени заменяется на такт
+class Checkpointer:
+    path: str = None
+    every: int = None
+    # сохранённые файлы
+    saved: list = None
+
+    def __init__(self, path: str, every: int = 0):
+        assert every >= 0, "Checkpoint interval must be non-negative"
+        self.path = path
+        self.every = every
+        self.saved = []
+
+    # такт следующей остановки для сохранения
+    def next_stop(self, tick: int, limit: int) -> int:
+        if self.every == 0:
+            return limit
+        return min(limit, (tick // self.every + 1) * self.every)
+
+    def save(self, control_unit, instructions: int):
+        target = self.path.replace("{tick}", str(control_unit.current_tick()))
+        save_checkpoint(target, control_unit, instructions)
+        self.saved.append(target)
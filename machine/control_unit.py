@@ -1,21 +1,77 @@
-from machine.datapath import Datapath
-from machine.isa import Opcode, ALU
+from array import array
 
+from machine.datapath import ALU_OPERATIONS, Datapath, wrap
+from machine.fetch import FetchUnit
+from machine.interrupts import INTERRUPT_TICKS, InterruptController
+from machine.isa import (
+    ALU,
+    MAP_INPUT_ADDRESS,
+    MAP_OUTPUT_ADDRESS,
+    MAX_SIGN,
+    MIN_SIGN,
+    Opcode,
+)
+from machine.stack_cache import StackCache
 
+DATA_OVERFLOW = "Data stack overflow"
+DATA_UNDERFLOW = "Data stack underflow"
+RETURN_OVERFLOW = "Return stack overflow"
+RETURN_UNDERFLOW = "Return stack underflow"
+
+
+# Переполнение и исчерпание стеков проверяются обработчиками инструкций
+# и вызывают IndexError: указатель стека не уходит за его границы
 class ControlUnit:
-    program: list = None
-    program_counter: int = None
-    return_stack_size: int = None
-    return_stack: list = None
-    return_stack_pointer: int = None
+    __slots__ = (
+        "program",
+        "program_counter",
+        "return_stack_size",
+        "return_stack",
+        "return_stack_pointer",
+        "instruction_register",
+        "datapath",
+        "decoded",
+        "dispatch",
+        "fetch_unit",
+        "stack_cache",
+        "interrupts",
+        "_tick",
+    )
+
+    program: array
+    program_counter: int
+    return_stack_size: int
+    return_stack: list
+    return_stack_pointer: int
+
+    instruction_register: int
 
-    instruction: int = None
+    datapath: Datapath
 
-    datapath: Datapath = None
+    # предекодированная память: обработчик инструкции для каждого слова
+    decoded: list
+    dispatch: dict
 
-    _tick: int = None
+    # кеш инструкций; без него слово выбирается за такт
+    fetch_unit: FetchUnit
+    # регистровые окна стеков; без них стеки целиком в регистрах
+    stack_cache: StackCache
+    # контроллер прерываний и порт ввода с расписанием; без него ввод готов сразу
+    interrupts: InterruptController
 
-    def __init__(self, code: list, start: int, stack_size: int, datapath: Datapath):
+    _tick: int
+
+    def __init__(
+        self,
+        code: list,
+        start: int,
+        stack_size: int,
+        datapath: Datapath,
+        decoded: list = None,
+        fetch_unit: FetchUnit = None,
+        stack_cache: StackCache = None,
+        interrupts: InterruptController = None,
+    ):
         self.program = code
         self.program_counter = start
         self.return_stack_size = stack_size
@@ -23,6 +79,26 @@ class ControlUnit:
         self.return_stack_pointer = -1
         self.instruction_register = 0
         self.datapath = datapath
+        self.dispatch = DISPATCH if datapath.cache is None else CACHED_DISPATCH
+        if decoded is None:
+            decoded = predecode(code, self.dispatch)
+        self.decoded = decoded
+        self.fetch_unit = fetch_unit
+        if stack_cache is not None:
+            assert stack_cache.data.depth <= datapath.stack_size, (
+                "Stack cache is deeper than the data stack"
+            )
+            assert stack_cache.ret.depth <= stack_size, (
+                "Stack cache is deeper than the return stack"
+            )
+        self.stack_cache = stack_cache
+        if interrupts is not None:
+            assert datapath.input_device is interrupts.device, (
+                "Interrupt controller must own the input port"
+            )
+            # порт читается на такте обращения, а не начала инструкции
+            interrupts.device.clock = self.current_tick
+        self.interrupts = interrupts
         self._tick = 0
 
     def tick(self):
@@ -49,107 +125,421 @@ class ControlUnit:
     def get_rtos(self):
         return self.return_stack[self.return_stack_pointer]
 
-    def decode_and_execute_control_flow_instruction(self, opcode):
-        if opcode is Opcode.HLT:
-            raise StopIteration("ABOBA")
-        elif opcode is Opcode.JMP:
-            self.signal_latch_program_counter(self.get_instr())
-            self.tick()
-        elif opcode is Opcode.JZ:
-            if self.datapath.zero():
-                self.signal_latch_program_counter(self.get_instr())
+    # регистры и стек возврата для контрольной точки (память - в Datapath)
+    def snapshot(self) -> dict:
+        return {
+            "program_counter": self.program_counter,
+            "instruction_register": self.instruction_register,
+            "return_stack_pointer": self.return_stack_pointer,
+            "return_stack": list(self.return_stack),
+            "tick": self._tick,
+        }
+
+    def restore(self, state: dict):
+        assert len(state["return_stack"]) == self.return_stack_size, (
+            "Return stack size mismatch"
+        )
+        self.program_counter = state["program_counter"]
+        self.instruction_register = state["instruction_register"]
+        self.return_stack_pointer = state["return_stack_pointer"]
+        self.return_stack[:] = state["return_stack"]
+        self._tick = state["tick"]
+
+    # перекодировать слово памяти после записи (код и данные в одной памяти)
+    def invalidate(self, addr: int):
+        self.decoded[addr] = self.dispatch.get(self.program[addr], ControlUnit._invalid)
+
+    def decode_and_execute_instruction(self):
+        if (
+            self.fetch_unit is not None
+            or self.stack_cache is not None
+            or self.interrupts is not None
+        ):
+            self._execute_modeled()
+            return
+        # fetch: обработчик уже выбран при предекодировании
+        pc = self.program_counter
+        self.instruction_register = self.program[pc]
+        self.program_counter = pc + 1
+        self._tick += 1
+        self.decoded[pc](self)
+
+    # с прерываниями, моделями кеша инструкций и окон стеков: вход в
+    # прерывание перед выборкой, такты выборки, ожидания ввода и перемещений
+    # слов стеков между регистрами и памятью
+    def _execute_modeled(self):
+        interrupts = self.interrupts
+        if interrupts is not None and interrupts.request(self._tick):
+            self._interrupt()
+        pc = self.program_counter
+        word = self.program[pc]
+        self.instruction_register = word
+        self.program_counter = pc + 1
+        if self.fetch_unit is None:
+            self._tick += 1
+        else:
+            self._tick += self.fetch_unit.fetch(pc, word)
+        sp = self.datapath.stack_pointer
+        rsp = self.return_stack_pointer
+        try:
+            self.decoded[pc](self)
+        finally:
+            if interrupts is not None:
+                self._tick += interrupts.device.take_wait()
+        if self.stack_cache is not None:
+            operand = self.program[pc + 1] if word == Opcode.PEEK.value else 0
+            self._tick += self.stack_cache.step(word, sp, rsp, operand)
+
+    # адрес возврата - на стек возврата, переход по вектору прерывания
+    def _interrupt(self):
+        rsp = self.return_stack_pointer
+        if rsp + 1 >= self.return_stack_size:
+            raise IndexError(RETURN_OVERFLOW)
+        self.return_stack[rsp + 1] = self.program_counter
+        self.return_stack_pointer = rsp + 1
+        self.program_counter = self.interrupts.vector
+        self._tick += INTERRUPT_TICKS
+        if self.stack_cache is not None:
+            self._tick += self.stack_cache.step(Opcode.PUSHR.value, -1, rsp)
+
+    # Обработчики инструкций. Вызываются после fetch (PC уже указывает
+    # на операнд или следующую инструкцию, первый такт уже учтён)
+
+    def _invalid(self):
+        raise ValueError(f"{self.instruction_register} is not a valid Opcode")
+
+    def _hlt(self):
+        raise StopIteration("ABOBA")
+
+    def _ei(self):
+        if self.interrupts is not None:
+            self.interrupts.enabled = True
+        self._tick += 1
+
+    def _di(self):
+        if self.interrupts is not None:
+            self.interrupts.enabled = False
+        self._tick += 1
+
+    def _iret(self):
+        self._ret()
+        if self.interrupts is not None:
+            self.interrupts.enabled = True
+
+    def _jmp(self):
+        self.program_counter = self.program[self.program_counter]
+        self._tick += 1
+
+    def _jz(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        if dp.stack[sp] == 0:
+            self.program_counter = self.program[self.program_counter]
+        else:
+            self.program_counter += 1
+        dp.stack_pointer = sp - 1
+        self._tick += 1
+
+    def _call(self):
+        rsp = self.return_stack_pointer + 1
+        if rsp == self.return_stack_size:
+            raise IndexError(RETURN_OVERFLOW)
+        self.return_stack_pointer = rsp
+        self._tick += 1
+        pc = self.program_counter
+        self.return_stack[rsp] = pc + 1
+        self.program_counter = self.program[pc]
+        self._tick += 1
+
+    def _ret(self):
+        rsp = self.return_stack_pointer
+        if rsp < 0:
+            raise IndexError(RETURN_UNDERFLOW)
+        self.program_counter = self.return_stack[rsp]
+        self.return_stack_pointer = rsp - 1
+        self._tick += 1
+
+    def _jne(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        pc = self.program_counter
+        self._tick += 1
+        if dp.stack[sp] != self.program[pc]:
+            self.program_counter = self.program[pc + 1]
+        else:
+            self.program_counter = pc + 2
+        dp.stack_pointer = sp - 1
+        self._tick += 1
+
+    def _get_val(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp]
+        dp.data_address = addr
+        self._tick += 1
+        if addr == MAP_INPUT_ADDRESS:
+            dp.stack[sp] = dp._signal_input()
+        else:
+            try:
+                dp.stack[sp] = dp.data[addr]
+            except IndexError:
+                dp.stack[sp] = dp.bss.read(addr)
+        self._tick += 1
+
+    def _store_val(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 1:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp - 1]
+        dp.data_address = addr
+        self._tick += 1
+        if addr == MAP_OUTPUT_ADDRESS:
+            dp._signal_output(dp.stack[sp])
+        else:
+            try:
+                dp.data[addr] = dp.stack[sp]
+            except IndexError:
+                dp.bss.write(addr, dp.stack[sp])
             else:
-                self.signal_latch_program_counter(self.program_counter + 1)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-            self.tick()
-        elif opcode is Opcode.CALL:
-            self.signal_latch_return_stack_pointer(self.return_stack_pointer + 1)
-            self.tick()
-            self.signal_latch_rstack_top(self.program_counter + 1)
-            self.signal_latch_program_counter(self.get_instr())
-            self.tick()
-        elif opcode is Opcode.RET:
-            self.signal_latch_program_counter(self.get_rtos())
-            self.signal_latch_return_stack_pointer(self.return_stack_pointer - 1)
-            self.tick()
+                self.invalidate(addr)
+        dp.stack_pointer = sp - 2
+        self._tick += 1
+
+    # GET_VAL и STORE_VAL с моделью кеша: последний такт заменяется задержкой памяти
+    def _get_val_cached(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp]
+        dp.data_address = addr
+        self._tick += 1
+        dp.stack[sp] = dp.get_data()
+        self._tick += dp.memory_latency(addr, False)
+
+    def _store_val_cached(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 1:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp - 1]
+        dp.data_address = addr
+        self._tick += 1
+        if dp.set_data(dp.stack[sp]):
+            self.invalidate(addr)
+        dp.stack_pointer = sp - 2
+        self._tick += dp.memory_latency(addr, True)
+
+    # XADD: чтение и запись слова подряд, другие ядра между ними не обращаются
+    # к памяти. Работает с памятью, а не с портами ввода-вывода
+    def _xadd(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 1:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp - 1]
+        dp.data_address = addr
+        self._tick += 1
+        try:
+            old = dp.data[addr]
+        except IndexError:
+            old = dp.bss.read(addr)
+        self._tick += 1
+        res = old + dp.stack[sp]
+        if res < MIN_SIGN or res > MAX_SIGN:
+            res = wrap(res)
+        try:
+            dp.data[addr] = res
+        except IndexError:
+            dp.bss.write(addr, res)
+        else:
+            self.invalidate(addr)
+        dp.stack[sp - 1] = old
+        dp.stack_pointer = sp - 1
+        self._tick += 1
+
+    def _xadd_cached(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 1:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp - 1]
+        dp.data_address = addr
+        self._tick += 1
+        try:
+            old = dp.data[addr]
+        except IndexError:
+            old = dp.bss.read(addr)
+        self._tick += dp.memory_latency(addr, False)
+        res = old + dp.stack[sp]
+        if res < MIN_SIGN or res > MAX_SIGN:
+            res = wrap(res)
+        if dp.write(addr, res):
+            self.invalidate(addr)
+        dp.stack[sp - 1] = old
+        dp.stack_pointer = sp - 1
+        self._tick += dp.memory_latency(addr, True)
+
+    # Блочный ввод-вывод: такт подготовки, затем такт на каждое переданное
+    # слово. Память - напрямую, мимо кеша данных
+    def _read_buf(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 1:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp - 1]
+        dp.data_address = addr
+        dp.stack_pointer = sp - 2
+        self._tick += 1
+        count, transfers = dp.dma_read(addr, dp.stack[sp])
+        self._tick += transfers
+        # записанные в образ слова могут быть кодом
+        size = len(self.program)
+        for a in range(max(addr, -size), min(addr + 1 + count, size)):
+            self.invalidate(a)
+        self._tick += 1
+
+    def _write_str(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        addr = dp.stack[sp]
+        dp.data_address = addr
+        dp.stack_pointer = sp - 1
+        self._tick += 1
+        self._tick += max(dp.dma_write(addr), 0)
+        self._tick += 1
+
+    # LOAD и STORE: адрес - операнд инструкции, а не значение на стеке
+    def _load(self):
+        dp = self.datapath
+        sp = dp.stack_pointer + 1
+        if sp == dp.stack_size:
+            raise IndexError(DATA_OVERFLOW)
+        pc = self.program_counter
+        addr = self.program[pc]
+        self.program_counter = pc + 1
+        dp.data_address = addr
+        dp.stack_pointer = sp
+        self._tick += 1
+        if addr == MAP_INPUT_ADDRESS:
+            dp.stack[sp] = dp._signal_input()
         else:
-            return False
-        return True
+            try:
+                dp.stack[sp] = dp.data[addr]
+            except IndexError:
+                dp.stack[sp] = dp.bss.read(addr)
+        self._tick += 1
 
-    def decode_and_execute_instruction(self):
-        instr = self.get_instr()
-        opcode = Opcode(instr)
-        self.signal_latch_instruction_register(instr)
-        self.signal_latch_program_counter(self.program_counter + 1)
-        self.tick()
+    def _store(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        pc = self.program_counter
+        addr = self.program[pc]
+        self.program_counter = pc + 1
+        dp.data_address = addr
+        self._tick += 1
+        if addr == MAP_OUTPUT_ADDRESS:
+            dp._signal_output(dp.stack[sp])
+        else:
+            try:
+                dp.data[addr] = dp.stack[sp]
+            except IndexError:
+                dp.bss.write(addr, dp.stack[sp])
+            else:
+                self.invalidate(addr)
+        dp.stack_pointer = sp - 1
+        self._tick += 1
 
-        # print(instr, opcode, self.program)
+    def _load_cached(self):
+        dp = self.datapath
+        sp = dp.stack_pointer + 1
+        if sp == dp.stack_size:
+            raise IndexError(DATA_OVERFLOW)
+        pc = self.program_counter
+        addr = self.program[pc]
+        self.program_counter = pc + 1
+        dp.data_address = addr
+        dp.stack_pointer = sp
+        self._tick += 1
+        dp.stack[sp] = dp.get_data()
+        self._tick += dp.memory_latency(addr, False)
 
-        if self.decode_and_execute_control_flow_instruction(opcode):
-            return
+    def _store_cached(self):
+        dp = self.datapath
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        pc = self.program_counter
+        addr = self.program[pc]
+        self.program_counter = pc + 1
+        dp.data_address = addr
+        self._tick += 1
+        if dp.set_data(dp.stack[sp]):
+            self.invalidate(addr)
+        dp.stack_pointer = sp - 1
+        self._tick += dp.memory_latency(addr, True)
 
-        if opcode is Opcode.GET_VAL:
-            self.datapath.signal_latch_data_address(self.datapath.get_tos())
-            self.tick()
-            self.datapath.signal_latch_stack_top(self.datapath.get_data())
-        elif opcode is Opcode.STORE_VAL:
-            self.datapath.signal_latch_data_address(self.datapath.get_sos())
-            self.tick()
-            self.datapath.set_data(self.datapath.get_tos())
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 2)
-        elif opcode is Opcode.PEEK:
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer + 1)
-            self.tick()
-            self.datapath.signal_latch_stack_top(
-                self.return_stack[self.return_stack_pointer - self.get_instr()]
-            )
-            self.signal_latch_program_counter(self.program_counter + 1)
-        elif opcode is Opcode.PUSH:
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer + 1)
-            self.tick()
-            self.datapath.signal_latch_stack_top(self.get_instr())
-            self.signal_latch_program_counter(self.program_counter + 1)
-        elif opcode is Opcode.DROP:
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-        elif opcode is Opcode.PUSHR:
-            self.signal_latch_return_stack_pointer(self.return_stack_pointer + 1)
-            self.tick()
-            self.signal_latch_rstack_top(self.get_instr())
-            self.signal_latch_program_counter(self.program_counter + 1)
-        elif opcode is Opcode.DROPR:
-            self.signal_latch_return_stack_pointer(self.return_stack_pointer - 1)
-        elif opcode is Opcode.ADD:
-            res = self.datapath.alu_operation(
-                ALU.ADD, self.datapath.get_sos(), self.datapath.get_tos()
-            )
-            self.datapath.signal_latch_stack_second(res)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-        elif opcode is Opcode.SUB:
-            res = self.datapath.alu_operation(
-                ALU.SUB, self.datapath.get_sos(), self.datapath.get_tos()
-            )
-            self.datapath.signal_latch_stack_second(res)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-        elif opcode is Opcode.MOD:
-            res = self.datapath.alu_operation(
-                ALU.MOD, self.datapath.get_sos(), self.datapath.get_tos()
-            )
-            self.datapath.signal_latch_stack_second(res)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-        elif opcode is Opcode.EQ:
-            res = self.datapath.alu_operation(
-                ALU.EQ, self.datapath.get_sos(), self.datapath.get_tos()
-            )
-            self.datapath.signal_latch_stack_second(res)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
-        elif opcode is Opcode.OR:
-            res = self.datapath.alu_operation(
-                ALU.OR, self.datapath.get_sos(), self.datapath.get_tos()
-            )
-            self.datapath.signal_latch_stack_second(res)
-            self.datapath.signal_latch_stack_pointer(self.datapath.stack_pointer - 1)
+    def _peek(self):
+        dp = self.datapath
+        sp = dp.stack_pointer + 1
+        if sp == dp.stack_size:
+            raise IndexError(DATA_OVERFLOW)
+        pc = self.program_counter
+        rsp = self.return_stack_pointer - self.program[pc]
+        if not 0 <= rsp <= self.return_stack_pointer:
+            raise IndexError(RETURN_UNDERFLOW)
+        dp.stack_pointer = sp
+        self._tick += 1
+        dp.stack[sp] = self.return_stack[rsp]
+        self.program_counter = pc + 1
+        self._tick += 1
 
-        self.tick()
+    def _push(self):
+        dp = self.datapath
+        sp = dp.stack_pointer + 1
+        if sp == dp.stack_size:
+            raise IndexError(DATA_OVERFLOW)
+        dp.stack_pointer = sp
+        self._tick += 1
+        pc = self.program_counter
+        dp.stack[sp] = self.program[pc]
+        self.program_counter = pc + 1
+        self._tick += 1
+
+    def _drop(self):
+        dp = self.datapath
+        if dp.stack_pointer < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        dp.stack_pointer -= 1
+        self._tick += 1
+
+    def _pushr(self):
+        rsp = self.return_stack_pointer + 1
+        if rsp == self.return_stack_size:
+            raise IndexError(RETURN_OVERFLOW)
+        self.return_stack_pointer = rsp
+        self._tick += 1
+        pc = self.program_counter
+        self.return_stack[rsp] = self.program[pc]
+        self.program_counter = pc + 1
+        self._tick += 1
+
+    def _dropr(self):
+        if self.return_stack_pointer < 0:
+            raise IndexError(RETURN_UNDERFLOW)
+        self.return_stack_pointer -= 1
+        self._tick += 1
 
     def __repr__(self):
         stack = self.datapath.stack
@@ -168,3 +558,135 @@ class ControlUnit:
             f"RSTACK: {self.return_stack[:5]} "
         )
         return state_repr
+
+
+def _alu_handler(operation: ALU):
+    function = ALU_OPERATIONS[operation]
+
+    def handler(self: ControlUnit):
+        dp = self.datapath
+        stack = dp.stack
+        sp = dp.stack_pointer - 1
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        res = function(stack[sp], stack[sp + 1])
+        if res < MIN_SIGN or res > MAX_SIGN:
+            res = wrap(res)
+        stack[sp] = res
+        dp.stack_pointer = sp
+        self._tick += 1
+
+    handler.__name__ = f"_{operation.name.lower()}"
+    return handler
+
+
+# операция АЛУ над вершиной стека и операндом инструкции
+def _alu_immediate_handler(operation: ALU):
+    function = ALU_OPERATIONS[operation]
+
+    def handler(self: ControlUnit):
+        dp = self.datapath
+        stack = dp.stack
+        sp = dp.stack_pointer
+        if sp < 0:
+            raise IndexError(DATA_UNDERFLOW)
+        pc = self.program_counter
+        self.program_counter = pc + 1
+        self._tick += 1
+        res = function(stack[sp], self.program[pc])
+        if res < MIN_SIGN or res > MAX_SIGN:
+            res = wrap(res)
+        stack[sp] = res
+        self._tick += 1
+
+    handler.__name__ = f"_{operation.name.lower()}i"
+    return handler
+
+
+# таблица диспетчеризации: машинное слово -> обработчик инструкции
+DISPATCH = {
+    Opcode.JMP.value: ControlUnit._jmp,
+    Opcode.JZ.value: ControlUnit._jz,
+    Opcode.CALL.value: ControlUnit._call,
+    Opcode.RET.value: ControlUnit._ret,
+    Opcode.HLT.value: ControlUnit._hlt,
+    Opcode.GET_VAL.value: ControlUnit._get_val,
+    Opcode.STORE_VAL.value: ControlUnit._store_val,
+    Opcode.PEEK.value: ControlUnit._peek,
+    Opcode.PUSH.value: ControlUnit._push,
+    Opcode.DROP.value: ControlUnit._drop,
+    Opcode.PUSHR.value: ControlUnit._pushr,
+    Opcode.DROPR.value: ControlUnit._dropr,
+    Opcode.ADD.value: _alu_handler(ALU.ADD),
+    Opcode.SUB.value: _alu_handler(ALU.SUB),
+    Opcode.MOD.value: _alu_handler(ALU.MOD),
+    Opcode.EQ.value: _alu_handler(ALU.EQ),
+    Opcode.OR.value: _alu_handler(ALU.OR),
+    Opcode.JNE.value: ControlUnit._jne,
+    Opcode.LOAD.value: ControlUnit._load,
+    Opcode.STORE.value: ControlUnit._store,
+    Opcode.ADDI.value: _alu_immediate_handler(ALU.ADD),
+    Opcode.SUBI.value: _alu_immediate_handler(ALU.SUB),
+    Opcode.MODI.value: _alu_immediate_handler(ALU.MOD),
+    Opcode.EQI.value: _alu_immediate_handler(ALU.EQ),
+    Opcode.ORI.value: _alu_immediate_handler(ALU.OR),
+    Opcode.XADD.value: ControlUnit._xadd,
+    Opcode.EI.value: ControlUnit._ei,
+    Opcode.DI.value: ControlUnit._di,
+    Opcode.IRET.value: ControlUnit._iret,
+    Opcode.READ_BUF.value: ControlUnit._read_buf,
+    Opcode.WRITE_STR.value: ControlUnit._write_str,
+}
+
+
+CACHED_DISPATCH = {
+    **DISPATCH,
+    Opcode.GET_VAL.value: ControlUnit._get_val_cached,
+    Opcode.STORE_VAL.value: ControlUnit._store_val_cached,
+    Opcode.LOAD.value: ControlUnit._load_cached,
+    Opcode.STORE.value: ControlUnit._store_cached,
+    Opcode.XADD.value: ControlUnit._xadd_cached,
+}
+
+
+# сопоставить каждому слову памяти обработчик инструкции
+def predecode(program: list, dispatch: dict = DISPATCH) -> list:
+    invalid = ControlUnit._invalid
+    return [dispatch.get(word, invalid) for word in program]
+
+
+# длительность инструкции в тактах, включая такт выборки
+TICKS = {
+    Opcode.JMP: 2,
+    Opcode.JZ: 2,
+    Opcode.CALL: 3,
+    Opcode.RET: 2,
+    Opcode.HLT: 1,
+    Opcode.GET_VAL: 3,
+    Opcode.STORE_VAL: 3,
+    Opcode.PEEK: 3,
+    Opcode.PUSH: 3,
+    Opcode.DROP: 2,
+    Opcode.PUSHR: 3,
+    Opcode.DROPR: 2,
+    Opcode.ADD: 2,
+    Opcode.SUB: 2,
+    Opcode.MOD: 2,
+    Opcode.EQ: 2,
+    Opcode.OR: 2,
+    Opcode.JNE: 3,
+    Opcode.LOAD: 3,
+    Opcode.STORE: 3,
+    Opcode.ADDI: 3,
+    Opcode.SUBI: 3,
+    Opcode.MODI: 3,
+    Opcode.EQI: 3,
+    Opcode.ORI: 3,
+    Opcode.XADD: 4,
+    Opcode.EI: 2,
+    Opcode.DI: 2,
+    Opcode.IRET: 2,
+    # и такт на каждое переданное слово
+    Opcode.READ_BUF: 3,
+    Opcode.WRITE_STR: 3,
+}
@@ -1,26 +1,121 @@
 import logging
-
-from machine.isa import ALU, MAX_SIGN, MAP_INPUT_ADDRESS, MAP_OUTPUT_ADDRESS, MIN_SIGN
-
-
+from array import array
+
+from machine.cache import Cache
+from machine.devices import InputDevice, OutputDevice, render, symbol
+from machine.isa import (
+    ALU,
+    MAP_INPUT_ADDRESS,
+    MAP_OUTPUT_ADDRESS,
+    MAX_UNSIGN,
+    MIN_SIGN,
+    WORD_TYPECODE,
+)
+from machine.memory import PagedMemory
+
+ALU_OPERATIONS = {
+    ALU.ADD: lambda left, right: left + right,
+    ALU.SUB: lambda left, right: left - right,
+    ALU.MOD: lambda left, right: left % right,
+    ALU.EQ: lambda left, right: 1 if left == right else 0,
+    ALU.OR: lambda left, right: 1 if left or right else 0,
+}
+
+
+# результат по модулю 2^32 как 32-битное знаковое слово
+def wrap(res: int) -> int:
+    return ((res - MIN_SIGN) & MAX_UNSIGN) + MIN_SIGN
+
+
+# память: массив 32-битных слов
+def words(values) -> array:
+    if isinstance(values, array) and values.typecode == WORD_TYPECODE:
+        return values
+    return array(WORD_TYPECODE, values)
+
+
+# Состояние - в __slots__, память - массив машинных слов: обращение к
+# атрибутам дешевле, слово памяти занимает 4 байта. Стек небольшой и
+# остаётся списком: чтение из массива создаёт новый объект int
 class Datapath:
-    data: list = None
-    data_address: int = None
-    stack_size: int = None
-    stack: list = None
-    stack_pointer: int = None
-
-    input_buffer: list = None
-    output_buffer: list = None
-
-    def __init__(self, data: list, stack_size: int, input_buffer: list):
+    __slots__ = (
+        "data",
+        "data_address",
+        "stack_size",
+        "stack",
+        "stack_pointer",
+        "input_device",
+        "output_device",
+        "output_log",
+        "cache",
+        "bss",
+    )
+
+    data: array
+    data_address: int
+    stack_size: int
+    stack: list
+    # -1 - стек пуст, stack_size - 1 - заполнен
+    stack_pointer: int
+
+    input_device: InputDevice
+    output_device: OutputDevice
+    # выведенный текст для журнала, накапливается только при уровне DEBUG
+    output_log: str
+
+    cache: Cache
+    # обнулённая память после образа
+    bss: PagedMemory
+
+    def __init__(
+        self,
+        data: array,
+        stack_size: int,
+        input_device,
+        cache: Cache = None,
+        output_device: OutputDevice = None,
+        bss: PagedMemory = None,
+    ):
+        assert stack_size > 0, "Stack size must be positive"
         self.data = data
         self.data_address = 0
         self.stack_size = stack_size
         self.stack = [-1] * stack_size
         self.stack_pointer = -1
-        self.input_buffer = input_buffer
-        self.output_buffer = []
+        if not isinstance(input_device, InputDevice):
+            input_device = InputDevice(input_device)
+        self.input_device = input_device
+        self.output_device = OutputDevice() if output_device is None else output_device
+        self.output_log = ""
+        self.cache = cache
+        self.bss = PagedMemory(len(data)) if bss is None else bss
+
+    # регистры, стек и состояние портов для контрольной точки
+    def snapshot(self) -> dict:
+        output_device = self.output_device
+        return {
+            "data_address": self.data_address,
+            "stack_pointer": self.stack_pointer,
+            "stack": list(self.stack),
+            "input_position": self.input_device.position,
+            "output": list(output_device.buffer or []),
+            "output_count": output_device.count,
+            "bss_pages": self.bss.snapshot(),
+        }
+
+    # память восстанавливается при создании (data), здесь - остальное;
+    # уже прочитанный ввод пропускается, выведенное ранее дописывается в начало
+    def restore(self, state: dict):
+        assert len(state["stack"]) == self.stack_size, "Stack size mismatch"
+        self.data_address = state["data_address"]
+        self.stack_pointer = state["stack_pointer"]
+        self.stack[:] = state["stack"]
+        self.input_device.skip(state["input_position"])
+        output_device = self.output_device
+        if output_device.buffer is not None:
+            output_device.buffer[:0] = state["output"]
+        output_device.count += state["output_count"]
+        self.bss = PagedMemory(self.bss.base, self.bss.size, state["bss_pages"])
 
     def signal_latch_data_address(self, val: int):
         self.data_address = val
@@ -35,24 +130,9 @@ class Datapath:
         self.stack[self.stack_pointer - 1] = val
 
     def alu_operation(self, operation: ALU, left: int, right: int):
-        if operation == ALU.ADD:
-            res = left + right
-        elif operation == ALU.SUB:
-            res = left - right
-        elif operation == ALU.MOD:
-            res = left % right
-        elif operation == ALU.EQ:
-            res = 1 if left == right else 0
-        elif operation == ALU.OR:
-            res = 1 if left or right else 0
-        else:
+        if operation not in ALU_OPERATIONS:
             raise ValueError(f"Operation {operation} not supported")
-
-        if res < MIN_SIGN:
-            res += MAX_SIGN - 1
-        if res > MAX_SIGN:
-            res -= MAX_SIGN + 1
-        return res
+        return wrap(ALU_OPERATIONS[operation](left, right))
 
     def get_tos(self):
         return self.stack[self.stack_pointer]
@@ -64,33 +144,73 @@ class Datapath:
         addr = self.data_address
         if addr == MAP_INPUT_ADDRESS:
             return self._signal_input()
-        return self.data[addr]
+        try:
+            return self.data[addr]
+        except IndexError:
+            return self.bss.read(addr)
 
-    def set_data(self, val: int):
+    # True - если записано в образ
+    def set_data(self, val: int) -> bool:
         addr = self.data_address
         if addr == MAP_OUTPUT_ADDRESS:
             self._signal_output(val)
-        else:
+            return False
+        return self.write(addr, val)
+
+    # запись в память, True - если записано в образ (там может быть код)
+    def write(self, addr: int, val: int) -> bool:
+        try:
             self.data[addr] = val
+        except IndexError:
+            self.bss.write(addr, val)
+            return False
+        return True
+
+    # задержка обращения к памяти по адресу в тактах
+    def memory_latency(self, addr: int, write: bool) -> int:
+        if self.cache is None or addr in (MAP_INPUT_ADDRESS, MAP_OUTPUT_ADDRESS):
+            return 1
+        return self.cache.access(addr, write)
+
+    # DMA: до n символов ввода в M[addr + 1 ...] без завершающего 0, их
+    # число - в M[addr]; конец ввода завершает передачу. Возвращает число
+    # символов и прочитанных с порта слов (с завершающим 0)
+    def dma_read(self, addr: int, n: int) -> tuple:
+        count = 0
+        transfers = 0
+        while count < n:
+            try:
+                ord_char = self._signal_input()
+            except EOFError:
+                break
+            transfers += 1
+            if ord_char == 0:
+                break
+            count += 1
+            self.write(addr + count, ord_char)
+        self.write(addr, count)
+        return count, transfers
+
+    # DMA: вывод строки M[addr], возвращает её длину
+    def dma_write(self, addr: int) -> int:
+        data = self.data
+        bss = self.bss
+        size = len(data)
+        length = data[addr] if -size <= addr < size else bss.read(addr)
+        for a in range(addr + 1, addr + 1 + length):
+            self._signal_output(data[a] if a < size else bss.read(a))
+        return length
 
     def _signal_input(self):
-        if len(self.input_buffer) == 0:
-            raise EOFError("End of input file")
-        ord_char = self.input_buffer.pop(0)
-        if ord_char == 0:
-            symbol = ""
-        else:
-            symbol = chr(ord_char)
-        logging.debug(f"input: {symbol}")
+        ord_char = self.input_device.read()
+        logging.debug(f"input: {symbol(ord_char)}")
         return ord_char
 
     def _signal_output(self, ord_char: int):
-        symbol = "" if ord_char == 0 else chr(ord_char)
-        self.output_buffer.append(ord_char)
-        logging.debug(
-            f"output: {''.join(map(lambda x: chr(x) if 0 < x < 256 else str(x), self.output_buffer))} << {symbol}"
-        )
-        pass
+        self.output_device.write(ord_char)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self.output_log += render(ord_char)
+            logging.debug(f"output: {self.output_log} << {symbol(ord_char)}")
 
     def zero(self):
         return self.stack[self.stack_pointer] == 0
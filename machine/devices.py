@@ -0,0 +1,93 @@
+import sys
+from itertools import islice
+
+CHUNK_SIZE = 1 << 16
+
+
+# отображение машинного слова в текст вывода
+def render(ord_char: int) -> str:
+    return chr(ord_char) if 0 < ord_char < 256 else str(ord_char)
+
+
+# отображение символа для журнала
+def symbol(ord_char: int) -> str:
+    if ord_char == 0:
+        return ""
+    return chr(ord_char) if 0 < ord_char <= sys.maxunicode else str(ord_char)
+
+
+def _read_chars(stream, chunk_size: int):
+    chunk = stream.read(chunk_size)
+    while chunk:
+        yield from map(ord, chunk)
+        chunk = stream.read(chunk_size)
+
+
+def _read_file(path: str, chunk_size: int):
+    with open(path, "r") as f:
+        yield from _read_chars(f, chunk_size)
+
+
+# Порт ввода: символы читаются лениво из любого итератора кодов
+class InputDevice:
+    source = None
+    # сколько символов уже прочитано
+    position: int = None
+
+    def __init__(self, source):
+        self.source = iter(source)
+        self.position = 0
+
+    # файл читается блоками, в конце - завершающий 0
+    @classmethod
+    def from_file(cls, path: str, chunk_size: int = CHUNK_SIZE):
+        return cls(_with_terminator(_read_file(path, chunk_size)))
+
+    @classmethod
+    def from_stream(cls, stream=None, chunk_size: int = CHUNK_SIZE):
+        stream = sys.stdin if stream is None else stream
+        return cls(_with_terminator(_read_chars(stream, chunk_size)))
+
+    def read(self) -> int:
+        for ord_char in self.source:
+            self.position += 1
+            return ord_char
+        raise EOFError("End of input file")
+
+    # пропустить count символов (продолжение с контрольной точки)
+    def skip(self, count: int):
+        skipped = sum(1 for _ in islice(self.source, count))
+        self.position += skipped
+        if skipped < count:
+            raise EOFError("End of input file")
+
+
+def _with_terminator(chars):
+    yield from chars
+    yield 0
+
+
+# Порт вывода: символы пишутся в sink по мере вывода, при keep=True
+# дополнительно сохраняются для результата моделирования
+class OutputDevice:
+    sink = None
+    buffer: list = None
+    # сколько символов выведено
+    count: int = None
+
+    def __init__(self, sink=None, keep: bool = True):
+        self.sink = sink
+        self.buffer = [] if keep else None
+        self.count = 0
+
+    def write(self, ord_char: int):
+        self.count += 1
+        if self.buffer is not None:
+            self.buffer.append(ord_char)
+        if self.sink is not None:
+            self.sink.write(render(ord_char))
+
+    def text(self) -> str:
+        if self.buffer is None:
+            return ""
+        return "".join(map(render, self.buffer))
@@ -0,0 +1,104 @@
+from machine.cache import Cache
+from machine.isa import OPERANDS
+
+# слово инструкции -> количество слов-операндов
+OPERAND_WORDS = {opcode.value: count for opcode, count in OPERANDS.items()}
+
+
+# Выборка инструкций отдельно от обращений к данным: кеш инструкций и
+# буфер последовательной предвыборки. При промахе кеша строка берётся из
+# буфера (если она там есть) за время попадания, а буфер заполняется
+# следующими prefetch строками. Каждое слово инструкции (код операции и
+# операнды) выбирается через кеш, такты сверх одного на слово добавляются
+# к тактам инструкции.
+class FetchUnit:
+    cache: Cache = None
+    prefetch: int = None
+    # строки в буфере предвыборки
+    buffer: set = None
+
+    fetches: int = None
+    prefetch_hits: int = None
+    prefetched: int = None
+    stall_ticks: int = None
+
+    def __init__(self, cache: Cache, prefetch: int = 0):
+        assert prefetch >= 0, "Prefetch depth must not be negative"
+        self.cache = cache
+        self.prefetch = prefetch
+        self.buffer = set()
+        self.fetches = 0
+        self.prefetch_hits = 0
+        self.prefetched = 0
+        self.stall_ticks = 0
+
+    # такты выборки инструкции по адресу pc: не меньше одного
+    def fetch(self, pc: int, word: int) -> int:
+        ticks = 1
+        for addr in range(pc, pc + 1 + OPERAND_WORDS.get(word, 0)):
+            ticks += self.word_latency(addr) - 1
+        self.stall_ticks += ticks - 1
+        return ticks
+
+    def word_latency(self, addr: int) -> int:
+        cache = self.cache
+        self.fetches += 1
+        misses = cache.misses
+        latency = cache.access(addr, False)
+        if cache.misses == misses:
+            return latency
+
+        line = addr // cache.line_size
+        if line in self.buffer:
+            self.prefetch_hits += 1
+            latency = cache.hit_latency
+        if self.prefetch > 0:
+            lines = set(range(line + 1, line + 1 + self.prefetch))
+            self.prefetched += len(lines - self.buffer)
+            self.buffer = lines
+        return latency
+
+    # строк, прочитанных из памяти: промахи мимо буфера и предвыборка
+    def memory_reads(self) -> int:
+        return self.cache.misses - self.prefetch_hits + self.prefetched
+
+    def stats(self) -> dict:
+        return {
+            "fetches": self.fetches,
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetched": self.prefetched,
+            "memory_reads": self.memory_reads(),
+            "stall_ticks": self.stall_ticks,
+        }
+
+    def __repr__(self):
+        cache = self.cache
+        hit_rate = 100 * cache.hits / self.fetches if self.fetches else 0
+        return (
+            f"icache {cache.sets}x{cache.ways}x{cache.line_size} "
+            f"prefetch {self.prefetch}: "
+            f"fetches: {self.fetches} hits: {cache.hits} misses: {cache.misses} "
+            f"prefetch hits: {self.prefetch_hits} prefetched: {self.prefetched} "
+            f"memory reads: {self.memory_reads()} stall ticks: {self.stall_ticks} "
+            f"hit rate: {hit_rate:.2f}%"
+        )
+
+
+# кеш инструкций размером size слов
+def instruction_cache(
+    size: int, line_size: int, ways: int, hit_latency: int, miss_latency: int
+) -> Cache:
+    assert size % (line_size * ways) == 0, (
+        "Cache size must be a multiple of line size * ways"
+    )
+    return Cache(
+        line_size,
+        size // (line_size * ways),
+        ways,
+        "lru",
+        "back",
+        hit_latency,
+        miss_latency,
+    )
@@ -0,0 +1,188 @@
+from machine.control_unit import ControlUnit, predecode
+from machine.datapath import Datapath, words
+from machine.devices import InputDevice, OutputDevice
+from machine.isa import Opcode
+from machine.memory import PagedMemory
+
+# tick - исполняется ядро с наименьшим тактом (при равенстве - с меньшим
+# номером), обращения к памяти ждут общей шины; round_robin - по quantum
+# инструкций каждому ядру по очереди, без модели шины
+SCHEDULERS = ("tick", "round_robin")
+
+# инструкции, занимающие шину памяти на всё время исполнения
+BUS_OPCODES = {
+    Opcode.GET_VAL.value,
+    Opcode.STORE_VAL.value,
+    Opcode.LOAD.value,
+    Opcode.STORE.value,
+    Opcode.XADD.value,
+    Opcode.READ_BUF.value,
+    Opcode.WRITE_STR.value,
+}
+
+
+# Ядро: свои стеки, PC и счётчик тактов, память и устройства - общие
+class Hart:
+    index: int = None
+    start: int = None
+    control_unit: ControlUnit = None
+
+    instructions: int = None
+    # причина остановки: halt, eof, limit или None - ещё работает
+    reason: str = None
+    # тактов ожидания шины и таких ожиданий
+    stall_ticks: int = None
+    conflicts: int = None
+
+    def __init__(self, index: int, start: int, control_unit: ControlUnit):
+        self.index = index
+        self.start = start
+        self.control_unit = control_unit
+        self.instructions = 0
+        self.reason = None
+        self.stall_ticks = 0
+        self.conflicts = 0
+
+    def step(self):
+        self.instructions += 1
+        try:
+            self.control_unit.decode_and_execute_instruction()
+        except EOFError:
+            self.reason = "eof"
+        except StopIteration:
+            self.reason = "halt"
+
+    def stats(self) -> dict:
+        return {
+            "start": self.start,
+            "instructions": self.instructions,
+            "ticks": self.control_unit.current_tick(),
+            "reason": self.reason,
+            "stall_ticks": self.stall_ticks,
+            "conflicts": self.conflicts,
+        }
+
+
+# Несколько ядер над одной памятью фон Неймана: общие массив кода и данных,
+# его предекодирование (запись кода одним ядром видна остальным), BSS и
+# порты ввода-вывода. Порядок исполнения определяется только планировщиком,
+# поэтому результат воспроизводим.
+class MultiHart:
+    code: list = None
+    harts: list = None
+    scheduler: str = None
+    quantum: int = None
+    # такт, с которого шина памяти свободна
+    bus_free: int = None
+
+    def __init__(
+        self,
+        code: list,
+        starts: list,
+        stack_size: int,
+        input_buffer,
+        scheduler: str = "tick",
+        quantum: int = 1,
+        bss_size: int = 0,
+        output_device: OutputDevice = None,
+    ):
+        assert starts, "At least one hart is required"
+        assert scheduler in SCHEDULERS, f"Unknown scheduler: {scheduler}"
+        assert quantum > 0, "Quantum must be positive"
+        code = words(code)
+        bss = PagedMemory(len(code), bss_size)
+        if not isinstance(input_buffer, InputDevice):
+            input_buffer = InputDevice(input_buffer)
+        if output_device is None:
+            output_device = OutputDevice()
+        decoded = predecode(code)
+        self.code = code
+        self.harts = []
+        for index, start in enumerate(starts):
+            datapath = Datapath(
+                code, stack_size, input_buffer, None, output_device, bss
+            )
+            control_unit = ControlUnit(code, start, stack_size, datapath, decoded)
+            self.harts.append(Hart(index, start, control_unit))
+        self.scheduler = scheduler
+        self.quantum = quantum
+        self.bus_free = 0
+
+    def output_device(self) -> OutputDevice:
+        return self.harts[0].control_unit.datapath.output_device
+
+    def running(self) -> list:
+        return [hart for hart in self.harts if hart.reason is None]
+
+    def run(self, limit: int):
+        if self.scheduler == "tick":
+            self._run_by_tick(limit)
+        else:
+            self._run_round_robin(limit)
+        for hart in self.harts:
+            if hart.reason is None:
+                hart.reason = "limit"
+
+    def _run_by_tick(self, limit: int):
+        while True:
+            hart = min(
+                self.running(),
+                key=lambda hart: (hart.control_unit.current_tick(), hart.index),
+                default=None,
+            )
+            if hart is None:
+                return
+            control_unit = hart.control_unit
+            if control_unit.current_tick() >= limit:
+                hart.reason = "limit"
+                continue
+            if control_unit.program[control_unit.program_counter] in BUS_OPCODES:
+                wait = self.bus_free - control_unit.current_tick()
+                if wait > 0:
+                    hart.stall_ticks += wait
+                    hart.conflicts += 1
+                    control_unit._tick += wait
+                hart.step()
+                self.bus_free = control_unit.current_tick()
+            else:
+                hart.step()
+
+    def _run_round_robin(self, limit: int):
+        while True:
+            harts = self.running()
+            if not harts:
+                return
+            for hart in harts:
+                for _ in range(self.quantum):
+                    if hart.control_unit.current_tick() >= limit:
+                        hart.reason = "limit"
+                    if hart.reason is not None:
+                        break
+                    hart.step()
+
+    def instructions(self) -> int:
+        return sum(hart.instructions for hart in self.harts)
+
+    # такт завершения последнего ядра
+    def ticks(self) -> int:
+        return max(hart.control_unit.current_tick() for hart in self.harts)
+
+    def stats(self) -> dict:
+        return {
+            "scheduler": self.scheduler,
+            "instructions": self.instructions(),
+            "ticks": self.ticks(),
+            "stall_ticks": sum(hart.stall_ticks for hart in self.harts),
+            "conflicts": sum(hart.conflicts for hart in self.harts),
+            "harts": [hart.stats() for hart in self.harts],
+        }
+
+    def __repr__(self):
+        return " ".join(
+            [
+                f"harts {len(self.harts)} scheduler {self.scheduler}:",
+                f"instructions: {self.instructions()} ticks: {self.ticks()}",
+                f"bus conflicts: {sum(hart.conflicts for hart in self.harts)}",
+                f"stall ticks: {sum(hart.stall_ticks for hart in self.harts)}",
+            ]
+        )
@@ -0,0 +1,135 @@
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from machine.datapath import words
+from machine.isa import BITS, WORD_TYPECODE
+
+MAGIC = b"CSAI"
+VERSION = 1
+
+# заголовок: сигнатура, версия, флаги, адрес начала, длины секций кода,
+# данных и BSS в словах, длина таблицы символов в байтах. Дальше секции
+# кода и данных (слова little-endian) и таблица символов (JSON, UTF-8)
+HEADER = struct.Struct("<4sHHiiiiI")
+
+WORD_SIZE = BITS // 8
+
+
+# Образ программы: секции кода, данных и обнулённой памяти (BSS, только
+# длина) и необязательная таблица символов транслятора: функции,
+# переменные, метки и соответствие адресов кода строкам исходника
+class Image:
+    start: int = None
+    code: array = None
+    data: array = None
+    bss_size: int = None
+    symbols: dict = None
+
+    def __init__(
+        self,
+        start: int,
+        code,
+        data=(),
+        bss_size: int = 0,
+        symbols: dict = None,
+    ):
+        assert bss_size >= 0, "BSS size must not be negative"
+        self.start = start
+        self.code = words(code)
+        self.data = words(data)
+        self.bss_size = bss_size
+        self.symbols = symbols
+
+    # память модели: код и данные подряд, BSS - после них
+    def memory(self) -> array:
+        return self.code + self.data
+
+    # адрес начала, код и данные одним списком слов
+    def words(self) -> list:
+        return [self.start] + self.code.tolist() + self.data.tolist()
+
+
+def _to_bytes(words: array) -> bytes:
+    if sys.byteorder != "little":
+        words = array(WORD_TYPECODE, words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def _from_bytes(blob) -> array:
+    words = array(WORD_TYPECODE)
+    words.frombytes(blob)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words
+
+
+# образ в байтах файла
+def pack_image(image: Image) -> bytes:
+    symbols = b""
+    if image.symbols is not None:
+        symbols = json.dumps(image.symbols, separators=(",", ":")).encode("utf-8")
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        0,
+        image.start,
+        len(image.code),
+        len(image.data),
+        image.bss_size,
+        len(symbols),
+    )
+    return header + _to_bytes(image.code) + _to_bytes(image.data) + symbols
+
+
+def write_image(target: str, image: Image):
+    with open(target, "wb") as f:
+        f.write(pack_image(image))
+
+
+# Файл читается одним обращением, секции разбираются из памяти
+def read_image(source: str) -> Image:
+    with open(source, "rb") as f:
+        return unpack_image(f.read(), source)
+
+
+# Байты без сигнатуры - образ старого формата: адрес начала, затем код и данные
+def unpack_image(blob, source: str = "image") -> Image:
+    blob = memoryview(blob)
+    if blob[: len(MAGIC)] != MAGIC:
+        assert len(blob) % WORD_SIZE == 0, f"Image is not a multiple of {BITS} bits"
+        words = _from_bytes(blob)
+        assert words, f"{source} is empty"
+        return Image(words[0], words[1:])
+
+    assert len(blob) >= HEADER.size, f"{source}: truncated header"
+    _, version, _, start, code_size, data_size, bss_size, symbols_size = (
+        HEADER.unpack_from(blob)
+    )
+    assert version == VERSION, f"Unsupported image version: {version}"
+    code_end = HEADER.size + code_size * WORD_SIZE
+    data_end = code_end + data_size * WORD_SIZE
+    assert len(blob) == data_end + symbols_size, f"{source}: wrong section sizes"
+
+    symbols = None
+    if symbols_size > 0:
+        symbols = json.loads(bytes(blob[data_end:]).decode("utf-8"))
+    return Image(
+        start,
+        _from_bytes(blob[HEADER.size : code_end]),
+        _from_bytes(blob[code_end:data_end]),
+        bss_size,
+        symbols,
+    )
+
+
+# строка исходника для адреса кода по таблице символов или None
+def source_line(symbols: dict, pc: int):
+    lines = symbols.get("lines") or []
+    index = bisect_right(lines, [pc, float("inf")]) - 1
+    if index < 0:
+        return None
+    return lines[index][1]
@@ -0,0 +1,177 @@
+from collections import deque
+
+from machine.devices import InputDevice
+
+# тактов на вход в прерывание: адрес возврата на стек возврата, PC - вектор
+INTERRUPT_TICKS = 2
+
+
+# Порт ввода с расписанием: символ появляется в порту на своём такте и
+# ждёт чтения в очереди. Чтение видит символы, пришедшие к такту самого
+# обращения (clock - такты модели, включая уже учтённые такты текущей
+# инструкции), а не к её началу. Чтение из пустой очереди ждёт следующего
+# символа, такты ожидания забирает устройство управления (take_wait)
+class ScheduledInput(InputDevice):
+    # [(такт, код символа)] по неубыванию тактов
+    schedule: list = None
+    # символов, пришедших к такту now
+    arrived: int = None
+    now: int = None
+    # символов, о приходе которых уже сообщил poll
+    signalled: int = None
+    # (такт прихода, код) пришедших и ещё не прочитанных символов
+    queue: deque = None
+    # текущий такт модели, без него - такт последнего poll
+    clock = None
+
+    # ожидание, ещё не учтённое в тактах модели
+    wait: int = None
+    wait_ticks: int = None
+    # от прихода символа до его чтения
+    latency_sum: int = None
+    latency_max: int = None
+    last_read: int = None
+
+    def __init__(self, schedule):
+        self.schedule = [(tick, ord_char) for tick, ord_char in schedule]
+        assert all(
+            prev[0] <= item[0] for prev, item in zip(self.schedule, self.schedule[1:])
+        ), "Input schedule must be sorted by tick"
+        self.position = 0
+        self.arrived = 0
+        self.now = 0
+        self.signalled = 0
+        self.queue = deque()
+        self.wait = 0
+        self.wait_ticks = 0
+        self.latency_sum = 0
+        self.latency_max = 0
+        self.last_read = None
+
+    # символы через interval тактов, первый - на такте start
+    @classmethod
+    def uniform(cls, chars, interval: int, start: int = 0):
+        assert interval >= 0, "Input interval must not be negative"
+        return cls((start + index * interval, char) for index, char in enumerate(chars))
+
+    # символы, пришедшие к такту tick, - в очередь
+    def advance(self, tick: int):
+        self.now = max(self.now, tick)
+        schedule = self.schedule
+        while self.arrived < len(schedule) and schedule[self.arrived][0] <= self.now:
+            self.queue.append(schedule[self.arrived])
+            self.arrived += 1
+
+    # такты прихода символов, пришедших к такту tick после прошлого poll,
+    # в том числе замеченных чтением внутри инструкции
+    def poll(self, tick: int) -> list:
+        self.advance(tick)
+        begin, self.signalled = self.signalled, self.arrived
+        return [arrival for arrival, _ in self.schedule[begin : self.arrived]]
+
+    def read(self) -> int:
+        if self.clock is not None:
+            self.advance(self.clock())
+        if not self.queue:
+            if self.arrived == len(self.schedule):
+                raise EOFError("End of input file")
+            arrival = self.schedule[self.arrived][0]
+            self.wait += arrival - self.now
+            self.wait_ticks += arrival - self.now
+            self.advance(arrival)
+        arrival, ord_char = self.queue.popleft()
+        latency = self.now - arrival
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.last_read = self.now
+        self.position += 1
+        return ord_char
+
+    def take_wait(self) -> int:
+        wait, self.wait = self.wait, 0
+        return wait
+
+    # такты прихода и очередь в контрольную точку не сохраняются
+    def skip(self, count: int):
+        raise ValueError("Scheduled input can not resume from a checkpoint")
+
+    def stats(self) -> dict:
+        read = self.position
+        first = self.schedule[0][0] if self.schedule else 0
+        span = (self.last_read - first) if self.last_read is not None else 0
+        return {
+            "scheduled": len(self.schedule),
+            "read": read,
+            "pending": len(self.queue),
+            "wait_ticks": self.wait_ticks,
+            "latency_avg": self.latency_sum / read if read else 0,
+            "latency_max": self.latency_max,
+            # символов за такт от прихода первого до последнего чтения
+            "throughput": read / span if span > 0 else 0,
+        }
+
+
+# Контроллер прерываний по приходу символов в порт ввода. Каждый пришедший
+# символ - запрос; при разрешённых прерываниях запрос обслуживается перед
+# выборкой следующей инструкции: адрес возврата - на стек возврата, PC -
+# вектор, прерывания запрещаются до IRET. Без вектора прерывания не
+# возникают, порт только задаёт такты прихода ввода
+class InterruptController:
+    device: ScheduledInput = None
+    vector: int = None
+    enabled: bool = None
+    # такты прихода необслуженных запросов
+    requests: deque = None
+
+    interrupts: int = None
+    # от прихода символа до входа в обработчик
+    latency_sum: int = None
+    latency_max: int = None
+
+    def __init__(self, device: ScheduledInput, vector: int = None):
+        self.device = device
+        self.vector = vector
+        self.enabled = False
+        self.requests = deque()
+        self.interrupts = 0
+        self.latency_sum = 0
+        self.latency_max = 0
+
+    # True - войти в прерывание перед инструкцией на такте tick
+    def request(self, tick: int) -> bool:
+        arrivals = self.device.poll(tick)
+        if self.vector is None:
+            return False
+        self.requests.extend(arrivals)
+        if not self.enabled or not self.requests:
+            return False
+        latency = tick - self.requests.popleft()
+        self.enabled = False
+        self.interrupts += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "vector": self.vector,
+            "interrupts": self.interrupts,
+            "latency_avg": self.latency_sum / self.interrupts if self.interrupts else 0,
+            "latency_max": self.latency_max,
+            "input": self.device.stats(),
+        }
+
+    def __repr__(self):
+        device = self.device.stats()
+        return " ".join(
+            [
+                f"interrupts vector {self.vector}: {self.interrupts}",
+                f"latency avg: {self.stats()['latency_avg']:.2f}",
+                f"max: {self.latency_max}",
+                f"input read: {device['read']}/{device['scheduled']}",
+                f"read latency avg: {device['latency_avg']:.2f}",
+                f"max: {device['latency_max']}",
+                f"wait ticks: {device['wait_ticks']}",
+                f"throughput: {device['throughput']:.4f} chars/tick",
+            ]
+        )
@@ -1,4 +1,4 @@
-import struct
+from array import array
 from enum import Enum
 
 BITS = 32
@@ -6,6 +6,9 @@ MIN_SIGN = -(2 ** (BITS - 1))
 MAX_SIGN = 2 ** (BITS - 1) - 1
 MAX_UNSIGN = 2**BITS - 1
 
+# 32-битное знаковое слово; в образе всегда little-endian
+WORD_TYPECODE = next(code for code in "il" if array(code).itemsize == BITS // 8)
+
 MAP_INPUT_ADDRESS = 0
 MAP_OUTPUT_ADDRESS = 1
 
@@ -25,6 +28,8 @@ class Opcode(Enum):
     CALL = 2
     RET = 3
     HLT = 4
+    # JNE n addr: переход, если на вершине стека не n (PUSH n; EQ; JZ addr)
+    JNE = 5
 
     # Работа со стеком
     GET_VAL = 10
@@ -34,6 +39,10 @@ class Opcode(Enum):
     DROP = 14
     PUSHR = 15
     DROPR = 16
+    # LOAD addr: PUSH addr; GET_VAL
+    LOAD = 17
+    # STORE addr: значение с вершины стека по адресу (PUSH addr; ...; STORE_VAL)
+    STORE = 18
 
     # Арифметика
     ADD = 20
@@ -42,19 +51,89 @@ class Opcode(Enum):
     EQ = 23
     OR = 24
 
+    # Арифметика с непосредственным операндом: PUSH n; ADD -> ADDI n
+    ADDI = 25
+    SUBI = 26
+    MODI = 27
+    EQI = 28
+    ORI = 29
+
+    # Атомарные операции с памятью (несколько ядер)
+    # XADD: [addr, n] -> [старое M[addr]], M[addr] += n одним обращением к шине
+    XADD = 30
+
+    # Прерывания: разрешить, запретить, возврат из обработчика
+    # (PC - с вершины стека возврата, прерывания снова разрешены)
+    EI = 31
+    DI = 32
+    IRET = 33
+
+    # Блочный ввод-вывод (DMA) со строками: длина в первом слове, дальше символы
+    # READ_BUF: [addr, n] -> [], до n символов ввода (до 0 или конца ввода)
+    # в M[addr + 1 ...], их число - в M[addr]
+    READ_BUF = 34
+    # WRITE_STR: [addr] -> [], вывод M[addr] символов из M[addr + 1 ...]
+    WRITE_STR = 35
 
-def write_code(target: str, code: list[int]):
-    with open(target, "wb") as f:
-        f.write(struct.pack(f"{len(code)}I", *code))
 
+# количество слов-операндов, следующих за кодом операции
+OPERANDS = {
+    Opcode.JMP: 1,
+    Opcode.JZ: 1,
+    Opcode.CALL: 1,
+    Opcode.PEEK: 1,
+    Opcode.PUSH: 1,
+    Opcode.PUSHR: 1,
+    Opcode.JNE: 2,
+    Opcode.LOAD: 1,
+    Opcode.STORE: 1,
+    Opcode.ADDI: 1,
+    Opcode.SUBI: 1,
+    Opcode.MODI: 1,
+    Opcode.EQI: 1,
+    Opcode.ORI: 1,
+}
 
-def read_code(source: str) -> list[int]:
-    code = []
-    BYTES = BITS // 8
-    with open(source, "rb") as f:
-        short = f.read(BYTES)
-        while short:
-            code.append(*struct.unpack("I", short))
-            short = f.read(BYTES)
+# действие инструкции на стек данных: (снимает, кладёт)
+STACK_EFFECTS = {
+    Opcode.JMP: (0, 0),
+    Opcode.JZ: (1, 0),
+    Opcode.CALL: (0, 0),
+    Opcode.RET: (0, 0),
+    Opcode.HLT: (0, 0),
+    Opcode.JNE: (1, 0),
+    Opcode.GET_VAL: (1, 1),
+    Opcode.STORE_VAL: (2, 0),
+    Opcode.PEEK: (0, 1),
+    Opcode.PUSH: (0, 1),
+    Opcode.DROP: (1, 0),
+    Opcode.PUSHR: (0, 0),
+    Opcode.DROPR: (0, 0),
+    Opcode.LOAD: (0, 1),
+    Opcode.STORE: (1, 0),
+    Opcode.ADD: (2, 1),
+    Opcode.SUB: (2, 1),
+    Opcode.MOD: (2, 1),
+    Opcode.EQ: (2, 1),
+    Opcode.OR: (2, 1),
+    Opcode.ADDI: (1, 1),
+    Opcode.SUBI: (1, 1),
+    Opcode.MODI: (1, 1),
+    Opcode.EQI: (1, 1),
+    Opcode.ORI: (1, 1),
+    Opcode.XADD: (2, 1),
+    Opcode.EI: (0, 0),
+    Opcode.DI: (0, 0),
+    Opcode.IRET: (0, 0),
+    Opcode.READ_BUF: (2, 0),
+    Opcode.WRITE_STR: (1, 0),
+}
 
-    return code
+# действие на стек возврата; PEEK n читает слово на глубине n, не снимая
+RETURN_STACK_EFFECTS = {
+    Opcode.CALL: (0, 1),
+    Opcode.RET: (1, 0),
+    Opcode.PUSHR: (0, 1),
+    Opcode.DROPR: (1, 0),
+    Opcode.IRET: (1, 0),
+}
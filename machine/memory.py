@@ -0,0 +1,55 @@
+from array import array
+
+from machine.isa import WORD_TYPECODE
+
+# слов в странице
+PAGE_SIZE = 1024
+
+_ZERO_PAGE = bytes(PAGE_SIZE * array(WORD_TYPECODE).itemsize)
+
+
+# Обнулённая при запуске память (BSS) после образа: адреса base..base+size-1.
+# Страница создаётся при первой записи, несозданная страница читается нулями,
+# поэтому размер образа и время загрузки не зависят от размера буферов
+class PagedMemory:
+    __slots__ = ("base", "size", "pages")
+
+    base: int
+    size: int
+    # номер страницы -> слова страницы
+    pages: dict
+
+    def __init__(self, base: int, size: int = 0, pages: dict = None):
+        assert size >= 0, "Memory size must not be negative"
+        self.base = base
+        self.size = size
+        self.pages = {}
+        for index, words in (pages or {}).items():
+            self.page(int(index))[:] = array(WORD_TYPECODE, words)
+
+    def offset(self, addr: int) -> int:
+        offset = addr - self.base
+        if not 0 <= offset < self.size:
+            raise IndexError(f"Address out of memory: {addr}")
+        return offset
+
+    def page(self, index: int) -> array:
+        page = self.pages.get(index)
+        if page is None:
+            page = self.pages[index] = array(WORD_TYPECODE, _ZERO_PAGE)
+        return page
+
+    def read(self, addr: int) -> int:
+        offset = self.offset(addr)
+        page = self.pages.get(offset // PAGE_SIZE)
+        if page is None:
+            return 0
+        return page[offset % PAGE_SIZE]
+
+    def write(self, addr: int, value: int):
+        offset = self.offset(addr)
+        self.page(offset // PAGE_SIZE)[offset % PAGE_SIZE] = value
+
+    # созданные страницы для контрольной точки
+    def snapshot(self) -> dict:
+        return {index: page.tolist() for index, page in sorted(self.pages.items())}
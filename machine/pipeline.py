@@ -0,0 +1,282 @@
+from machine.control_unit import TICKS, ControlUnit
+from machine.datapath import Datapath
+from machine.fetch import FetchUnit
+from machine.isa import OPERANDS, RETURN_STACK_EFFECTS, STACK_EFFECTS, Opcode
+from machine.stack_cache import StackCache
+
+# none - выборка ждёт вычисления условия, остальные - предсказание
+# направления JZ/JNE: статические и 2-битные счётчики по адресу (bimodal)
+PREDICTORS = ("none", "not_taken", "taken", "bimodal")
+STALL_CAUSES = (
+    "fetch",
+    "icache",
+    "stack",
+    "return_stack",
+    "memory",
+    "cache",
+    "spill",
+    "dma",
+    "control",
+)
+
+# конвейер: выборка, декодирование, исполнение (с обращением к памяти),
+# запись результата; первая инструкция доходит до исполнения на третьем такте
+STAGES = ("fetch", "decode", "execute", "writeback")
+FILL = STAGES.index("execute")
+
+# переход известен при декодировании (адрес - операнд или вершина стека
+# возврата): теряется выбранная за ним инструкция
+JUMP_PENALTY = 1
+# условие вычисляется при исполнении: сбрасываются две выбранные инструкции
+BRANCH_PENALTY = 2
+
+MEMORY_OPCODES = {
+    Opcode.GET_VAL.value,
+    Opcode.STORE_VAL.value,
+    Opcode.LOAD.value,
+    Opcode.STORE.value,
+    Opcode.READ_BUF.value,
+    Opcode.WRITE_STR.value,
+}
+# такты передачи сверх подготовки - простой dma, а не кеша
+DMA_OPCODES = {Opcode.READ_BUF.value, Opcode.WRITE_STR.value}
+LOAD_OPCODES = {Opcode.GET_VAL.value, Opcode.LOAD.value}
+JUMP_OPCODES = {
+    Opcode.JMP.value,
+    Opcode.CALL.value,
+    Opcode.RET.value,
+    Opcode.IRET.value,
+}
+BRANCH_OPCODES = {Opcode.JZ.value, Opcode.JNE.value}
+
+
+# Параметры и статистика конвейера. Функционально инструкции исполняются
+# обработчиками ControlUnit, конвейер определяет только такты: такт
+# исполнения каждой инструкции с учётом простоев по причинам
+class Pipeline:
+    fetch_width: int = None
+    forwarding: bool = None
+    predictor: str = None
+    predictor_size: int = None
+
+    # адрес перехода % predictor_size -> 2-битный счётчик (0..3, 2+ - переход)
+    counters: list = None
+
+    instructions: int = None
+    cycles: int = None
+    stalls: dict = None
+    branches: int = None
+    mispredictions: int = None
+
+    def __init__(
+        self,
+        fetch_width: int = 1,
+        forwarding: bool = True,
+        predictor: str = "none",
+        predictor_size: int = 256,
+    ):
+        assert fetch_width > 0, "Fetch width must be positive"
+        assert predictor in PREDICTORS, f"Unknown predictor: {predictor}"
+        assert predictor_size > 0, "Predictor size must be positive"
+        self.fetch_width = fetch_width
+        self.forwarding = forwarding
+        self.predictor = predictor
+        self.predictor_size = predictor_size
+        self.counters = [1] * predictor_size
+        self.instructions = 0
+        self.cycles = 0
+        self.stalls = dict.fromkeys(STALL_CAUSES, 0)
+        self.branches = 0
+        self.mispredictions = 0
+
+    def predict(self, pc: int) -> bool:
+        if self.predictor == "taken":
+            return True
+        if self.predictor == "bimodal":
+            return self.counters[pc % self.predictor_size] >= 2
+        return False
+
+    def update(self, pc: int, taken: bool):
+        index = pc % self.predictor_size
+        if taken:
+            self.counters[index] = min(self.counters[index] + 1, 3)
+        else:
+            self.counters[index] = max(self.counters[index] - 1, 0)
+
+    # штраф за переход по предсказанию (или без него) и фактическому направлению
+    def branch_penalty(self, pc: int, taken: bool) -> int:
+        self.branches += 1
+        if self.predictor == "none":
+            return BRANCH_PENALTY
+        predicted = self.predict(pc)
+        self.update(pc, taken)
+        if predicted != taken:
+            self.mispredictions += 1
+            return BRANCH_PENALTY
+        # адрес перехода - операнд, выборка перенаправляется при декодировании
+        return JUMP_PENALTY if taken else 0
+
+    def stats(self) -> dict:
+        return {
+            "instructions": self.instructions,
+            "cycles": self.cycles,
+            "cpi": self.cpi(),
+            "stalls": dict(self.stalls),
+            "branches": self.branches,
+            "mispredictions": self.mispredictions,
+            "accuracy": self.accuracy(),
+        }
+
+    def cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions else 0
+
+    def accuracy(self) -> float:
+        if self.predictor == "none" or not self.branches:
+            return 0
+        return 1 - self.mispredictions / self.branches
+
+    def __repr__(self):
+        stalls = " ".join(f"{cause}: {count}" for cause, count in self.stalls.items())
+        text = (
+            f"pipeline {len(STAGES)} stages, fetch {self.fetch_width}, "
+            f"forwarding {'on' if self.forwarding else 'off'}, "
+            f"predictor {self.predictor}: "
+            f"instructions: {self.instructions} cycles: {self.cycles} "
+            f"CPI: {self.cpi():.3f} stalls: {stalls} branches: {self.branches}"
+        )
+        if self.predictor != "none":
+            text += (
+                f" mispredictions: {self.mispredictions}"
+                f" accuracy: {100 * self.accuracy():.2f}%"
+            )
+        return text
+
+
+# Устройство управления с конвейером: по одной инструкции за такт, простои
+# из-за зависимостей по стекам (значение ещё не вычислено), обращений к
+# памяти (одна шина с выборкой), многословных инструкций и переходов.
+# Такт модели - такт исполнения последней инструкции.
+class PipelineControlUnit(ControlUnit):
+    __slots__ = ("pipeline", "stack_ready", "return_ready")
+
+    pipeline: Pipeline
+    # для ячеек стеков: такт, с которого значение можно использовать
+    stack_ready: list
+    return_ready: list
+
+    def __init__(
+        self,
+        code: list,
+        start: int,
+        stack_size: int,
+        datapath: Datapath,
+        pipeline: Pipeline,
+        decoded: list = None,
+        fetch_unit: FetchUnit = None,
+        stack_cache: StackCache = None,
+    ):
+        super().__init__(
+            code, start, stack_size, datapath, decoded, fetch_unit, stack_cache
+        )
+        self.pipeline = pipeline
+        self.stack_ready = [0] * datapath.stack_size
+        self.return_ready = [0] * stack_size
+        # заполнение конвейера до исполнения первой инструкции
+        self._tick = FILL
+
+    def decode_and_execute_instruction(self):
+        pipeline = self.pipeline
+        stalls = pipeline.stalls
+        dp = self.datapath
+        pc = self.program_counter
+        word = self.program[pc]
+        operands, pops, pushes, rpushes, base = TIMING.get(word, (0, 0, 0, 0, 0))
+
+        issue = self._tick + 1
+        # слова операндов выбираются по fetch_width за такт
+        fetch = (operands + pipeline.fetch_width) // pipeline.fetch_width - 1
+        stalls["fetch"] += fetch
+        issue += fetch
+        if self.fetch_unit is not None:
+            icache = self.fetch_unit.fetch(pc, word) - 1
+            stalls["icache"] += icache
+            issue += icache
+
+        # чтение стека данных ждёт значений предыдущих инструкций
+        sp = dp.stack_pointer
+        if pops > 0 and sp >= 0:
+            ready = max(self.stack_ready[max(sp - pops + 1, 0) : sp + 1])
+            if ready > issue:
+                stalls["stack"] += ready - issue
+                issue = ready
+        rsp = self.return_stack_pointer
+        read = None
+        if word == Opcode.RET.value or word == Opcode.IRET.value:
+            read = rsp
+        elif word == Opcode.PEEK.value:
+            read = rsp - self.program[pc + 1]
+        if read is not None and 0 <= read < self.return_stack_size:
+            ready = self.return_ready[read]
+            if ready > issue:
+                stalls["return_stack"] += ready - issue
+                issue = ready
+
+        self.instruction_register = word
+        self.program_counter = pc + 1
+        # обработчик считает такты последовательной модели: сверх base -
+        # задержка кеша данных
+        self._tick = 0
+        try:
+            self.decoded[pc](self)
+        finally:
+            memory = self._tick - base
+            self._tick = pipeline.cycles = issue
+            pipeline.instructions += 1
+
+        if memory > 0:
+            stalls["dma" if word in DMA_OPCODES else "cache"] += memory
+            issue += memory
+        if self.stack_cache is not None:
+            operand = self.program[pc + 1] if word == Opcode.PEEK.value else 0
+            spill = self.stack_cache.step(word, sp, rsp, operand)
+            stalls["spill"] += spill
+            issue += spill
+
+        # без обходных путей значение доступно после записи результата
+        latency = 1 if pipeline.forwarding else 2
+        if word in LOAD_OPCODES:
+            latency += 1
+        sp = dp.stack_pointer
+        for slot in range(sp - pushes + 1, sp + 1):
+            self.stack_ready[slot] = issue + latency
+        if rpushes > 0:
+            self.return_ready[self.return_stack_pointer] = issue + 1
+
+        # шина памяти занята исполнением: следующая выборка ждёт такт
+        if word in MEMORY_OPCODES:
+            stalls["memory"] += 1
+            issue += 1
+
+        penalty = 0
+        if word in JUMP_OPCODES:
+            penalty = JUMP_PENALTY
+        elif word in BRANCH_OPCODES:
+            taken = self.program_counter != pc + 1 + operands
+            penalty = pipeline.branch_penalty(pc, taken)
+        stalls["control"] += penalty
+        issue += penalty
+
+        self._tick = pipeline.cycles = issue
+
+
+# слово инструкции -> (операндов, снимает и кладёт на стек данных, кладёт на
+# стек возврата, тактов обработчика в последовательной модели без выборки)
+TIMING = {
+    opcode.value: (
+        OPERANDS.get(opcode, 0),
+        *STACK_EFFECTS[opcode],
+        RETURN_STACK_EFFECTS.get(opcode, (0, 0))[1],
+        TICKS[opcode] - 1,
+    )
+    for opcode in Opcode
+}
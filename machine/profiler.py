@@ -0,0 +1,136 @@
+import json
+from collections import defaultdict
+
+from machine.image import source_line
+from machine.isa import Opcode
+
+ROOT = "main"
+
+
+# Профилировщик: счётчики и такты по опкодам, гистограмма по PC и такты
+# пользовательских функций (по переходам CALL/RET). Исполняет инструкции сам,
+# поэтому вызывается вместо ControlUnit.decode_and_execute_instruction.
+class Profiler:
+    # адрес начала функции -> имя
+    functions: dict = None
+    # таблица символов с соответствием адресов строкам исходника
+    symbols: dict = None
+
+    opcode_counts: dict = None
+    opcode_ticks: dict = None
+    pc_hits: dict = None
+
+    # вызовы: [имя, путь в стеке, такт входа]
+    frames: list = None
+    calls: dict = None
+    inclusive: dict = None
+    exclusive: dict = None
+    # путь в стеке вызовов -> собственные такты (collapsed stacks)
+    stacks: dict = None
+
+    def __init__(self, functions: dict = None, symbols: dict = None):
+        self.functions = {} if functions is None else dict(functions)
+        self.symbols = {} if symbols is None else symbols
+        self.opcode_counts = defaultdict(int)
+        self.opcode_ticks = defaultdict(int)
+        self.pc_hits = defaultdict(int)
+        self.frames = [[ROOT, ROOT, 0]]
+        self.calls = defaultdict(int, {ROOT: 1})
+        self.inclusive = defaultdict(int)
+        self.exclusive = defaultdict(int)
+        self.stacks = defaultdict(int)
+
+    # имена функций из таблицы символов транслятора
+    @classmethod
+    def from_symbols(cls, symbols: dict):
+        functions = {addr: name for name, addr in symbols.get("functions", {}).items()}
+        return cls(functions, symbols)
+
+    def execute(self, control_unit):
+        pc = control_unit.program_counter
+        word = control_unit.program[pc]
+        start = control_unit._tick
+        try:
+            control_unit.decode_and_execute_instruction()
+        finally:
+            ticks = control_unit._tick - start
+            self.opcode_counts[word] += 1
+            self.opcode_ticks[word] += ticks
+            self.pc_hits[pc] += 1
+
+            frame = self.frames[-1]
+            self.exclusive[frame[0]] += ticks
+            self.stacks[frame[1]] += ticks
+
+        if word == Opcode.CALL.value:
+            target = control_unit.program_counter
+            name = self.functions.get(target, f"func_{target}")
+            self.frames.append([name, f"{frame[1]};{name}", control_unit._tick])
+            self.calls[name] += 1
+        elif word == Opcode.RET.value and len(self.frames) > 1:
+            self._leave(control_unit._tick)
+
+    def _leave(self, tick: int):
+        name, _, entry = self.frames.pop()
+        # при рекурсии такты считаются один раз - во внешнем вызове
+        if all(frame[0] != name for frame in self.frames):
+            self.inclusive[name] += tick - entry
+
+    # закрыть незавершённые вызовы (остановка внутри функции)
+    def finish(self, tick: int):
+        while len(self.frames) > 1:
+            self._leave(tick)
+        self.inclusive[ROOT] = tick
+
+    # исполнения инструкций по строкам исходника
+    def line_hits(self) -> dict:
+        hits = defaultdict(int)
+        for pc, count in self.pc_hits.items():
+            line = source_line(self.symbols, pc)
+            if line is not None:
+                hits[line] += count
+        return {str(line): count for line, count in sorted(hits.items())}
+
+    def report(self) -> dict:
+        def opcode_name(word):
+            try:
+                return Opcode(word).name
+            except ValueError:
+                return str(word)
+
+        return {
+            "opcodes": {
+                opcode_name(word): {
+                    "count": count,
+                    "ticks": self.opcode_ticks[word],
+                }
+                for word, count in sorted(
+                    self.opcode_counts.items(),
+                    key=lambda item: -self.opcode_ticks[item[0]],
+                )
+            },
+            "pc_hits": {str(pc): hits for pc, hits in sorted(self.pc_hits.items())},
+            "lines": self.line_hits(),
+            "functions": {
+                name: {
+                    "calls": self.calls[name],
+                    "inclusive": self.inclusive[name],
+                    "exclusive": self.exclusive[name],
+                }
+                for name in sorted(
+                    self.exclusive, key=lambda name: -self.inclusive[name]
+                )
+            },
+        }
+
+    def write_json(self, target: str):
+        with open(target, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    # формат collapsed stacks для flamegraph: "main;f;g тактов"
+    def folded(self) -> list:
+        return [f"{path} {ticks}" for path, ticks in sorted(self.stacks.items())]
+
+    def write_folded(self, target: str):
+        with open(target, "w") as f:
+            f.writelines(line + "\n" for line in self.folded())
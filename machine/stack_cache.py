@@ -0,0 +1,125 @@
+from machine.isa import RETURN_STACK_EFFECTS, STACK_EFFECTS, Opcode
+
+# слово инструкции -> (снимает, кладёт)
+DATA_EFFECTS = {opcode.value: effect for opcode, effect in STACK_EFFECTS.items()}
+RETURN_EFFECTS = {
+    opcode.value: effect for opcode, effect in RETURN_STACK_EFFECTS.items()
+}
+# снимают слово, не читая его: подкачка из памяти не нужна
+DISCARDS = {Opcode.DROP.value, Opcode.DROPR.value}
+
+
+# Регистровое окно одного стека: верхние depth слов в регистрах, остальные -
+# в зарезервированной области памяти. При переполнении окна нижние слова
+# выталкиваются в память (spill), при чтении слова не из окна - подкачиваются
+# обратно (fill). Значения остаются в массиве стека модели, окно считает только
+# перемещения между регистрами и памятью.
+class StackWindow:
+    depth: int = None
+    # слов стека в регистрах
+    resident: int = None
+
+    spills: int = None
+    fills: int = None
+    # чтения PEEK из памяти, минуя окно
+    deep_reads: int = None
+    max_depth: int = None
+
+    def __init__(self, depth: int):
+        assert depth > 0, "Stack cache depth must be positive"
+        self.depth = depth
+        self.resident = 0
+        self.spills = 0
+        self.fills = 0
+        self.deep_reads = 0
+        self.max_depth = 0
+
+    # слов перемещено между регистрами и памятью; size - глубина до инструкции
+    def access(self, size: int, pops: int, pushes: int, read: bool = True) -> int:
+        moved = 0
+        if pops > 0:
+            if read and self.resident < pops:
+                fill = min(pops, size) - self.resident
+                self.fills += fill
+                moved += fill
+                self.resident += fill
+            self.resident = max(self.resident - pops, 0)
+        if pushes > 0:
+            self.resident += pushes
+            self.max_depth = max(self.max_depth, size - pops + pushes)
+            if self.resident > self.depth:
+                spill = self.resident - self.depth
+                self.spills += spill
+                moved += spill
+                self.resident = self.depth
+        return moved
+
+    # чтение слова на глубине n (0 - вершина)
+    def read(self, n: int) -> int:
+        if n < self.resident:
+            return 0
+        self.deep_reads += 1
+        return 1
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "spills": self.spills,
+            "fills": self.fills,
+            "deep_reads": self.deep_reads,
+            "max_depth": self.max_depth,
+        }
+
+
+# Кеши вершин стека данных и стека возврата. Стек модели (stack_size слов)
+# - это окно в регистрах и область памяти под вытесненные слова; каждое
+# перемещённое слово стоит latency тактов.
+class StackCache:
+    data: StackWindow = None
+    ret: StackWindow = None
+    latency: int = None
+    stall_ticks: int = None
+
+    def __init__(self, depth: int = 8, return_depth: int = 8, latency: int = 2):
+        assert latency >= 0, "Stack cache latency must not be negative"
+        self.data = StackWindow(depth)
+        self.ret = StackWindow(return_depth)
+        self.latency = latency
+        self.stall_ticks = 0
+
+    # такты перемещений для инструкции word при указателях стеков до неё
+    def step(self, word: int, sp: int, rsp: int, operand: int = 0) -> int:
+        read = word not in DISCARDS
+        moved = 0
+        effect = DATA_EFFECTS.get(word)
+        if effect is not None:
+            moved += self.data.access(sp + 1, *effect, read)
+        effect = RETURN_EFFECTS.get(word)
+        if effect is not None:
+            moved += self.ret.access(rsp + 1, *effect, read)
+        if word == Opcode.PEEK.value:
+            moved += self.ret.read(operand)
+        ticks = moved * self.latency
+        self.stall_ticks += ticks
+        return ticks
+
+    def stats(self) -> dict:
+        return {
+            "data": self.data.stats(),
+            "return": self.ret.stats(),
+            "stall_ticks": self.stall_ticks,
+        }
+
+    def __repr__(self):
+        return " ".join(
+            [
+                f"stack cache {self.data.depth}/{self.ret.depth}"
+                f" latency {self.latency}:",
+                *(
+                    f"{name} spills: {window.spills} fills: {window.fills}"
+                    f" max depth: {window.max_depth}"
+                    for name, window in (("data", self.data), ("return", self.ret))
+                ),
+                f"peek reads: {self.ret.deep_reads} stall ticks: {self.stall_ticks}",
+            ]
+        )
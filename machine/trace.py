@@ -0,0 +1,92 @@
+import struct
+
+from machine.image import source_line
+from machine.isa import Opcode
+
+# запись трассы: такт, PC, слово инструкции, TOS, SP, RSP, DA
+RECORD = struct.Struct("<qiiqiii")
+
+
+# Трасса исполнения в кольцевом буфере фиксированного размера. Хранит
+# последние capacity инструкций (при заданных окнах - только попавших в
+# окно по PC и тактам) в упакованном виде, текст строится по запросу.
+class Tracer:
+    capacity: int = None
+    buffer: bytearray = None
+    # сколько записей сделано всего, в буфере - последние capacity
+    count: int = None
+
+    pc_window: tuple = None
+    tick_window: tuple = None
+
+    def __init__(
+        self, capacity: int, pc_window: tuple = None, tick_window: tuple = None
+    ):
+        assert capacity > 0, "Trace capacity must be positive"
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0
+        self.pc_window = pc_window
+        self.tick_window = tick_window
+        if pc_window is not None or tick_window is not None:
+            self.record = self._record_window
+
+    # состояние перед исполнением инструкции по адресу PC
+    def record(self, control_unit):
+        dp = control_unit.datapath
+        pc = control_unit.program_counter
+        RECORD.pack_into(
+            self.buffer,
+            (self.count % self.capacity) * RECORD.size,
+            control_unit._tick,
+            pc,
+            control_unit.program[pc],
+            dp.stack[dp.stack_pointer],
+            dp.stack_pointer,
+            control_unit.return_stack_pointer,
+            dp.data_address,
+        )
+        self.count += 1
+
+    def _record_window(self, control_unit):
+        if self.pc_window is not None:
+            low, high = self.pc_window
+            if not low <= control_unit.program_counter <= high:
+                return
+        if self.tick_window is not None:
+            low, high = self.tick_window
+            if not low <= control_unit._tick <= high:
+                return
+        Tracer.record(self, control_unit)
+
+    # записи от старых к новым
+    def entries(self) -> list:
+        first = max(0, self.count - self.capacity)
+        return [
+            RECORD.unpack_from(self.buffer, (i % self.capacity) * RECORD.size)
+            for i in range(first, self.count)
+        ]
+
+    # с таблицей символов к записи добавляется строка исходника
+    def render(self, symbols: dict = None) -> list:
+        if not symbols or not symbols.get("lines"):
+            return [render_record(*entry) for entry in self.entries()]
+        return [
+            f"{render_record(*entry)}LINE: {source_line(symbols, entry[1])}"
+            for entry in self.entries()
+        ]
+
+
+def render_record(tick, pc, word, tos, sp, rsp, da) -> str:
+    try:
+        name = Opcode(word).name
+    except ValueError:
+        name = str(word)
+    return (
+        f"TICK: {tick:4} [{pc:2}: {name:10}] "
+        f"PC: {pc:3} "
+        f"RSP: {rsp:2} "
+        f"TOS: {tos: 3} "
+        f"DA: {da:3} "
+        f"SP: {sp:2} "
+    )
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import translator
+from lisp.inliner import INLINE_BUDGET
+from machine.analysis import Analysis
+from machine.control_unit import predecode
+from machine.devices import InputDevice, OutputDevice
+from machine.image import Image, pack_image, unpack_image
+from simulation import simulation
+
+STACK_SIZE = 10
+LIMIT = 100000
+HOST = "127.0.0.1"
+PORT = 8765
+
+# загруженных образов в памяти сервера
+IMAGES = 64
+# символов вывода в одном сообщении
+CHUNK_SIZE = 1024
+# длина строки запроса или ответа: образ и ввод передаются целиком
+MESSAGE_LIMIT = 64 * 2**20
+# порций вывода в очереди запуска: дальше исполнитель ждёт клиента
+QUEUE_CHUNKS = 16
+# период проверки очереди вывода и отмены, секунд
+POLL_SECONDS = 0.1
+
+
+# Загруженная программа: образ, мнемоники (для трансляции) и память с
+# предекодированием, копии которых получает каждый запуск
+class Program:
+    image: Image = None
+    mnemonics: list = None
+    memory = None
+    decoded: list = None
+    # нижняя оценка тактов, считается при первой проверке лимита
+    min_ticks: int = None
+
+    def __init__(self, image: Image, mnemonics: list = None):
+        self.image = image
+        self.mnemonics = mnemonics
+        self.memory = image.memory()
+        self.decoded = predecode(self.memory)
+
+    def lower_bound(self):
+        if self.min_ticks is None:
+            self.min_ticks = Analysis(self.image).bounds()[0]
+        return self.min_ticks
+
+
+# Программы по ключу (ключ трансляции исходника или хеш образа), давно не
+# использованные вытесняются. Своя в каждом процессе-исполнителе
+class Programs:
+    capacity: int = None
+    entries: OrderedDict = None
+
+    hits: int = None
+    misses: int = None
+
+    def __init__(self, capacity: int = IMAGES):
+        assert capacity > 0, "Image cache capacity must be positive"
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, load) -> Program:
+        program = self.entries.get(key)
+        if program is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return program
+        self.misses += 1
+        program = load()
+        self.entries[key] = program
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return program
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Вывод запуска из процесса-исполнителя в цикл событий: символы копятся и
+# передаются в очередь менеджера порциями по CHUNK_SIZE, None - конец вывода.
+# Очередь ограничена: медленный клиент приостанавливает запуск; после
+# отмены (клиент отключился) запись порции прерывает его
+class StreamSink:
+    queue = None
+    cancel = None
+    buffer: list = None
+
+    def __init__(self, chunks, cancel):
+        self.queue = chunks
+        self.cancel = cancel
+        self.buffer = []
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put("".join(self.buffer))
+            self.buffer = []
+
+    def put(self, item):
+        while True:
+            if self.cancel.is_set():
+                raise ConnectionAbortedError("Client disconnected")
+            try:
+                self.queue.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        self.flush()
+        self.put(None)
+
+
+# программы процесса-исполнителя
+_programs = None
+
+
+def init_worker(images: int):
+    global _programs
+    # журнал отдельных запусков не нужен, результат возвращается в ответе
+    logging.getLogger().setLevel(logging.ERROR)
+    _programs = Programs(images)
+
+
+# программа запроса: исходник ("source") или образ ("image", base64)
+def load(request: dict) -> Program:
+    if "source" in request:
+        options = (
+            request["optimize"],
+            request["inline"],
+            request["inline_budget"],
+        )
+        key = translator.translation_key(request["source"], *options)
+        return _programs.get(
+            key,
+            lambda: Program(*translator.translate(request["source"], *options)),
+        )
+    assert "image" in request, "Expected source or image"
+    blob = base64.b64decode(request["image"])
+    key = hashlib.sha256(blob).hexdigest()
+    return _programs.get(key, lambda: Program(unpack_image(blob)))
+
+
+# ответ исполнителя и счётчики его программ для stats
+def worker_response(response: dict) -> tuple:
+    return response, (os.getpid(), _programs.stats())
+
+
+def translate(request: dict) -> tuple:
+    program = load(request)
+    return worker_response(
+        {
+            "type": "image",
+            "image": base64.b64encode(pack_image(program.image)).decode("ascii"),
+            "mnemonics": program.mnemonics,
+        }
+    )
+
+
+# ввод - текст запроса ("input") с завершающим 0, как у файла ввода;
+# с "reject" заведомо не укладывающиеся в лимит запуски не исполняются;
+# отменённый запуск останавливается на очередной порции вывода
+def simulate(request: dict, sink: StreamSink) -> tuple:
+    try:
+        try:
+            program = load(request)
+            low = program.lower_bound() if request["reject"] else 0
+            if low > request["limit"]:
+                return worker_response(
+                    {
+                        "type": "result",
+                        "exit": "rejected",
+                        "min_ticks": None if math.isinf(low) else low,
+                    }
+                )
+            image = program.image
+            chars = []
+            if request.get("input") is not None:
+                chars = [ord(char) for char in request["input"]] + [0]
+            _, instructions, ticks, reason = simulation(
+                program.memory[:],
+                image.start,
+                request["stack_size"],
+                InputDevice(chars),
+                0,
+                request["limit"],
+                request["blocks"],
+                output_device=OutputDevice(sink, keep=False),
+                decoded=list(program.decoded),
+                bss_size=image.bss_size,
+            )
+        finally:
+            sink.close()
+    except ConnectionAbortedError:
+        return worker_response({"type": "result", "exit": "cancelled"})
+    return worker_response(
+        {
+            "type": "result",
+            "instructions": instructions,
+            "ticks": ticks,
+            "exit": reason,
+        }
+    )
+
+
+# Сервер заданий: строки JSON в обе стороны. Запросы соединения выполняются
+# по очереди, соединения - одновременно, трансляция и запуски - в пуле
+# процессов, в цикле событий - только обмен с клиентами
+class Server:
+    executor: ProcessPoolExecutor = None
+    # очереди вывода запусков между процессами
+    manager = None
+    # значения по умолчанию для полей запроса
+    defaults: dict = None
+    jobs: int = None
+    # запусков, прерванных отключением клиента
+    cancelled: int = None
+    # последние счётчики программ каждого исполнителя: pid -> stats
+    workers: dict = None
+
+    def __init__(
+        self, workers: int = None, images: int = IMAGES, defaults: dict = None
+    ):
+        # fork унаследовал бы сокеты открытых соединений: закрытое сервером
+        # соединение оставалось бы открытым в исполнителе
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            workers, context, initializer=init_worker, initargs=(images,)
+        )
+        self.manager = context.Manager()
+        self.defaults = {
+            "stack_size": STACK_SIZE,
+            "limit": LIMIT,
+            "blocks": False,
+            "reject": False,
+            "optimize": False,
+            "inline": 0,
+            "inline_budget": INLINE_BUDGET,
+            **(defaults or {}),
+        }
+        self.jobs = 0
+        self.cancelled = 0
+        self.workers = {}
+
+    # ответ исполнителя; его счётчики запоминаются для stats
+    async def run(self, func, *args) -> dict:
+        loop = asyncio.get_running_loop()
+        response, (pid, stats) = await loop.run_in_executor(self.executor, func, *args)
+        self.workers[pid] = stats
+        if response.get("exit") == "cancelled":
+            self.cancelled += 1
+        return response
+
+    def stats(self) -> dict:
+        stats = {
+            "type": "stats",
+            "jobs": self.jobs,
+            "cancelled": self.cancelled,
+            "images": 0,
+            "hits": 0,
+            "misses": 0,
+        }
+        for worker in self.workers.values():
+            for key, value in worker.items():
+                stats[key] += value
+        return stats
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    await self.serve(json.loads(line), writer)
+                except Exception as e:
+                    await send(
+                        writer, {"type": "error", "error": f"{type(e).__name__}: {e}"}
+                    )
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, message: dict, writer: asyncio.StreamWriter):
+        request = dict(self.defaults, **message)
+        op = request.get("op")
+        if op == "stats":
+            await send(writer, self.stats())
+            return
+        self.jobs += 1
+        if op == "translate":
+            await send(writer, await self.run(translate, request))
+            return
+        assert op == "simulate", f"Unknown op: {op}"
+        loop = asyncio.get_running_loop()
+        chunks = self.manager.Queue(QUEUE_CHUNKS)
+        cancel = self.manager.Event()
+        sink = StreamSink(chunks, cancel)
+        result = asyncio.ensure_future(self.run(simulate, request, sink))
+        # вывод пересылается по мере готовности, результат - после него;
+        # очередь читается в потоке, чтобы не останавливать цикл событий.
+        # Отключение клиента (ConnectionError при отправке) или остановка
+        # сервера отменяют запуск
+        try:
+            while True:
+                try:
+                    text = await loop.run_in_executor(
+                        None, chunks.get, True, POLL_SECONDS
+                    )
+                except queue.Empty:
+                    # исполнитель завершился, не закрыв вывод
+                    if result.done():
+                        break
+                    continue
+                if text is None:
+                    break
+                await send(writer, {"type": "output", "text": text})
+            await send(writer, await result)
+        finally:
+            cancel.set()
+
+    async def start(self, socket_path: str = None, host: str = HOST, port: int = PORT):
+        if socket_path is not None:
+            return await asyncio.start_unix_server(
+                self.handle, socket_path, limit=MESSAGE_LIMIT
+            )
+        return await asyncio.start_server(self.handle, host, port, limit=MESSAGE_LIMIT)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.manager.shutdown()
+
+
+async def send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def serve_forever(server: Server, socket_path: str, host: str, port: int):
+    listener = await server.start(socket_path, host, port)
+    where = socket_path or f"{host}:{port}"
+    logging.info(f"listening on {where}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Сервер трансляции и симуляции")
+    parser.add_argument("--socket", help="Unix-сокет (по умолчанию TCP)")
+    parser.add_argument("--host", default=HOST, help=f"Адрес TCP (по умолчанию {HOST})")
+    parser.add_argument(
+        "--port", type=int, default=PORT, help=f"Порт TCP (по умолчанию {PORT})"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Процессов-исполнителей (по умолчанию число ядер)",
+    )
+    parser.add_argument(
+        "--images",
+        type=int,
+        default=IMAGES,
+        help=f"Загруженных образов в памяти (по умолчанию {IMAGES})",
+    )
+    parser.add_argument(
+        "--stack_size", type=int, default=STACK_SIZE, help="Размер стека по умолчанию"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=LIMIT, help="Лимит тиков по умолчанию"
+    )
+    parser.add_argument(
+        "--reject",
+        action="store_true",
+        help="Не запускать программы, по статической оценке не укладывающиеся в лимит",
+    )
+    args = parser.parse_args()
+
+    defaults = {
+        "stack_size": args.stack_size,
+        "limit": args.limit,
+        "reject": args.reject,
+    }
+    try:
+        asyncio.run(
+            serve_forever(
+                Server(args.jobs, args.images, defaults),
+                args.socket,
+                args.host,
+                args.port,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
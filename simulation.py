@@ -1,49 +1,272 @@
 import argparse
+import functools
+import json
 import logging
+import os
+import sys
 
+from machine.block_compiler import BlockControlUnit
+from machine.cache import REPLACEMENT_POLICIES, WRITE_POLICIES, Cache
+from machine.checkpoint import Checkpointer, load_checkpoint
 from machine.control_unit import ControlUnit
-from machine.datapath import Datapath
-from machine.isa import read_code
+from machine.datapath import Datapath, words
+from machine.devices import InputDevice, OutputDevice
+from machine.fetch import FetchUnit, instruction_cache
+from machine.harts import SCHEDULERS, MultiHart
+from machine.image import read_image
+from machine.interrupts import InterruptController, ScheduledInput
+from machine.memory import PagedMemory
+from machine.pipeline import PREDICTORS, Pipeline, PipelineControlUnit
+from machine.profiler import Profiler
+from machine.stack_cache import StackCache
+from machine.trace import Tracer
 
 
 def simulation(
     code: list[int],
     start: int,
     stack_size: int,
-    input_buffer: list[str],
+    input_buffer,  # список кодов символов или InputDevice
     debug_limit: int,
     limit: int,
+    block_engine: bool = False,
+    cache: Cache = None,
+    output_device: OutputDevice = None,
+    tracer: Tracer = None,
+    profiler: Profiler = None,
+    decoded: list = None,  # готовое предекодирование code (см. predecode)
+    resume: dict = None,  # контрольная точка, code - её память
+    checkpointer: Checkpointer = None,
+    bss_size: int = 0,  # обнулённая память после code
+    pipeline: Pipeline = None,  # такты по модели конвейера
+    fetch_unit: FetchUnit = None,  # кеш инструкций и предвыборка
+    stack_cache: StackCache = None,  # регистровые окна стеков
+    interrupts: InterruptController = None,  # input_buffer - его порт
 ):
-    datapath = Datapath(code, stack_size, input_buffer)
-    control_unit = ControlUnit(code, start, stack_size, datapath)
+    # память - массив 32-битных слов, общий для Datapath и ControlUnit
+    code = words(code)
+    bss = PagedMemory(len(code), bss_size)
+    datapath = Datapath(code, stack_size, input_buffer, cache, output_device, bss)
+    if interrupts is not None:
+        assert input_buffer is interrupts.device, "Input must be the scheduled port"
+        assert resume is None and checkpointer is None, (
+            "Checkpoints do not support interrupts"
+        )
+    if resume is not None or checkpointer is not None:
+        # состояние кешей, окон стеков и конвейера в точку не сохраняется
+        models = (cache, fetch_unit, stack_cache, pipeline)
+        assert all(model is None for model in models), (
+            "Checkpoints do not support cache, fetch unit, stack cache or pipeline"
+        )
+    if pipeline is not None:
+        assert not block_engine, "Pipeline model runs instructions one by one"
+        assert interrupts is None, "Pipeline model does not support interrupts"
+        control_unit = PipelineControlUnit(
+            code,
+            start,
+            stack_size,
+            datapath,
+            pipeline,
+            decoded,
+            fetch_unit,
+            stack_cache,
+        )
+    elif block_engine:
+        control_unit = BlockControlUnit(
+            code,
+            start,
+            stack_size,
+            datapath,
+            decoded,
+            fetch_unit,
+            stack_cache,
+            interrupts,
+        )
+    else:
+        control_unit = ControlUnit(
+            code,
+            start,
+            stack_size,
+            datapath,
+            decoded,
+            fetch_unit,
+            stack_cache,
+            interrupts,
+        )
 
-    logging.debug(repr(control_unit))
     instructions = 0
+    if resume is not None:
+        control_unit.restore(resume["control_unit"])
+        datapath.restore(resume["datapath"])
+        instructions = resume["instructions"]
+
+    if profiler is None:
+        step = control_unit.decode_and_execute_instruction
+    else:
+        step = functools.partial(profiler.execute, control_unit)
+
+    logging.debug(control_unit)
+    # причина остановки: halt, eof или limit
+    reason = "limit"
     try:
-        while control_unit.current_tick() < limit:
+        # журнал состояний только до debug_limit
+        while control_unit.current_tick() < min(limit, debug_limit + 1):
             instructions += 1
+            if tracer is not None:
+                tracer.record(control_unit)
 
-            control_unit.decode_and_execute_instruction()
+            step()
             if control_unit.current_tick() < debug_limit:
                 logging.debug(control_unit)
             elif control_unit.current_tick() == debug_limit:
                 logging.warning("Debug limit exceeded!")
 
+        # дальше без журнала: блоками или по инструкциям,
+        # с остановками для контрольных точек
+        blocks = block_engine and tracer is None and profiler is None
+        record = None if tracer is None else tracer.record
+        while control_unit.current_tick() < limit:
+            stop = limit
+            if checkpointer is not None:
+                stop = checkpointer.next_stop(control_unit.current_tick(), limit)
+
+            if blocks:
+                try:
+                    control_unit.run(stop)
+                finally:
+                    instructions += control_unit.instructions
+                    control_unit.instructions = 0
+            else:
+                while control_unit.current_tick() < stop:
+                    instructions += 1
+                    if record is not None:
+                        record(control_unit)
+                    step()
+
+            if control_unit.current_tick() < limit:
+                checkpointer.save(control_unit, instructions)
+
     except EOFError:
         logging.warning("Input buffer is empty!")
+        reason = "eof"
     except StopIteration:
-        pass
+        reason = "halt"
 
     if control_unit.current_tick() >= limit:
         logging.warning("Limit exceeded!")
-        pass
+        if checkpointer is not None:
+            checkpointer.save(control_unit, instructions)
+
+    if profiler is not None:
+        profiler.finish(control_unit.current_tick())
+
+    output_device = datapath.output_device
+    output = output_device.text()
+    if output_device.buffer is not None:
+        logging.info(f"output_buffer: {output}")
+    else:
+        logging.info(f"output: {output_device.count} symbols")
+    if cache is not None:
+        logging.info(cache)
+    if fetch_unit is not None:
+        logging.info(fetch_unit)
+    if stack_cache is not None:
+        logging.info(stack_cache)
+    if pipeline is not None:
+        logging.info(pipeline)
+    if interrupts is not None:
+        logging.info(interrupts)
 
-    output = "".join(
-        map(lambda x: chr(x) if 0 < x < 256 else str(x), datapath.output_buffer)
+    return output, instructions, control_unit.current_tick(), reason
+
+
+# несколько ядер над общей памятью, starts - адреса начала ядер
+def multi_simulation(
+    code: list[int],
+    starts: list,
+    stack_size: int,
+    input_buffer,
+    limit: int,
+    scheduler: str = "tick",
+    quantum: int = 1,
+    bss_size: int = 0,
+    output_device: OutputDevice = None,
+):
+    harts = MultiHart(
+        code,
+        starts,
+        stack_size,
+        input_buffer,
+        scheduler,
+        quantum,
+        bss_size,
+        output_device,
     )
-    logging.info(f"output_buffer: {output}")
+    harts.run(limit)
+    for hart in harts.harts:
+        if hart.reason == "eof":
+            logging.warning(f"hart {hart.index}: input buffer is empty!")
+        elif hart.reason == "limit":
+            logging.warning(f"hart {hart.index}: limit exceeded!")
+        logging.info(f"hart {hart.index}: {hart.stats()}")
+
+    output_device = harts.output_device()
+    output = output_device.text()
+    if output_device.buffer is not None:
+        logging.info(f"output_buffer: {output}")
+    else:
+        logging.info(f"output: {output_device.count} symbols")
+    logging.info(harts)
+    return output, harts.instructions(), harts.ticks(), harts
+
+
+# адреса ядер или обработчиков: числа, имена из таблицы символов или
+# start - начало программы
+def resolve_entries(entries: list, start: int, symbols: dict) -> list:
+    starts = []
+    for entry in entries:
+        if entry == "start":
+            starts.append(start)
+        elif entry.lstrip("-").isdigit():
+            starts.append(int(entry))
+        else:
+            for kind in ("harts", "handlers", "functions", "labels"):
+                if entry in symbols.get(kind, {}):
+                    starts.append(symbols[kind][entry])
+                    break
+            else:
+                raise KeyError(f"Unknown entry: {entry}")
+    return starts
+
+
+def dump_trace(tracer: Tracer, trace_file: str = None, symbols: dict = None):
+    lines = tracer.render(symbols)
+    if trace_file is None:
+        for line in lines:
+            logging.info(f"trace: {line}")
+    else:
+        with open(trace_file, "w") as f:
+            f.writelines(line + "\n" for line in lines)
+
+
+# таблица символов транслятора: заданный файл, встроенная в образ или
+# <образ>.sym рядом с образом (для образов, собранных с --strip)
+def load_symbols(code_file: str, symbols_file: str = None) -> dict:
+    if symbols_file is None:
+        symbols = read_image(code_file).symbols
+        if symbols is not None:
+            return symbols
+        symbols_file = code_file + ".sym"
+        if not os.path.exists(symbols_file):
+            return {}
+    with open(symbols_file, "r") as f:
+        return json.load(f)
+
 
-    return output, instructions, control_unit.current_tick()
+# окно "начало:конец" включительно
+def parse_window(text: str) -> tuple:
+    low, high = text.split(":")
+    return int(low), int(high)
 
 
 def main(
@@ -52,22 +275,142 @@ def main(
     stack_size: int,
     debug_limit: int,
     limit: int,
+    block_engine: bool = False,
+    cache: Cache = None,
+    stream: bool = False,
+    tracer: Tracer = None,
+    trace_file: str = None,
+    profile_file: str = None,
+    folded_file: str = None,
+    symbols_file: str = None,
+    resume_file: str = None,
+    checkpointer: Checkpointer = None,
+    pipeline: Pipeline = None,
+    fetch_unit: FetchUnit = None,
+    stack_cache: StackCache = None,
+    harts: list = None,
+    scheduler: str = "tick",
+    quantum: int = 1,
+    input_interval: int = None,
+    schedule_file: str = None,
+    interrupt_vector: str = None,
 ):
-    machine_code = read_code(code_file)
+    # при продолжении память, PC и размер стеков берутся из контрольной точки
+    resume = None
+    if resume_file is None:
+        image = read_image(code_file)
+        start, machine_code, bss_size = image.start, image.memory(), image.bss_size
+    else:
+        resume = load_checkpoint(resume_file)
+        machine_code = resume["data"]
+        bss_size = resume["bss_size"]
+        start = resume["control_unit"]["program_counter"]
+        stack_size = len(resume["datapath"]["stack"])
+
     if input_file is None:
-        input_buffer = []
+        input_device = InputDevice([])
+    elif input_file == "-":
+        input_device = InputDevice.from_stream(sys.stdin)
     else:
-        with open(input_file, "r") as f:
-            input_buffer = list(map(ord, f.read())) + [0]
+        input_device = InputDevice.from_file(input_file)
+
+    # ввод по расписанию: символы входного файла через input_interval тактов
+    # или пары [такт, код] из schedule_file; прерывания - по вектору или по
+    # единственному обработчику из таблицы символов
+    interrupts = None
+    if input_interval is not None or schedule_file is not None:
+        if schedule_file is not None:
+            with open(schedule_file, "r") as f:
+                input_device = ScheduledInput(json.load(f))
+        else:
+            input_device = ScheduledInput.uniform(
+                input_device.source, input_interval, input_interval
+            )
+        symbols = load_symbols(code_file, symbols_file)
+        vector = None
+        if interrupt_vector is not None:
+            (vector,) = resolve_entries([interrupt_vector], start, symbols)
+        elif len(symbols.get("handlers", {})) == 1:
+            (vector,) = symbols["handlers"].values()
+        interrupts = InterruptController(input_device, vector)
+
+    # при потоковом выводе символы сразу пишутся в stdout и не накапливаются
+    output_device = OutputDevice(sys.stdout, keep=False) if stream else None
 
-    start = machine_code.pop(0)
+    symbols = None
+    if tracer is not None or profile_file is not None or folded_file is not None:
+        symbols = load_symbols(code_file, symbols_file)
+
+    profiler = None
+    if profile_file is not None or folded_file is not None:
+        profiler = Profiler.from_symbols(symbols)
+
+    if harts is not None:
+        assert resume is None, "Harts can not resume from a checkpoint"
+        assert interrupts is None, "Harts do not support interrupts"
+        # ядра исполняются без моделей таймингов, блоков, трассы и профиля
+        models = (cache, pipeline, fetch_unit, stack_cache)
+        assert all(model is None for model in models), (
+            "Harts do not support cache, pipeline, fetch unit or stack cache"
+        )
+        assert not block_engine, "Harts do not support the block engine"
+        assert tracer is None and profiler is None, "Harts can not be traced"
+        assert checkpointer is None, "Harts do not support checkpoints"
+        starts = resolve_entries(harts, start, load_symbols(code_file, symbols_file))
+        logging.info("Start simulation")
+        output, instructions, ticks, _ = multi_simulation(
+            machine_code,
+            starts,
+            stack_size,
+            input_device,
+            limit,
+            scheduler,
+            quantum,
+            bss_size,
+            output_device,
+        )
+        logging.info("End simulation")
+        print(output)
+        print(f"Instructions: {instructions} Ticks: {ticks}")
+        return
 
     logging.info("Start simulation")
-    output, instructions, ticks = simulation(
-        machine_code, start, stack_size, input_buffer, debug_limit, limit
-    )
+    try:
+        output, instructions, ticks, _ = simulation(
+            machine_code,
+            start,
+            stack_size,
+            input_device,
+            debug_limit,
+            limit,
+            block_engine,
+            cache,
+            output_device,
+            tracer,
+            profiler,
+            resume=resume,
+            checkpointer=checkpointer,
+            bss_size=bss_size,
+            pipeline=pipeline,
+            fetch_unit=fetch_unit,
+            stack_cache=stack_cache,
+            interrupts=interrupts,
+        )
+    finally:
+        # трасса нужна и при аварийной остановке
+        if tracer is not None:
+            dump_trace(tracer, trace_file, symbols)
     logging.info("End simulation")
 
+    if checkpointer is not None:
+        for target in checkpointer.saved:
+            logging.info(f"checkpoint: {target}")
+
+    if profile_file is not None:
+        profiler.write_json(profile_file)
+    if folded_file is not None:
+        profiler.write_folded(folded_file)
+
     print(output)
     print(f"Instructions: {instructions} Ticks: {ticks}")
 
@@ -78,7 +421,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Симуляция процессора")
     parser.add_argument("code_file", help="Имя файла бинарным с кодом")
     parser.add_argument(
-        "input_file", nargs="?", help="Имя входного файла (опционально)"
+        "input_file",
+        nargs="?",
+        help="Имя входного файла (опционально, '-' - стандартный ввод)",
     )
     parser.add_argument(
         "--stack_size", type=int, default=10, help="Размер стека (по умолчанию 10)"
@@ -89,13 +434,262 @@ if __name__ == "__main__":
     parser.add_argument(
         "--limit", type=int, default=100000, help="Лимит тиков (по умолчанию 100000)"
     )
+    parser.add_argument(
+        "--blocks",
+        action="store_true",
+        help="Исполнять скомпилированными базовыми блоками",
+    )
+
+    parser.add_argument(
+        "--cache", action="store_true", help="Включить модель кеша данных"
+    )
+    parser.add_argument(
+        "--cache_line", type=int, default=4, help="Размер строки кеша в словах"
+    )
+    parser.add_argument(
+        "--cache_sets", type=int, default=16, help="Количество множеств кеша"
+    )
+    parser.add_argument(
+        "--cache_ways", type=int, default=2, help="Ассоциативность кеша"
+    )
+    parser.add_argument(
+        "--cache_replacement",
+        choices=REPLACEMENT_POLICIES,
+        default="lru",
+        help="Политика вытеснения",
+    )
+    parser.add_argument(
+        "--cache_write",
+        choices=WRITE_POLICIES,
+        default="back",
+        help="Политика записи: обратная или сквозная",
+    )
+    parser.add_argument(
+        "--cache_hit", type=int, default=1, help="Задержка попадания в тактах"
+    )
+    parser.add_argument(
+        "--cache_miss", type=int, default=10, help="Задержка промаха в тактах"
+    )
+
+    parser.add_argument("--icache", action="store_true", help="Включить кеш инструкций")
+    parser.add_argument(
+        "--icache_size", type=int, default=64, help="Размер кеша инструкций в словах"
+    )
+    parser.add_argument(
+        "--icache_line",
+        type=int,
+        default=4,
+        help="Размер строки кеша инструкций в словах",
+    )
+    parser.add_argument(
+        "--icache_ways", type=int, default=2, help="Ассоциативность кеша инструкций"
+    )
+    parser.add_argument(
+        "--icache_hit",
+        type=int,
+        default=1,
+        help="Задержка выборки слова при попадании в тактах",
+    )
+    parser.add_argument(
+        "--icache_miss",
+        type=int,
+        default=10,
+        help="Задержка выборки слова при промахе в тактах",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Строк в буфере последовательной предвыборки (0 - без предвыборки)",
+    )
+
+    parser.add_argument(
+        "--stack_cache",
+        action="store_true",
+        help="Вершины стеков в регистрах, остальное - в памяти (размер - --stack_size)",
+    )
+    parser.add_argument(
+        "--stack_depth",
+        type=int,
+        default=8,
+        help="Слов стека данных в регистрах",
+    )
+    parser.add_argument(
+        "--return_depth",
+        type=int,
+        default=8,
+        help="Слов стека возврата в регистрах",
+    )
+    parser.add_argument(
+        "--spill_latency",
+        type=int,
+        default=2,
+        help="Тактов на перемещение слова стека между регистрами и памятью",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Считать такты по модели конвейера (выборка, декодирование, исполнение, запись)",
+    )
+    parser.add_argument(
+        "--fetch_width",
+        type=int,
+        default=1,
+        help="Слов, выбираемых конвейером за такт",
+    )
+    parser.add_argument(
+        "--no_forwarding",
+        action="store_true",
+        help="Без обходных путей: результат доступен после записи",
+    )
+    parser.add_argument(
+        "--predictor",
+        choices=PREDICTORS,
+        default="none",
+        help="Предсказание JZ/JNE (none - ждать вычисления условия)",
+    )
+    parser.add_argument(
+        "--predictor_size",
+        type=int,
+        default=256,
+        help="Количество 2-битных счётчиков предсказателя bimodal",
+    )
+
+    parser.add_argument(
+        "--harts",
+        help="Ядра над общей памятью через запятую: адреса, имена или start",
+    )
+    parser.add_argument(
+        "--scheduler",
+        choices=SCHEDULERS,
+        default="tick",
+        help="Порядок исполнения ядер: по тактам с шиной памяти или по очереди",
+    )
+    parser.add_argument(
+        "--quantum",
+        type=int,
+        default=1,
+        help="Инструкций ядра подряд для round_robin",
+    )
+
+    parser.add_argument(
+        "--input_interval",
+        type=int,
+        help="Символы ввода приходят через N тактов, с прерываниями",
+    )
+    parser.add_argument(
+        "--input_schedule",
+        help="Файл JSON с расписанием ввода: [[такт, код символа], ...]",
+    )
+    parser.add_argument(
+        "--interrupt_vector",
+        help="Обработчик прерывания ввода: адрес или имя (по умолчанию единственный def_isr)",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Выводить символы сразу, не накапливая вывод в памяти",
+    )
+
+    parser.add_argument(
+        "--trace",
+        type=int,
+        default=0,
+        help="Размер кольцевого буфера трассы (0 - без трассы)",
+    )
+    parser.add_argument(
+        "--trace_pc", type=parse_window, help="Окно трассы по адресам PC: начало:конец"
+    )
+    parser.add_argument(
+        "--trace_tick", type=parse_window, help="Окно трассы по тактам: начало:конец"
+    )
+    parser.add_argument("--trace_file", help="Файл для трассы (по умолчанию журнал)")
+
+    parser.add_argument(
+        "--profile",
+        help="Файл JSON с профилем по опкодам, адресам, строкам и функциям",
+    )
+    parser.add_argument(
+        "--profile_folded", help="Файл профиля в формате collapsed stacks (flamegraph)"
+    )
+    parser.add_argument(
+        "--symbols",
+        help="Таблица символов транслятора (по умолчанию из образа или <code_file>.sym)",
+    )
+
+    parser.add_argument("--resume", help="Продолжить моделирование с контрольной точки")
+    parser.add_argument(
+        "--checkpoint",
+        help="Файл контрольной точки при остановке по лимиту ({tick} - номер такта)",
+    )
+    parser.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=0,
+        help="Сохранять контрольную точку каждые N тактов (0 - только по лимиту)",
+    )
 
     args = parser.parse_args()
 
+    data_cache = None
+    if args.cache:
+        data_cache = Cache(
+            args.cache_line,
+            args.cache_sets,
+            args.cache_ways,
+            args.cache_replacement,
+            args.cache_write,
+            args.cache_hit,
+            args.cache_miss,
+        )
+
     main(
         args.code_file,
         args.input_file,
         args.stack_size,
         args.debug_limit,
         args.limit,
+        args.blocks,
+        data_cache,
+        args.stream,
+        Tracer(args.trace, args.trace_pc, args.trace_tick) if args.trace else None,
+        args.trace_file,
+        args.profile,
+        args.profile_folded,
+        args.symbols,
+        args.resume,
+        Checkpointer(args.checkpoint, args.checkpoint_every)
+        if args.checkpoint
+        else None,
+        Pipeline(
+            args.fetch_width,
+            not args.no_forwarding,
+            args.predictor,
+            args.predictor_size,
+        )
+        if args.pipeline
+        else None,
+        FetchUnit(
+            instruction_cache(
+                args.icache_size,
+                args.icache_line,
+                args.icache_ways,
+                args.icache_hit,
+                args.icache_miss,
+            ),
+            args.prefetch,
+        )
+        if args.icache
+        else None,
+        StackCache(args.stack_depth, args.return_depth, args.spill_latency)
+        if args.stack_cache
+        else None,
+        args.harts.split(",") if args.harts else None,
+        args.scheduler,
+        args.quantum,
+        args.input_interval,
+        args.input_schedule,
+        args.interrupt_vector,
     )
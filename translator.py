@@ -1,194 +1,364 @@
 import argparse
+import functools
+import hashlib
+import importlib
+import json
 
+from machine.image import Image, write_image
 from machine.isa import (
     BITS,
-    write_code,
     Opcode,
     MAP_INPUT_ADDRESS,
     MAP_OUTPUT_ADDRESS,
     MIN_SIGN,
     MAX_SIGN,
 )
-
-
-def get_meaningful_token(line: str) -> str:
-    return line.split(";", 1)[0].strip()
-
-
-# превратить текст в последовательность токенов
-def translate_stage_1(text: str):
-    _vars = []
-    variables = {}  # адреса на которые можно ссылаться
-
-    start = 0  # адрес начала программы
-
-    code = []  # токены кода
-    data = [0, 0]  # токены данных + для input/output
-
-    # для работы if
-    if_counter = 0
-    if_from_then = []
-    if_to_else = []
-
-    # для работы while
-    while_counter = 0
-    while_jump = []
-    while_jz = []
-
-    # для вызова функций
-    stack = []
-    to_unstack = 0
-
-    for line in text.splitlines():
-        # обрезать комментарии и пробелы
-        token = get_meaningful_token(line)
-        if token == "":
-            continue
-
-        # разделить по пробелам
-        parts = token.split(" ")
-
-        for part in parts:
-            # начинается со скобки - функция
-            if part.startswith("("):
-                part = part.strip("(")
-                # выделение памяти под число
-                if part == "alloc_num":
-                    name = parts[1]
-                    value = parts[2].strip(")")
-                    variables[name] = len(data)
-                    data.append(int(value))
-                    _vars.append(name)
-                    break
-                # выделение памяти под строку
-                elif part == "alloc_str":
-                    name = parts[1]
-                    value = " ".join(parts[2:]).strip(")").strip('"')
-                    variables[name] = len(data)
-                    data.append(len(value))
-                    for c in value:
-                        data.append(ord(c))
-                    _vars.append(name)
-                    break
-                # выделение памяти под буфер
-                elif part == "alloc_buf":
-                    name = parts[1]
-                    value = parts[2].strip(")")
-                    variables[name] = len(data)
-                    for i in range(int(value)):
-                        data.append(0)
-                    _vars.append(name)
-                    break
-                # объявление функции
-                elif part == "def_func":
-                    stack.append(part)
-                    variables[parts[1]] = len(code)
-                    break
-                # memory-mapped output заменяется обращением к памяти
-                elif part == "output":
-                    code.append(Opcode.PUSH)
-                    code.append(MAP_OUTPUT_ADDRESS)
-                # сохраняем адрес для возврата к началу цикла
-                elif part == "while":
-                    while_jump.append(len(code))
-                elif part == "if":
-                    if_from_then.append(f"if_from_then{if_counter}")
-                    if_to_else.append(f"if_to_else{if_counter}")
-                    if_counter += 1
-                stack.append(part)
-                continue
-
-            while part.endswith(")"):
-                to_unstack += 1
-                part = part[:-1]
-
-            # прыжок за цикл
-            if part == "do":
-                while_jz.append(f"while_after{while_counter}")
-                while_counter += 1
-                code.append(Opcode.JZ)
-                code.append(while_jz[-1])
-                continue
-            elif part == "then":
-                code.append(Opcode.JZ)
-                code.append(if_to_else[-1])
-                continue
-            elif part == "else":
-                code.append(Opcode.JMP)
-                code.append(if_from_then[-1])
-                variables[if_to_else.pop()] = len(code)
-                continue
-            # обращение к параметру функции
-            elif part.startswith("$"):
-                part = part.strip("$")
-                assert part == "1", f"Sorry, only one argument: {part}"
-                code.append(Opcode.PEEK)
-                code.append(part)
-                part = ""
-
-            if part:
-                if part.startswith("@"):
-                    code.append(Opcode.PUSHR)
-                    code.append(part[1:])
-                else:
-                    code.append(Opcode.PUSH)
-                    code.append(part)
-
-            # вызвать функцию - аргументы уже в стеке
-            while to_unstack > 0:
-                to_unstack -= 1
-                unstacked_token = stack.pop()
-                # memory-mapped input заменяется обращением к памяти
-                if unstacked_token == "input":
-                    code.append(Opcode.PUSH)
-                    code.append(MAP_INPUT_ADDRESS)
-                    code.append(Opcode.GET_VAL)
-                    code.append(Opcode.STORE_VAL)
-                # memory-mapped output заменяется обращением к памяти
-                elif unstacked_token == "output":
-                    code.append(Opcode.STORE_VAL)
-                # прыжок к началу цикла и определение адреса после цикла
-                elif unstacked_token == "while":
-                    code.append(Opcode.JMP)
-                    code.append(while_jump.pop())
-                    variables[while_jz.pop()] = len(code)
-                elif unstacked_token == "get_val":
-                    code.append(Opcode.GET_VAL)
-                elif unstacked_token == "get_by_addr":
-                    code.append(Opcode.GET_VAL)
-                    code.append(Opcode.GET_VAL)
-                elif unstacked_token == "set":
-                    code.append(Opcode.STORE_VAL)
-                # выйти из функции и дропнуть параметр
-                elif unstacked_token == "def_func":
-                    code.append(Opcode.RET)
-                    start = len(code)
-                elif unstacked_token == "+":
-                    code.append(Opcode.ADD)
-                elif unstacked_token == "-":
-                    code.append(Opcode.SUB)
-                elif unstacked_token == "%":
-                    code.append(Opcode.MOD)
-                elif unstacked_token == "=":
-                    code.append(Opcode.EQ)
-                elif unstacked_token == "if":
-                    variables[if_from_then.pop()] = len(code)
-                elif unstacked_token == "or":
-                    code.append(Opcode.OR)
-
-                # вызов пользовательской функции
-                else:
-                    code.append(Opcode.CALL)
-                    code.append(variables[unstacked_token])
-                    code.append(Opcode.DROPR)
-
-    # конец программы
-    code.append(Opcode.HLT)
-
-    # прибавить к адресу длину кода инструкций, тк переменные хранятся после инструкций
-    for name in _vars:
-        variables[name] += len(code)
-    return variables, code, data, start
+from lisp.image_cache import CACHE_SIZE, ImageCache, cache_key
+from lisp.inliner import INLINE_BUDGET, inline
+from lisp.optimizer import optimize as peephole
+from lisp.parser import Expr, Node, Number, String, Symbol, is_symbol, parse
+
+
+# арифметика и логика: аргументы на стеке, затем операция
+ALU_FORMS = {
+    "+": Opcode.ADD,
+    "-": Opcode.SUB,
+    "%": Opcode.MOD,
+    "=": Opcode.EQ,
+    "or": Opcode.OR,
+}
+
+KEYWORDS = ("do", "then", "else")
+
+# "слово - мнемоника" для листинга
+OPCODE_MNEMONICS = {opcode: f"{opcode.value:08X} - {opcode}" for opcode in Opcode}
+
+
+# Генерация последовательности токенов кода по AST: опкоды, числа и имена
+# переменных/меток, которые заменяются адресами в translate_stage_2
+class CodeGenerator:
+    variables: dict = None  # адреса на которые можно ссылаться
+    functions: list = None  # имена пользовательских функций
+    harts: list = None  # имена точек входа дополнительных ядер
+    handlers: list = None  # имена обработчиков прерываний
+    data_names: list = None  # переменные в секции данных
+    bss_names: list = None  # буферы в обнулённой секции (BSS)
+
+    start: int = None  # адрес начала программы
+
+    code: list = None  # токены кода
+    data: list = None  # токены данных + для input/output
+    bss_size: int = None  # длина BSS, в образ не записывается
+
+    if_counter: int = None
+    while_counter: int = None
+
+    # строки исходника для кода: [адрес первого токена, строка] по возрастанию
+    lines: list = None
+    line: int = None
+
+    # обработчики встроенных форм по имени
+    forms: dict = None
+
+    def __init__(self):
+        self.variables = {}
+        self.functions = []
+        self.harts = []
+        self.handlers = []
+        self.data_names = []
+        self.bss_names = []
+        self.start = 0
+        self.code = []
+        self.data = [0, 0]
+        self.bss_size = 0
+        self.if_counter = 0
+        self.while_counter = 0
+        self.lines = []
+        self.line = None
+        self.forms = {
+            "alloc_num": self.alloc_num,
+            "alloc_str": self.alloc_str,
+            "alloc_buf": self.alloc_buf,
+            "def_func": self.def_func,
+            "def_hart": self.def_hart,
+            "def_isr": self.def_isr,
+            "enable_interrupts": self.enable_interrupts,
+            "disable_interrupts": self.disable_interrupts,
+            "while": self.while_loop,
+            "if": self.if_then_else,
+            "input": self.input,
+            "output": self.output,
+            "get_val": self.get_val,
+            "get_by_addr": self.get_by_addr,
+            "set": self.set,
+            "xadd": self.xadd,
+            "read_buf": self.read_buf,
+            "write_str": self.write_str,
+        }
+
+    def generate(self, program: list):
+        for node in program:
+            self.emit(node)
+
+        # конец программы
+        self.code.append(Opcode.HLT)
+
+        # прибавить к адресу длину кода инструкций, тк переменные хранятся после инструкций
+        for name in self.data_names:
+            self.variables[name] += len(self.code)
+        # BSS - после данных
+        for name in self.bss_names:
+            self.variables[name] += len(self.code) + len(self.data)
+
+    def emit(self, node: Node):
+        outer = self.line
+        self.mark(node.line)
+        if isinstance(node, Expr):
+            self.emit_expr(node)
+        elif isinstance(node, Number):
+            self.code.append(Opcode.PUSH)
+            self.code.append(node.value)
+        elif isinstance(node, Symbol):
+            self.emit_symbol(node)
+        else:
+            raise SyntaxError(f"{node.position()}: unexpected {node!r}")
+        # дальше - снова код внешнего выражения, после верхнего уровня
+        # строка не меняется до следующего узла
+        if outer is None:
+            self.line = None
+        else:
+            self.mark(outer)
+
+    # следующие токены кода порождены строкой line
+    def mark(self, line: int):
+        if line is None or line == self.line:
+            return
+        self.line = line
+        if self.lines and self.lines[-1][0] == len(self.code):
+            self.lines.pop()
+        if self.lines and self.lines[-1][1] == line:
+            return
+        self.lines.append([len(self.code), line])
+
+    def emit_symbol(self, node: Symbol):
+        name = node.name
+        assert name not in KEYWORDS, f"{node.position()}: unexpected {name}"
+        # обращение к параметру функции
+        if name.startswith("$"):
+            assert name == "$1", f"{node.position()}: Sorry, only one argument: {name}"
+            self.code.append(Opcode.PEEK)
+            self.code.append(1)
+        # загрузка параметра функции в стек возврата
+        elif name.startswith("@"):
+            self.code.append(Opcode.PUSHR)
+            self.code.append(name[1:])
+        else:
+            self.code.append(Opcode.PUSH)
+            self.code.append(name)
+
+    def emit_expr(self, node: Expr):
+        head = node.head
+        assert head is not None, f"{node.position()}: expected function name"
+        if head in self.forms:
+            self.forms[head](node)
+            return
+
+        # аргументы уже в стеке
+        for arg in node.args:
+            self.emit(arg)
+        if head in ALU_FORMS:
+            self.code.append(ALU_FORMS[head])
+        # вызов пользовательской функции
+        else:
+            assert head in self.functions, (
+                f"{node.position()}: Function is not defined: {head}"
+            )
+            self.code.append(Opcode.CALL)
+            self.code.append(self.variables[head])
+            self.code.append(Opcode.DROPR)
+
+    def declaration(self, node: Expr, kind: type, bss: bool = False):
+        assert len(node.args) == 2, (
+            f"{node.position()}: expected ({node.head} name value)"
+        )
+        name, value = node.args
+        assert isinstance(name, Symbol), f"{name.position()}: expected name"
+        assert isinstance(value, kind), f"{value.position()}: unexpected {value!r}"
+        if bss:
+            self.variables[name.name] = self.bss_size
+            self.bss_names.append(name.name)
+        else:
+            self.variables[name.name] = len(self.data)
+            self.data_names.append(name.name)
+        return value.value
+
+    # выделение памяти под число
+    def alloc_num(self, node: Expr):
+        self.data.append(self.declaration(node, Number))
+
+    # выделение памяти под строку: длина, затем по символу в слове
+    def alloc_str(self, node: Expr):
+        value = self.declaration(node, String)
+        self.data.append(len(value))
+        self.data.extend(map(ord, value))
+
+    # выделение памяти под буфер: в BSS, в образе только общая длина
+    def alloc_buf(self, node: Expr):
+        size = self.declaration(node, Number, bss=True)
+        assert size >= 0, f"{node.position()}: negative buffer size"
+        self.bss_size += size
+
+    # объявление функции, выйти из функции и дропнуть параметр
+    def def_func(self, node: Expr):
+        assert node.args and isinstance(node.args[0], Symbol), (
+            f"{node.position()}: expected function name"
+        )
+        name = node.args[0].name
+        self.variables[name] = len(self.code)
+        self.functions.append(name)
+        for item in node.args[1:]:
+            self.emit(item)
+        self.code.append(Opcode.RET)
+        self.start = len(self.code)
+
+    # код, в который не попадают из программы: вход - по имени из таблицы
+    # символов, выход - last
+    def entry_point(self, node: Expr, names: list, last: Opcode):
+        assert node.args and isinstance(node.args[0], Symbol), (
+            f"{node.position()}: expected {node.head} name"
+        )
+        name = node.args[0].name
+        self.variables[name] = len(self.code)
+        names.append(name)
+        for item in node.args[1:]:
+            self.emit(item)
+        self.code.append(last)
+        self.start = len(self.code)
+
+    # точка входа ядра: тело исполняется отдельным ядром до своего HLT
+    def def_hart(self, node: Expr):
+        self.entry_point(node, self.harts, Opcode.HLT)
+
+    # обработчик прерывания ввода: стек данных оставляет, каким получил
+    def def_isr(self, node: Expr):
+        self.entry_point(node, self.handlers, Opcode.IRET)
+
+    def enable_interrupts(self, node: Expr):
+        assert not node.args, f"{node.position()}: unexpected arguments"
+        self.code.append(Opcode.EI)
+
+    def disable_interrupts(self, node: Expr):
+        assert not node.args, f"{node.position()}: unexpected arguments"
+        self.code.append(Opcode.DI)
+
+    # (while cond do actions): прыжок за цикл по JZ и к началу по JMP
+    def while_loop(self, node: Expr):
+        loop = len(self.code)
+        after = None
+        for item in node.args:
+            if is_symbol(item, "do"):
+                assert after is None, f"{item.position()}: unexpected do"
+                after = f"while_after{self.while_counter}"
+                self.while_counter += 1
+                self.code.append(Opcode.JZ)
+                self.code.append(after)
+            else:
+                self.emit(item)
+        assert after is not None, f"{node.position()}: while without do"
+        self.code.append(Opcode.JMP)
+        self.code.append(loop)
+        self.variables[after] = len(self.code)
+
+    # (if cond then actions [else actions])
+    def if_then_else(self, node: Expr):
+        from_then = f"if_from_then{self.if_counter}"
+        to_else = f"if_to_else{self.if_counter}"
+        self.if_counter += 1
+        for item in node.args:
+            if is_symbol(item, "then"):
+                self.code.append(Opcode.JZ)
+                self.code.append(to_else)
+            elif is_symbol(item, "else"):
+                assert to_else not in self.variables, (
+                    f"{item.position()}: unexpected else"
+                )
+                self.code.append(Opcode.JMP)
+                self.code.append(from_then)
+                self.variables[to_else] = len(self.code)
+            else:
+                self.emit(item)
+        self.variables.setdefault(to_else, len(self.code))
+        self.variables[from_then] = len(self.code)
+
+    # memory-mapped input заменяется обращением к памяти
+    def input(self, node: Expr):
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.PUSH)
+        self.code.append(MAP_INPUT_ADDRESS)
+        self.code.append(Opcode.GET_VAL)
+        self.code.append(Opcode.STORE_VAL)
+
+    # memory-mapped output заменяется обращением к памяти
+    def output(self, node: Expr):
+        self.code.append(Opcode.PUSH)
+        self.code.append(MAP_OUTPUT_ADDRESS)
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.STORE_VAL)
+
+    def get_val(self, node: Expr):
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.GET_VAL)
+
+    def get_by_addr(self, node: Expr):
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.GET_VAL)
+        self.code.append(Opcode.GET_VAL)
+
+    def set(self, node: Expr):
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.STORE_VAL)
+
+    # (xadd addr n): атомарно прибавить n к слову, результат - старое значение
+    def xadd(self, node: Expr):
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.XADD)
+
+    # (read_buf name n): до n символов ввода в буфер name (длина - в первом
+    # слове) одной инструкцией
+    def read_buf(self, node: Expr):
+        assert len(node.args) == 2, f"{node.position()}: expected (read_buf name n)"
+        for arg in node.args:
+            self.emit(arg)
+        self.code.append(Opcode.READ_BUF)
+
+    # (write_str name): вывод строки name одной инструкцией
+    def write_str(self, node: Expr):
+        assert len(node.args) == 1, f"{node.position()}: expected (write_str name)"
+        self.emit(node.args[0])
+        self.code.append(Opcode.WRITE_STR)
+
+
+# превратить AST в последовательность токенов
+def translate_stage_1(program: list):
+    generator = CodeGenerator()
+    generator.generate(program)
+    return (
+        generator.variables,
+        generator.code,
+        generator.data,
+        generator.start,
+        generator.functions,
+        generator.harts,
+        generator.handlers,
+        generator.bss_size,
+        generator.lines,
+    )
 
 
 def translate_stage_2(variables: dict, tokens: list):
@@ -196,7 +366,7 @@ def translate_stage_2(variables: dict, tokens: list):
     mnemonics = []
     for ind, token in enumerate(tokens):
         if isinstance(token, Opcode):
-            mnemonics.append(f"{ind:02X} - {token.value:08X} - {token}")
+            mnemonics.append(f"{ind:02X} - {OPCODE_MNEMONICS[token]}")
             code.append(token.value)
         elif isinstance(token, int):
             assert MIN_SIGN <= token <= MAX_SIGN, f"{BITS}-bit numbers only {token}"
@@ -215,33 +385,154 @@ def translate_stage_2(variables: dict, tokens: list):
     return code, mnemonics
 
 
-def translate(text: str):
-    variables, code, data, start = translate_stage_1(text)
+# таблица символов: функции, переменные и метки с их адресами, строки кода
+def make_symbols(
+    variables: dict,
+    functions: list,
+    code_size: int,
+    start: int,
+    lines: list,
+    harts: list = (),
+    handlers: list = (),
+) -> dict:
+    symbols = {
+        "start": start,
+        "functions": {},
+        "harts": {},
+        "handlers": {},
+        "variables": {},
+        "labels": {},
+        "lines": lines,
+    }
+    for name, addr in variables.items():
+        if name in functions:
+            symbols["functions"][name] = addr
+        elif name in harts:
+            symbols["harts"][name] = addr
+        elif name in handlers:
+            symbols["handlers"][name] = addr
+        elif addr >= code_size:
+            symbols["variables"][name] = addr
+        else:
+            symbols["labels"][name] = addr
+    return symbols
+
+
+def translate(
+    text: str,
+    optimize: bool = False,
+    inline_size: int = 0,
+    inline_budget: int = INLINE_BUDGET,
+):
+    program = parse(text)
+    if inline_size > 0:
+        program = inline(program, inline_size, inline_budget)
+    variables, code, data, start, functions, harts, handlers, bss_size, lines = (
+        translate_stage_1(program)
+    )
     # print(variables, code, data, start)
+    if optimize:
+        variables, code, start, lines = peephole(variables, code, start, lines)
     code, mnemonics = translate_stage_2(variables, code)
+    symbols = make_symbols(
+        variables, functions, len(code), start, lines, harts, handlers
+    )
+
+    return Image(start, code, data, bss_size, symbols), mnemonics
+
 
-    return [start] + code + data, mnemonics
+# модули, от которых зависит результат трансляции: транслятор, разбор,
+# подстановка, оптимизатор, формат образа, кодирование инструкций и
+# арифметика слов (свёртка констант)
+TRANSLATION_MODULES = (
+    translate.__module__,
+    "lisp.parser",
+    "lisp.inliner",
+    "lisp.optimizer",
+    "machine.image",
+    "machine.isa",
+    "machine.datapath",
+)
 
 
-def main(source: str, target: str, target_mnem: str = None):
+# версия для ключа кеша: хеш исходников транслятора и его модулей
+@functools.cache
+def translator_version() -> str:
+    digest = hashlib.sha256()
+    for name in TRANSLATION_MODULES:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def translation_key(
+    text: str,
+    optimize: bool = False,
+    inline_size: int = 0,
+    inline_budget: int = INLINE_BUDGET,
+) -> str:
+    options = {"optimize": optimize, "inline": inline_size, "budget": inline_budget}
+    return cache_key(text, translator_version(), options)
+
+
+# трансляция через кеш: неизменённая программа с теми же опциями не
+# транслируется повторно
+def translate_cached(
+    text: str,
+    cache: ImageCache = None,
+    optimize: bool = False,
+    inline_size: int = 0,
+    inline_budget: int = INLINE_BUDGET,
+):
+    if cache is None:
+        return translate(text, optimize, inline_size, inline_budget)
+    key = translation_key(text, optimize, inline_size, inline_budget)
+    entry = cache.get(key)
+    if entry is None:
+        entry = translate(text, optimize, inline_size, inline_budget)
+        cache.put(key, *entry)
+    return entry
+
+
+def main(
+    source: str,
+    target: str,
+    target_mnem: str = None,
+    target_sym: str = None,
+    optimize: bool = False,
+    inline_size: int = 0,
+    inline_budget: int = INLINE_BUDGET,
+    cache: ImageCache = None,
+    strip: bool = False,
+):
     with open(source, "r") as f:
         text = f.read()
 
-    code, mnemonics = translate(text)
+    image, mnemonics = translate_cached(
+        text, cache, optimize, inline_size, inline_budget
+    )
+    symbols = image.symbols
 
     if target_mnem is not None:
         with open(target_mnem, "w") as f:
             for line in mnemonics:
                 f.write(line + "\n")
 
-    write_code(target, code)
+    if target_sym is not None:
+        with open(target_sym, "w") as f:
+            json.dump(symbols, f, indent=2)
+
+    if strip:
+        image.symbols = None
+    write_image(target, image)
+    words = len(image.words())
     print(
         "LoC:",
         len(text.split("\n")),
         "Instr:",
-        len(code),
+        words,
         "Code bytes:",
-        len(code) * BITS // 8,
+        words * BITS // 8,
     )
 
 
@@ -249,9 +540,55 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Трансляция кода")
     parser.add_argument("source_file", help="Имя файла с кодом")
     parser.add_argument("target_file", help="Имя выходного файла")
-
+    parser.add_argument(
+        "-O",
+        dest="optimize",
+        action="store_true",
+        help="Свёртка констант, удаление пустых переходов и совмещённые инструкции",
+    )
+    parser.add_argument(
+        "--inline",
+        type=int,
+        default=0,
+        help="Подставлять тела функций не больше N узлов AST (0 - не подставлять)",
+    )
+    parser.add_argument(
+        "--inline_budget",
+        type=int,
+        default=INLINE_BUDGET,
+        help=f"Допустимый рост программы от подстановок в узлах AST (по умолчанию {INLINE_BUDGET})",
+    )
+    parser.add_argument(
+        "--strip",
+        action="store_true",
+        help="Не включать таблицу символов в образ, записать её в <target_file>.sym",
+    )
+    parser.add_argument(
+        "--cache", help="Каталог кеша трансляции (по умолчанию без кеша)"
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"Размер кеша трансляции в байтах (по умолчанию {CACHE_SIZE})",
+    )
     args = parser.parse_args()
 
-    MNEMONIC_FILE = args.target_file + ".mnem"
+    cache = None
+    if args.cache is not None:
+        cache = ImageCache(args.cache, args.cache_size)
 
-    main(args.source_file, args.target_file, MNEMONIC_FILE)
+    MNEMONIC_FILE = args.target_file + ".mnem"
+    SYMBOL_FILE = args.target_file + ".sym" if args.strip else None
+
+    main(
+        args.source_file,
+        args.target_file,
+        MNEMONIC_FILE,
+        SYMBOL_FILE,
+        args.optimize,
+        args.inline,
+        args.inline_budget,
+        cache,
+        args.strip,
+    )